@@ -2,35 +2,195 @@
 import re
 import json
 import asyncio
-from typing import List, Dict, Any, Optional
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
-from gigachat import GigaChat
+import logging
+import threading
+import numpy as np
+from typing import TYPE_CHECKING, AsyncIterator, List, Dict, Any, Optional
+
+from executors import ExecutionLayer
+from embedding_cache import EmbeddingCache
+from plan_cache import PlanCache, normalize_query
+from rule_planner import rule_based_plan, normalize_city
+from skill_index import SkillIndex
+from metadata_schema import MetadataSchema
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from retrieval_backend import RetrievalBackend, SKILLS_FIELD, as_backend
+from result_cache import ResultCache, plan_key
+from reranker import Reranker
+from context_builder import ContextBuilder
+from observability import METRICS, fields
+
+if TYPE_CHECKING:
+    from encoders import SentenceEncoder
+
+logger = logging.getLogger(__name__)
+
+# Наборы кандидатов по навыкам до этого размера передаются в where через $in,
+# более крупные пересекаются с выдачей после поиска
+SKILL_FILTER_MAX_IDS = 2000
+# Гибридный поиск: глубина выдачи BM25 на один запрос и константа k в reciprocal rank fusion
+HYBRID_LEXICAL_DEPTH = 50
+RRF_K = 60
+# Поиск по чанкам: сколько чанков запрашивать на одно нужное резюме и способ агрегации их оценок
+CHUNK_FANOUT = 4
+CHUNK_AGGREGATIONS = ("max", "sum")
 
 class AgenticRAGHandler:
     """Агент для интеллектуального поиска резюме с итеративным уточнением."""
     
-    def __init__(self, model: SentenceTransformer, collection, giga_chat):
+    def __init__(self, model: "SentenceEncoder", backend, giga_chat,
+                 executor: Optional[ExecutionLayer] = None,
+                 query_cache: Optional[EmbeddingCache] = None,
+                 plan_cache: Optional[PlanCache] = None,
+                 use_rule_planner: bool = True,
+                 skill_index: Optional[SkillIndex] = None,
+                 metadata_schema: Optional[MetadataSchema] = None,
+                 bm25_index: Optional[BM25Index] = None,
+                 chunk_backend: Optional[RetrievalBackend] = None,
+                 chunk_aggregation: str = "max",
+                 result_cache: Optional[ResultCache] = None,
+                 llm_semaphore: Optional[asyncio.Semaphore] = None,
+                 reranker: Optional[Reranker] = None,
+                 context_builder: Optional[ContextBuilder] = None):
         self.model = model
-        self.collection = collection
+        # Хранилище резюме: коллекция ChromaDB (оборачивается в ChromaBackend) или NumpyBackend
+        self.backend: RetrievalBackend = as_backend(backend)
         self.giga_chat = giga_chat
         self.max_retries = 3
+        # Блокирующие вызовы GigaChat, энкодера и Chroma выполняются в отдельных пулах потоков,
+        # чтобы один долгий запрос не останавливал обработку остальных чатов
+        self.executor = executor or ExecutionLayer.from_env()
+        # Персистентный LRU-кэш эмбеддингов частых запросов (например, кнопок клавиатуры)
+        self.query_cache = query_cache
+        # Кэш распарсенных планов GigaChat: повторный запрос не требует вызова LLM
+        self.plan_cache = plan_cache
+        # Простые запросы («<навык> в <городе> от N лет») разбираются правилами без LLM
+        self.use_rule_planner = use_rule_planner
+        self.plan_sources = {"rules": 0, "cache": 0, "llm": 0}
+        # Инвертированный индекс навык → резюме из build_vector_store.py
+        self.skill_index = skill_index
+        # Схема фильтруемых метаданных (build_vector_store.py --structured-metadata)
+        self.metadata_schema = metadata_schema
+        # Лексический индекс BM25: если задан, поиск гибридный (векторный + BM25 с RRF)
+        self.bm25_index = bm25_index
+        # Хранилище чанков резюме: векторный поиск идёт по разделам, оценки агрегируются по резюме,
+        # а в контекст LLM попадает документ резюме, как и без чанков
+        self.chunk_backend = as_backend(chunk_backend) if chunk_backend is not None else None
+        if chunk_aggregation not in CHUNK_AGGREGATIONS:
+            raise ValueError(f"Неизвестная агрегация чанков: {chunk_aggregation}")
+        self.chunk_aggregation = chunk_aggregation
+        # Кэш результатов по плану: повтор запроса не требует ни поиска, ни анализа GigaChat
+        self.result_cache = result_cache
+        # Общий для всех запросов лимит одновременных вызовов GigaChat (RequestScheduler)
+        self.llm_semaphore = llm_semaphore
+        # Переранжирование на CPU: в анализ GigaChat попадают лучшие top_k кандидатов из выдачи
+        self.reranker = reranker
+        # Контекст анализа в пределах бюджета токенов; без него — фиксированные срезы текста
+        self.context_builder = context_builder
+    
+    def replace_stores(self, backend, chunk_backend: Optional[RetrievalBackend] = None):
+        """Подменяет хранилища после пересборки; запросы в работе дочитывают прежние."""
+        self.backend = as_backend(backend)
+        self.chunk_backend = as_backend(chunk_backend) if chunk_backend is not None else None
+
+    def replace_indexes(self, skill_index=None, metadata_schema=None, bm25_index=None):
+        """Подменяет индекс навыков, схему метаданных и BM25 той же сборки, что и хранилища."""
+        self.skill_index = skill_index
+        self.metadata_schema = metadata_schema
+        self.bm25_index = bm25_index
         
-    async def _call_llm_with_retry(self, prompt: str, system_prompt: str = None) -> str:
-        """Вызов LLM с повторными попытками."""
+    async def _call_llm_with_retry(self, prompt: str, system_prompt: str = None, stage: str = "llm") -> str:
+        """Вызов LLM с повторными попытками; stage — имя этапа в метриках."""
         full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
         
         for attempt in range(self.max_retries):
             try:
-                response = self.giga_chat.chat(full_prompt)
+                if self.llm_semaphore is not None:
+                    async with self.llm_semaphore:
+                        with METRICS.span(stage):
+                            response = await self.executor.run("llm", self.giga_chat.chat, full_prompt)
+                else:
+                    with METRICS.span(stage):
+                        response = await self.executor.run("llm", self.giga_chat.chat, full_prompt)
                 return response.choices[0].message.content.strip()
             except Exception as e:
-                if attempt < self.max_retries - 1:
-                    print(f"⚠️ Ошибка LLM, попытка {attempt+1}/{self.max_retries}: {e}")
-                    await asyncio.sleep(1)
-                else:
-                    raise Exception(f"❌ Все попытки вызова LLM провалились: {e}")
+                self._on_llm_error(e, attempt, stage)
+                await asyncio.sleep(1)
+    
+    def _on_llm_error(self, error: Exception, attempt: int, stage: str):
+        """Учитывает неудачную попытку вызова LLM; после последней бросает исключение."""
+        if attempt < self.max_retries - 1:
+            METRICS.inc("llm_retries_total", stage=stage)
+            logger.warning("Ошибка LLM, повтор", extra=fields(stage=stage, attempt=attempt + 1,
+                                                              max_retries=self.max_retries, error=str(error)))
+            return
+        METRICS.inc("llm_failures_total", stage=stage)
+        raise Exception(f"❌ Все попытки вызова LLM провалились: {error}")
+    
+    async def _stream_llm_with_retry(self, prompt: str, system_prompt: str = None,
+                                     stage: str = "llm") -> AsyncIterator[str]:
+        """Потоковый вызов LLM: фрагменты ответа GigaChat по мере генерации.
+        
+        Блокирующий итератор giga_chat.stream читается в пуле "llm", фрагменты передаются
+        в event loop через очередь. Слот llm_semaphore занят только на время генерации
+        и не удерживается, пока получатель обрабатывает фрагмент; закрытый получателем
+        генератор останавливает чтение потока. Повтор возможен, только пока не отдано
+        ни одного фрагмента; клиент без stream получает ответ одним фрагментом.
+        """
+        if not hasattr(self.giga_chat, "stream"):
+            yield await self._call_llm_with_retry(prompt, system_prompt, stage)
+            return
+        
+        full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
+        loop = asyncio.get_running_loop()
+        done = object()
+        
+        for attempt in range(self.max_retries):
+            queue = asyncio.Queue()
+            closed = threading.Event()
+            
+            def produce():
+                try:
+                    if closed.is_set():
+                        return
+                    # Этап замеряется в потоке генерации: время обработки фрагментов получателем в него не входит
+                    with METRICS.span(stage):
+                        for chunk in self.giga_chat.stream(full_prompt):
+                            if closed.is_set():
+                                break
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                loop.call_soon_threadsafe(queue.put_nowait, chunk.choices[0].delta.content)
+                finally:
+                    loop.call_soon_threadsafe(queue.put_nowait, done)
+            
+            async def generate():
+                if self.llm_semaphore is None:
+                    return await self.executor.run("llm", produce)
+                async with self.llm_semaphore:
+                    return await self.executor.run("llm", produce)
+            
+            started = False
+            producer = asyncio.ensure_future(generate())
+            try:
+                while True:
+                    delta = await queue.get()
+                    if delta is done:
+                        break
+                    started = True
+                    yield delta
+                await producer
+                return
+            except Exception as e:
+                if started:
+                    METRICS.inc("llm_failures_total", stage=stage)
+                    raise
+                self._on_llm_error(e, attempt, stage)
+                await asyncio.sleep(1)
+            finally:
+                # Генератор закрыт до конца ответа: поток дочитывает один фрагмент и освобождает слот
+                closed.set()
+                if not producer.done():
+                    producer.add_done_callback(lambda task: task.cancelled() or task.exception())
     
     def _parse_agent_response(self, response: str) -> dict:
         """Парсинг структурированного ответа агента с обработкой невалидного JSON."""
@@ -64,7 +224,7 @@ class AgenticRAGHandler:
                 return json.loads(fixed_json)
             except json.JSONDecodeError as e:
                 # Если не удалось, пробуем более агрессивное исправление
-                print(f"⚠️ Первая попытка парсинга не удалась: {e}")
+                logger.warning("Первая попытка парсинга плана не удалась", extra=fields(error=str(e)))
                 
                 # Удаляем все непечатаемые символы кроме пробелов
                 import re
@@ -80,6 +240,7 @@ class AgenticRAGHandler:
                         pass
                 
                 # Возвращаем дефолтную структуру
+                METRICS.inc("plan_parse_fallback_total")
                 return {
                     "thought_process": "Не удалось распарсить ответ агента",
                     "search_queries": ["React разработчик", "Frontend React", "React developer"],
@@ -89,12 +250,13 @@ class AgenticRAGHandler:
                         "required_skills": ["React", "React.js"]
                     },
                     "analysis_instructions": "Найди кандидатов, которые знают React или React.js.",
-                    "requires_refinement": False
+                    "requires_refinement": False,
+                    "is_fallback": True
                 }
                 
         except Exception as e:
-            print(f"❌ Критическая ошибка при парсинге JSON: {e}")
-            print(f"📝 Исходный ответ: {response[:500]}...")
+            METRICS.inc("plan_parse_fallback_total")
+            logger.error("Критическая ошибка при парсинге плана", extra=fields(error=str(e), response=response[:500]))
             
             # Создаем дефолтный ответ для поиска React
             return {
@@ -106,7 +268,8 @@ class AgenticRAGHandler:
                     "required_skills": ["React"]
                 },
                 "analysis_instructions": "Проанализируй найденные резюме на знание React.",
-                "requires_refinement": False
+                "requires_refinement": False,
+                "is_fallback": True
             }
     
     def _build_filters(self, parsed_response: dict) -> dict:
@@ -117,9 +280,13 @@ class AgenticRAGHandler:
         # Фильтр по городу (используем $eq)
         location = parsed_response.get("filters", {}).get("location")
         if location and location.lower() != "null" and location.lower() != "none":
-            city = location.lower()
-            conditions.append({"location": {"$eq": city}})
-            print(f"📍 Фильтр по городу: {city}")
+            city = normalize_city(location) or location.lower()
+            city_code = self.metadata_schema.city_code(city) if self.metadata_schema else 0
+            if city_code:
+                conditions.append({"city_code": {"$eq": city_code}})
+            else:
+                conditions.append({"location": {"$eq": city}})
+            logger.debug("Фильтр по городу", extra=fields(city=city))
         
         # Фильтр по минимальному опыту (используем $gte)
         min_exp = parsed_response.get("filters", {}).get("min_experience_years")
@@ -127,23 +294,15 @@ class AgenticRAGHandler:
             try:
                 min_months = int(min_exp) * 12
                 conditions.append({"total_experience_months": {"$gte": min_months}})
-                print(f"📅 Фильтр по опыту: от {min_exp} лет ({min_months} месяцев)")
+                logger.debug("Фильтр по опыту", extra=fields(min_years=min_exp, min_months=min_months))
             except (ValueError, TypeError):
                 pass
         
-        # ВАЖНО: ChromaDB не поддерживает $contains, поэтому убираем фильтрацию по навыкам
-        # Вместо этого будем искать по эмбеддингам и фильтровать результаты позже
-        required_skills = parsed_response.get("filters", {}).get("required_skills", [])
-        if required_skills and isinstance(required_skills, list):
-            valid_skills = []
-            for skill in required_skills[:3]:
-                if skill and str(skill).lower() not in ["null", "none"]:
-                    valid_skills.append(str(skill).lower())
-            
-            if valid_skills:
-                print(f"🔧 Навыки для поиска (без фильтрации в where): {valid_skills}")
-                # Сохраняем навыки в объекте для последующей фильтрации
-                self._temp_required_skills = valid_skills
+        # ВАЖНО: ChromaDB не поддерживает $contains, поэтому навыки фильтруются отдельно
+        # (см. _build_skill_filter): флагами схемы, индексом навыков или по выдаче
+        valid_skills = self._extract_required_skills(parsed_response)
+        if valid_skills:
+            logger.debug("Навыки для поиска", extra=fields(skills=valid_skills))
         
         # Формируем условия
         if conditions:
@@ -152,105 +311,380 @@ class AgenticRAGHandler:
             else:
                 filters = conditions[0]
         
-        print(f"🔧 Построенные фильтры для ChromaDB: {filters}")
+        logger.info("Фильтры поиска построены", extra=fields(where=json.dumps(filters, ensure_ascii=False)))
         return filters
     
+    def _build_skill_filter(self, required_skills: List[str]) -> Optional[dict]:
+        """Условие where «есть хотя бы один из навыков», которое хранилище проверит само.
+
+        Сначала битовая матрица навыков NumpyBackend, затем флаги схемы метаданных;
+        None, если навыков нет или их не выразить без потери подходящих резюме.
+        """
+        if not required_skills:
+            return None
+        where = self.backend.skill_filter(required_skills)
+        if where is None and self.metadata_schema is not None:
+            where = self.metadata_schema.where_for_skills(required_skills)
+        return where
+    
+    def _extract_required_skills(self, parsed_response: dict) -> List[str]:
+        """Список требуемых навыков из плана агента (не более трёх, в нижнем регистре)."""
+        required_skills = parsed_response.get("filters", {}).get("required_skills", [])
+        valid_skills = []
+        if required_skills and isinstance(required_skills, list):
+            for skill in required_skills[:3]:
+                if skill and str(skill).lower() not in ["null", "none"]:
+                    valid_skills.append(str(skill).lower())
+        return valid_skills
+    
+    async def _encode(self, text):
+        """Эмбеддинги запросов в пуле энкодера."""
+        with METRICS.span("encode"):
+            if self.query_cache is not None:
+                return await self.executor.run("encoder", self.query_cache.encode, self.model, text)
+            return await self.executor.run("encoder", self.model.encode, text)
+    
+    async def _query_backend(self, required_skills: Optional[List[str]] = None, **kwargs) -> dict:
+        """Запрос к хранилищу резюме в пуле "chroma" (он же обслуживает NumpyBackend).
+
+        required_skills нужны поиску по чанкам, чтобы построить условие на навыки для своего хранилища.
+        """
+        with METRICS.span("query"):
+            if self.chunk_backend is not None:
+                return await self._query_chunks(required_skills=required_skills, **kwargs)
+            return await self.executor.run("chroma", self.backend.query, **kwargs)
+    
+    def _chunk_where(self, where: Optional[dict], required_skills: Optional[List[str]]):
+        """Условие where для хранилища чанков и условие на навыки для родительских резюме.
+
+        Позиции навыков в битовой матрице у каждого NumpyBackend свои (по частоте навыка
+        в этом хранилище), поэтому условие $skills основного хранилища заменяется
+        условием хранилища чанков. Если чанки не могут проверить навыки сами, условие
+        снимается с поиска по чанкам и проверяется при чтении родительских резюме.
+        """
+        def split(condition):
+            if isinstance(condition, dict) and SKILLS_FIELD in condition:
+                return None, condition
+            if isinstance(condition, dict) and "$and" in condition:
+                rest, skills = [], None
+                for part in condition["$and"]:
+                    if isinstance(part, dict) and SKILLS_FIELD in part:
+                        skills = part
+                    else:
+                        rest.append(part)
+                if skills is None:
+                    return condition, None
+                return ({"$and": rest} if len(rest) > 1 else (rest[0] if rest else None)), skills
+            return condition, None
+
+        rest, skills_condition = split(where)
+        if skills_condition is None:
+            return where, None
+        chunk_condition = self.chunk_backend.skill_filter(required_skills or [])
+        if chunk_condition is None:
+            return rest, skills_condition
+        return (self._combine_where(rest, chunk_condition) if rest else chunk_condition), None
+    
+    async def _query_chunks(self, query_embeddings, n_results: int, where: Optional[dict] = None,
+                            include: Optional[List[str]] = None,
+                            required_skills: Optional[List[str]] = None) -> dict:
+        """Поиск по чанкам с агрегацией оценок по резюме (max или sum).
+
+        Результат в той же форме, что и выдача по резюме: один документ на резюме,
+        расстояние — 1 минус агрегированное сходство.
+        """
+        where, parent_where = self._chunk_where(where, required_skills)
+        chunks = await self.executor.run(
+            "chroma", self.chunk_backend.query,
+            query_embeddings=query_embeddings,
+            n_results=n_results * CHUNK_FANOUT,
+            where=where,
+            include=["metadatas", "distances"]
+        )
+        per_query = []
+        for metas, distances in zip(chunks["metadatas"], chunks["distances"]):
+            scores = {}
+            for meta, distance in zip(metas, distances):
+                parent_id = meta.get("id", "")
+                similarity = 1 - distance
+                if self.chunk_aggregation == "sum":
+                    scores[parent_id] = scores.get(parent_id, 0.0) + similarity
+                else:
+                    scores[parent_id] = max(scores.get(parent_id, similarity), similarity)
+            ranking = sorted(scores, key=lambda parent_id: -scores[parent_id])
+            # С проверкой навыков у родителей выдача обрезается после неё, иначе — сразу
+            per_query.append((ranking if parent_where else ranking[:n_results], scores))
+        
+        parent_ids = list(dict.fromkeys(parent_id for ranking, _ in per_query for parent_id in ranking))
+        parents = {}
+        if parent_ids:
+            found = await self.executor.run("chroma", self.backend.get, ids=parent_ids, where=parent_where,
+                                            include=["documents", "metadatas"])
+            parents = {meta.get("id", ""): (doc, meta) for doc, meta in zip(found["documents"], found["metadatas"])}
+        
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for ranking, scores in per_query:
+            ranking = [parent_id for parent_id in ranking if parent_id in parents][:n_results]
+            result["ids"].append(ranking)
+            result["documents"].append([parents[parent_id][0] for parent_id in ranking])
+            result["metadatas"].append([parents[parent_id][1] for parent_id in ranking])
+            result["distances"].append([1 - scores[parent_id] for parent_id in ranking])
+        return result
+    
     async def _search_with_refinement(self, 
                                 initial_queries: List[str], 
                                 filters: Dict[str, Any],
-                                max_results: int = 10) -> List[Dict[str, Any]]:
+                                max_results: int = 10,
+                                required_skills: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """Итеративный поиск с уточнением запросов."""
         all_resumes = []
         seen_ids = set()
+        required_skills = required_skills or []
+        include = ["documents", "metadatas"]
         
-        # Получаем список требуемых навыков, если есть
-        required_skills = getattr(self, '_temp_required_skills', [])
+        if isinstance(initial_queries, str):
+            initial_queries = [initial_queries]
+        queries = [str(q) for q in initial_queries if q]
+        if not queries:
+            return []
         
-        # Первый раунд поиска
-        for query in initial_queries:
-            if len(all_resumes) >= max_results:
-                break
-                
-            query_emb = self.model.encode(query).tolist()
-            results = self.collection.query(
-                query_embeddings=[query_emb],
+        # Все запросы кодируем одним батчем и отправляем в ChromaDB одним вызовом
+        query_embs = np.asarray(await self._encode(queries), dtype=np.float32)
+        
+        # Ограничение по навыкам: битовая матрица хранилища или флаги схемы, иначе кандидаты из индекса навыков
+        # (точное совпадение вместо поиска подстроки в all_skills)
+        with METRICS.span("skill_filter"):
+            skill_where = self._build_skill_filter(required_skills)
+            skill_ids = None
+            if skill_where is None and self.skill_index is not None:
+                skill_ids = self.skill_index.candidates(required_skills)
+                if skill_ids is not None and len(skill_ids) <= SKILL_FILTER_MAX_IDS:
+                    # Пустое условие — ни у одного резюме нет нужных навыков
+                    skill_where = {"id": {"$in": sorted(skill_ids)}} if skill_ids else {}
+            
+            # Навыки, которые хранилище не проверит само, проверяются по выдаче
+            if skill_where is not None:
+                accept = None
+            elif skill_ids is not None:
+                # Навык слишком распространён для фильтра $in: пересекаем выдачу с индексом
+                accept = lambda meta: meta.get("id", "") in skill_ids
+            elif required_skills:
+                # Индекса нет: проверяем наличие требуемых навыков в поле all_skills
+                accept = lambda meta: any(skill in meta.get("all_skills", "").lower() for skill in required_skills)
+            else:
+                accept = None
+        
+        if self.bm25_index is not None:
+            # Точные совпадения названий технологий находит BM25, поэтому
+            # ни перебора, ни второго раунда не нужно
+            where = self._combine_where(filters, skill_where) if skill_where else filters
+            all_resumes = await self._hybrid_search(queries, query_embs, where, max_results,
+                                                    allowed_ids=skill_ids if skill_where is None else None,
+                                                    required_skills=required_skills, accept=accept)
+            logger.info("Гибридный поиск завершён", extra=fields(found=len(all_resumes)))
+            return all_resumes
+        
+        hits_per_query = None
+        
+        if skill_where is not None:
+            # Поиск сразу ограничен резюме с нужными навыками: ни перебора, ни постфильтрации
+            if skill_where:
+                results = await self._query_backend(
+                    query_embeddings=query_embs,
+                    n_results=max_results,
+                    where=self._combine_where(filters, skill_where),
+                    include=include,
+                    required_skills=required_skills
+                )
+                self._collect_hits(zip(results["documents"], results["metadatas"]),
+                                   all_resumes, seen_ids, max_results)
+        else:
+            # Выдача первого раунда шире fallback-выдачи, поэтому второй раунд переиспользует её
+            results = await self._query_backend(
+                query_embeddings=query_embs,
                 n_results=min(20, max_results * 3),  # Берем больше, чтобы отфильтровать
                 where=filters if filters else None,
-                include=["documents", "metadatas"]
+                include=include
             )
-            
-            for doc, meta in zip(results["documents"][0], results["metadatas"][0]):
-                resume_id = meta.get("id", "")
-                if resume_id and resume_id not in seen_ids:
-                    # Проверяем наличие требуемых навыков в поле all_skills
-                    all_skills = meta.get("all_skills", "").lower()
-                    
-                    # Если есть требования по навыкам, проверяем их
-                    if required_skills:
-                        has_required_skill = False
-                        for skill in required_skills:
-                            if skill in all_skills:
-                                has_required_skill = True
-                                break
-                        
-                        # Если не нашли нужный навык, пропускаем это резюме
-                        if not has_required_skill:
-                            continue
-                    
-                    seen_ids.add(resume_id)
-                    all_resumes.append({
-                        "id": resume_id,
-                        "url": meta.get("url", "").strip(),
-                        "position": meta.get("desired_position", ""),
-                        "location": meta.get("location", ""),
-                        "experience_months": meta.get("total_experience_months", 0),
-                        "skills": all_skills,
-                        "text": doc
-                    })
-        
-        print(f"🔍 Первый раунд дал {len(all_resumes)} резюме")
+            hits_per_query = list(zip(results["documents"], results["metadatas"]))
+            self._collect_hits(hits_per_query, all_resumes, seen_ids, max_results, accept=accept)
+        
+        logger.info("Первый раунд поиска", extra=fields(found=len(all_resumes)))
         
         # Если нашли достаточно, возвращаем
         if len(all_resumes) >= max_results // 2:
             return all_resumes[:max_results]
         
         # Второй раунд: поиск без фильтров по навыкам
-        print("🔍 Пробую fallback (без фильтрации по навыкам)...")
+        METRICS.inc("search_fallback_total")
+        logger.info("Второй раунд поиска без фильтрации по навыкам")
+        
+        # Ослабляем фильтры: убираем требования по навыкам,
+        # базовые фильтры (город, опыт) остаются в where
+        fallback_depth = min(15, max_results * 2)
+        if hits_per_query is None:
+            results = await self._query_backend(
+                query_embeddings=query_embs,
+                n_results=fallback_depth,
+                where=filters if filters else None,
+                include=include
+            )
+            hits_per_query = list(zip(results["documents"], results["metadatas"]))
+        self._collect_hits(hits_per_query, all_resumes, seen_ids, max_results, depth=fallback_depth)
+        
+        logger.info("Поиск завершён", extra=fields(found=len(all_resumes)))
+        return all_resumes[:max_results]
+    
+    async def _hybrid_search(self, queries: List[str], query_embs, where: Dict[str, Any],
+                             max_results: int, allowed_ids: Optional[set] = None,
+                             required_skills: Optional[List[str]] = None, accept=None) -> List[Dict[str, Any]]:
+        """Векторный поиск и BM25 параллельно, слияние выдач через reciprocal rank fusion.
+
+        accept — проверка навыков по метаданным для кандидатов обеих выдач, если where их не ограничивает.
+        """
+        include = ["documents", "metadatas"]
+        
+        def lexical_search():
+            with METRICS.span("lexical"):
+                return [self.bm25_index.search(q, HYBRID_LEXICAL_DEPTH) for q in queries]
+        
+        dense, lexical = await asyncio.gather(
+            self._query_backend(
+                query_embeddings=query_embs,
+                # С проверкой по выдаче берём больше, чтобы было что отфильтровать
+                n_results=max_results if accept is None else min(20, max_results * 3),
+                where=where if where else None,
+                include=include,
+                required_skills=required_skills
+            ),
+            self.executor.run("lexical", lexical_search)
+        )
+        
+        hits = {}
+        rankings = []
+        for docs, metas in zip(dense["documents"], dense["metadatas"]):
+            ranking = []
+            for doc, meta in zip(docs, metas):
+                resume_id = meta.get("id", "")
+                if resume_id and (accept is None or accept(meta)):
+                    hits[resume_id] = (doc, meta)
+                    ranking.append(resume_id)
+            rankings.append(ranking)
+        
+        # Лексическая выдача не знает о фильтрах: документы и метаданные новых кандидатов
+        # запрашиваем из ChromaDB одним get с тем же where
+        lexical = [[doc_id for doc_id, _ in ranked if allowed_ids is None or doc_id in allowed_ids]
+                   for ranked in lexical]
+        missing = list(dict.fromkeys(doc_id for ranked in lexical for doc_id in ranked if doc_id not in hits))
+        if missing:
+            with METRICS.span("get"):
+                found = await self.executor.run(
+                    "chroma", self.backend.get,
+                    ids=missing, where=where if where else None, include=include
+                )
+            for doc, meta in zip(found["documents"], found["metadatas"]):
+                if accept is None or accept(meta):
+                    hits[meta.get("id", "")] = (doc, meta)
+        rankings.extend([doc_id for doc_id in ranked if doc_id in hits] for ranked in lexical)
         
-        # Ослабляем фильтры: убираем требования по навыкам
-        for query in initial_queries:
+        fused = reciprocal_rank_fusion(rankings, k=RRF_K, limit=max_results)
+        return [self._to_resume(*hits[resume_id]) for resume_id in fused]
+    
+    async def _search_cached(self, queries: List[str], filters: Dict[str, Any], max_results: int,
+                             required_skills: List[str]) -> List[Dict[str, Any]]:
+        """Поиск через кэш результатов: по ключу плана хранятся только id резюме,
+        документы и метаданные читаются из хранилища одним get."""
+        if self.result_cache is None:
+            return await self._search_with_refinement(queries, filters, max_results=max_results,
+                                                      required_skills=required_skills)
+        
+        # Запросы нормализуются так же, как в кэше планов: регистр и пунктуация не меняют выдачу по смыслу
+        key = plan_key("results", [normalize_query(q) for q in queries], filters, required_skills, max_results)
+        cached_ids = self.result_cache.get_results(key)
+        if cached_ids:
+            with METRICS.span("get"):
+                found = await self.executor.run("chroma", self.backend.get, ids=cached_ids,
+                                                include=["documents", "metadatas"])
+            hits = {meta.get("id", ""): (doc, meta) for doc, meta in zip(found["documents"], found["metadatas"])}
+            if all(resume_id in hits for resume_id in cached_ids):
+                return [self._to_resume(*hits[resume_id]) for resume_id in cached_ids]
+        elif cached_ids is not None:
+            return []
+        
+        resumes = await self._search_with_refinement(queries, filters, max_results=max_results,
+                                                     required_skills=required_skills)
+        self.result_cache.put_results(key, [r["id"] for r in resumes])
+        return resumes
+    
+    def _collect_hits(self, hits_per_query, all_resumes: List[Dict[str, Any]], seen_ids: set,
+                      max_results: int, depth: Optional[int] = None, accept=None):
+        """Добавляет в all_resumes новые резюме из выдачи по каждому запросу."""
+        for docs, metas in hits_per_query:
             if len(all_resumes) >= max_results:
                 break
-                
-            query_emb = self.model.encode(query).tolist()
-            results = self.collection.query(
-                query_embeddings=[query_emb],
-                n_results=min(15, max_results * 2),
-                where=filters if filters else None,  # Оставляем только базовые фильтры (город, опыт)
-                include=["documents", "metadatas"]
-            )
             
-            for doc, meta in zip(results["documents"][0], results["metadatas"][0]):
+            for doc, meta in zip(docs[:depth], metas[:depth]):
                 resume_id = meta.get("id", "")
                 if resume_id and resume_id not in seen_ids:
+                    if accept is not None and not accept(meta):
+                        continue
                     seen_ids.add(resume_id)
-                    all_resumes.append({
-                        "id": resume_id,
-                        "url": meta.get("url", "").strip(),
-                        "position": meta.get("desired_position", ""),
-                        "location": meta.get("location", ""),
-                        "experience_months": meta.get("total_experience_months", 0),
-                        "skills": meta.get("all_skills", "").lower(),
-                        "text": doc
-                    })
-        
-        print(f"✅ Итого найдено {len(all_resumes)} резюме")
-        return all_resumes[:max_results]
+                    all_resumes.append(self._to_resume(doc, meta))
     
-    async def process_query(self, user_query: str) -> str:
-        """Основной метод обработки запроса пользователя."""
+    @staticmethod
+    def _combine_where(filters: Dict[str, Any], condition: Dict[str, Any]) -> Dict[str, Any]:
+        """Добавляет условие к фильтру ChromaDB через $and."""
+        if not filters:
+            return condition
+        if "$and" in filters:
+            return {"$and": filters["$and"] + [condition]}
+        return {"$and": [filters, condition]}
+    
+    def _to_resume(self, doc: str, meta: dict) -> Dict[str, Any]:
+        """Карточка резюме из документа и метаданных ChromaDB."""
+        return {
+            "id": meta.get("id", ""),
+            "url": meta.get("url", "").strip(),
+            "position": meta.get("desired_position", ""),
+            "location": meta.get("location", ""),
+            "experience_months": meta.get("total_experience_months", 0),
+            "skills": meta.get("all_skills", "").lower(),
+            "text": doc
+        }
+    
+    @staticmethod
+    def _fixed_context(resumes: List[Dict[str, Any]]) -> str:
+        """Контекст анализа с фиксированными срезами навыков и текста каждого резюме."""
+        context_parts = []
+        for i, r in enumerate(resumes, 1):
+            exp_years = r['experience_months'] // 12
+            skills_preview = r['skills'][:150] + "..." if len(r['skills']) > 150 else r['skills']
+            
+            context_parts.append(f"""
+Резюме #{i}:
+Должность: {r['position']}
+Город: {r['location']}
+Опыт: {exp_years} лет
+Ключевые навыки: {skills_preview}
+Краткое описание: {r['text'][:300]}...
+            """.strip())
         
-        # === Шаг 1: Агент анализирует запрос и планирует поиск ===
+        return "\n\n".join(context_parts)
+    
+    async def _lookup_cached_plan(self, user_query: str):
+        """Ищет план в кэше; возвращает (план или None, эмбеддинг запроса или None)."""
+        if self.plan_cache is None:
+            return None, None
+        query_emb = None
+        if self.plan_cache.uses_embeddings:
+            query_emb = (await self._encode([user_query]))[0]
+        plan = self.plan_cache.get(user_query, query_emb)
+        if plan is not None:
+            logger.info("План поиска взят из кэша")
+        return plan, query_emb
+    
+    async def _plan_with_llm(self, user_query: str) -> dict:
+        """Планирование поиска через GigaChat."""
         planning_prompt = f'''Ты — HR-аналитик, который ищет кандидатов по базе резюме.
 
             Запрос пользователя: "{user_query}"
@@ -288,39 +722,91 @@ class AgenticRAGHandler:
         
         agent_response = await self._call_llm_with_retry(
             planning_prompt,
-            system_prompt="Ты — эксперт по поиску IT-специалистов. Будь конкретен и точен."
+            system_prompt="Ты — эксперт по поиску IT-специалистов. Будь конкретен и точен.",
+            stage="plan_llm"
         )
         
-        parsed_response = self._parse_agent_response(agent_response)
-        print(f"🤖 Агент проанализировал запрос: {parsed_response.get('thought_process', '')}")
+        return self._parse_agent_response(agent_response)
+    
+    async def _plan_query(self, user_query: str) -> dict:
+        """План поиска: локальные правила, затем кэш планов, затем GigaChat."""
+        if self.use_rule_planner:
+            parsed_response = rule_based_plan(user_query)
+            if parsed_response is not None:
+                self.plan_sources["rules"] += 1
+                METRICS.inc("plan_source_total", source="rules")
+                logger.info("План построен локальными правилами")
+                return parsed_response
+        
+        parsed_response, query_emb = await self._lookup_cached_plan(user_query)
+        if parsed_response is not None:
+            self.plan_sources["cache"] += 1
+            METRICS.inc("plan_source_total", source="cache")
+            return parsed_response
+        
+        parsed_response = await self._plan_with_llm(user_query)
+        self.plan_sources["llm"] += 1
+        METRICS.inc("plan_source_total", source="llm")
+        # Дефолтный план при ошибке парсинга не кэшируем
+        if self.plan_cache is not None and not parsed_response.get("is_fallback"):
+            self.plan_cache.put(user_query, parsed_response, query_emb)
+        return parsed_response
+    
+    async def process_query(self, user_query: str) -> str:
+        """Основной метод обработки запроса пользователя."""
+        final_answer = ""
+        events = self.process_query_events(user_query)
+        try:
+            async for event in events:
+                if event["type"] == "final":
+                    final_answer = event["text"]
+        finally:
+            await events.aclose()
+        return final_answer
+    
+    async def process_query_events(self, user_query: str) -> AsyncIterator[Dict[str, Any]]:
+        """Обработка запроса как поток событий конвейера:
+        
+        - {"type": "plan", "plan": dict} — план поиска готов;
+        - {"type": "candidates", "resumes": list} — найдены кандидаты (до анализа LLM);
+        - {"type": "analysis_delta", "text": str} — очередной фрагмент анализа GigaChat;
+        - {"type": "final", "text": str} — итоговый ответ, всегда последнее событие.
+        """
+        
+        # === Шаг 1: Агент анализирует запрос и планирует поиск ===
+        with METRICS.span("plan"):
+            parsed_response = await self._plan_query(user_query)
+        logger.info("План поиска готов", extra=fields(thought=parsed_response.get('thought_process', '')))
+        yield {"type": "plan", "plan": parsed_response}
         
         # === Шаг 2: Выполняем поиск с возможным уточнением ===
         filters = self._build_filters(parsed_response)
-        resumes = await self._search_with_refinement(
-            parsed_response.get("search_queries", [user_query]),
-            filters,
-            max_results=15
-        )
+        search_queries = parsed_response.get("search_queries", [user_query])
+        required_skills = self._extract_required_skills(parsed_response)
+        with METRICS.span("search"):
+            resumes = await self._search_cached(search_queries, filters, 15, required_skills)
         
         if not resumes:
-            return "🔍 По вашему запросу не найдено подходящих резюме."
+            yield {"type": "final", "text": "🔍 По вашему запросу не найдено подходящих резюме."}
+            return
         
-        # === Шаг 3: Готовим контекст для анализа ===
-        context_parts = []
-        for i, r in enumerate(resumes, 1):
-            exp_years = r['experience_months'] // 12
-            skills_preview = r['skills'][:150] + "..." if len(r['skills']) > 150 else r['skills']
-            
-            context_parts.append(f"""
-Резюме #{i}:
-Должность: {r['position']}
-Город: {r['location']}
-Опыт: {exp_years} лет
-Ключевые навыки: {skills_preview}
-Краткое описание: {r['text'][:300]}...
-            """.strip())
+        if self.reranker is not None:
+            found = len(resumes)
+            with METRICS.span("rerank"):
+                resumes = await self.executor.run("encoder", self.reranker.rerank, user_query, parsed_response,
+                                                  resumes, required_skills)
+            logger.info("Переранжирование", extra=fields(candidates_in=found, candidates_out=len(resumes)))
         
-        context = "\n\n".join(context_parts)
+        # === Шаг 3: Готовим контекст для анализа ===
+        if self.context_builder is not None:
+            # Дубликаты и не поместившиеся в бюджет исключаются из resumes,
+            # чтобы номера в ответе LLM совпадали с контекстом
+            with METRICS.span("context"):
+                context, resumes = await self.executor.run("encoder", self.context_builder.build, resumes)
+        else:
+            context = self._fixed_context(resumes)
+        # Кандидаты показываются после построения контекста: это ровно те резюме, что увидит LLM
+        yield {"type": "candidates", "resumes": resumes}
         
         # === Шаг 4: Агент анализирует найденные резюме ===
         analysis_prompt = f"""
@@ -348,10 +834,32 @@ class AgenticRAGHandler:
 [номер]: Должность, Город, Опыт, Ключевые навыки
 """
         
-        analysis = await self._call_llm_with_retry(
-            analysis_prompt,
-            system_prompt="Ты — строгий HR-аналитик. Выбирай только действительно подходящих кандидатов."
-        )
+        # Тот же запрос, план и набор резюме дают тот же анализ: второй уровень кэша
+        # пропускает самый дорогой вызов GigaChat. Текст запроса входит в ключ, потому что
+        # промпт его цитирует: похожий запрос из кэша планов получил бы чужой анализ
+        resume_ids = [r["id"] for r in resumes]
+        answer_key = plan_key("analysis", normalize_query(user_query), [normalize_query(q) for q in search_queries],
+                              filters, required_skills, parsed_response.get("analysis_instructions", ""))
+        analysis = self.result_cache.get_answer(answer_key, resume_ids) if self.result_cache else None
+        if analysis is None:
+            parts = []
+            stream = self._stream_llm_with_retry(
+                analysis_prompt,
+                system_prompt="Ты — строгий HR-аналитик. Выбирай только действительно подходящих кандидатов.",
+                stage="analysis"
+            )
+            try:
+                async for delta in stream:
+                    parts.append(delta)
+                    yield {"type": "analysis_delta", "text": delta}
+            finally:
+                # Получатель мог прервать обработку: поток GigaChat закрывается сразу, а не сборщиком мусора
+                await stream.aclose()
+            analysis = "".join(parts).strip()
+            if self.result_cache is not None:
+                self.result_cache.put_answer(answer_key, resume_ids, analysis)
+        else:
+            yield {"type": "analysis_delta", "text": analysis}
         
         # === Шаг 5: Извлекаем номера подходящих резюме ===
         relevant_indices = []
@@ -391,4 +899,4 @@ class AgenticRAGHandler:
         else:
             final_answer += "ℹ️ **Рекомендация:** Агент не нашёл подходящих кандидатов. Попробуйте изменить критерии поиска."
         
-        return final_answer
\ No newline at end of file
+        yield {"type": "final", "text": final_answer}
\ No newline at end of file
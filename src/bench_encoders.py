@@ -0,0 +1,74 @@
+# bench_encoders.py
+import time
+import argparse
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from encoders import MODEL_NAME, ENCODER_BACKENDS, SentenceEncoder
+from bench_tech_keywords import load_texts
+
+SAMPLE_QUERIES = [
+    "Найди React-разработчиков в Москве",
+    "Python backend с опытом от 3 лет",
+    "DevOps инженер Kubernetes",
+    "Аналитик данных SQL Power BI",
+    "Java Spring разработчик из Санкт-Петербурга",
+]
+
+
+def percentile_ms(timings: list, p: float) -> float:
+    return float(np.percentile(timings, p) * 1000)
+
+
+def bench(name: str, encode, texts: list, queries: list, repeat: int, baseline=None):
+    encode(texts[:8])  # Прогрев: загрузка весов и первых ядер не входит в замер
+    start = time.perf_counter()
+    vectors = encode(texts)
+    elapsed = time.perf_counter() - start
+
+    timings = []
+    for _ in range(repeat):
+        for query in queries:
+            t = time.perf_counter()
+            encode(query)
+            timings.append(time.perf_counter() - t)
+
+    line = (f"⏱ {name:>12}: {len(texts) / elapsed:7.1f} док/с, запрос p50 {percentile_ms(timings, 50):.1f} мс, "
+            f"p95 {percentile_ms(timings, 95):.1f} мс")
+    if baseline is not None:
+        # Насколько эмбеддинги совпадают с текущим путём (косинус по строкам)
+        a = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        b = baseline / np.linalg.norm(baseline, axis=1, keepdims=True)
+        line += f", косинус к текущему: мин {np.min(np.sum(a * b, axis=1)):.4f}"
+    print(line)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение бэкендов энкодера на CPU")
+    parser.add_argument("--limit", type=int, default=500, help="Сколько документов взять из documents.jsonl")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов набора запросов для латентности")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--backends", nargs="+", choices=ENCODER_BACKENDS, default=list(ENCODER_BACKENDS))
+    args = parser.parse_args()
+
+    texts = load_texts(args.limit)
+    print(f"📄 Документов: {len(texts)}, средняя длина {sum(len(t) for t in texts) / len(texts):.0f} символов")
+
+    # Текущий путь: SentenceTransformer.encode(batch_size=32) без сортировки по длине на нашей стороне
+    model = SentenceTransformer(MODEL_NAME, device="cpu")
+    baseline = bench("current", lambda x: model.encode(x, batch_size=32), texts, SAMPLE_QUERIES, args.repeat)
+
+    for backend in args.backends:
+        try:
+            encoder = SentenceEncoder(MODEL_NAME, backend=backend, batch_size=args.batch_size, threads=args.threads)
+        except ImportError as e:
+            print(f"⚠️ {backend}: пропущен ({e})")
+            continue
+        bench(backend, encoder.encode, texts, SAMPLE_QUERIES, args.repeat, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench_tech_keywords.py
+import json
+import os
+import timeit
+import argparse
+
+from prepare_documents import TECH_SYNONYMS, TechMatcher
+
+DOCUMENTS_PATH = "./data/processed/documents.jsonl"
+
+SAMPLE_TEXTS = [
+    "Разработка SPA на React.js и Redux, миграция с jQuery, настройка Webpack, покрытие тестами. "
+    "Работа с REST API и GraphQL, интеграция с Google Analytics.",
+    "Backend на Python (Django, FastAPI), PostgreSQL, Redis, Docker, Kubernetes, CI в GitLab. "
+    "Участвовал в проектах по машинному обучению, data science и ML-пайплайнам.",
+    "Fullstack: Node.js, TypeScript, Vue.js/Nuxt, MongoDB, AWS. Руководил командой из 5 человек, "
+    "проводил код-ревью, внедрял best practices и писал документацию.",
+]
+
+
+def extract_tech_keywords_legacy(text: str, synonyms: dict = TECH_SYNONYMS) -> list:
+    """Прежняя реализация: проход по тексту для каждого синонима через `in`."""
+    if not text:
+        return []
+    text_lower = text.lower()
+    found_tech = set()
+    for tech, patterns in synonyms.items():
+        for pattern in patterns:
+            if pattern in text_lower:
+                found_tech.add(tech.title())
+                break
+    return list(found_tech)
+
+
+def load_texts(limit: int) -> list:
+    """Тексты документов из documents.jsonl, если он есть, иначе встроенные примеры."""
+    if not os.path.exists(DOCUMENTS_PATH):
+        return SAMPLE_TEXTS
+    texts = []
+    with open(DOCUMENTS_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            texts.append(json.loads(line)["text"])
+            if len(texts) >= limit:
+                break
+    return texts
+
+
+def scaled_synonyms(factor: int) -> dict:
+    """Словарь, увеличенный в factor раз вымышленными технологиями, — для оценки масштабирования."""
+    synonyms = dict(TECH_SYNONYMS)
+    for i in range(1, factor):
+        for tech, patterns in TECH_SYNONYMS.items():
+            synonyms[f"{tech}{i}"] = [f"{p}{i}x" for p in patterns]
+    return synonyms
+
+
+def compare(texts: list, synonyms: dict, repeat: int):
+    matcher = TechMatcher(synonyms)
+    timings = {}
+    for name, fn in [("legacy", lambda t: extract_tech_keywords_legacy(t, synonyms)), ("compiled", matcher.find)]:
+        runs = timeit.repeat(lambda: [fn(t) for t in texts], number=1, repeat=repeat)
+        timings[name] = min(runs)
+        print(f"⏱ {name:>8}: {timings[name] * 1000:.2f} мс ({len(texts) / timings[name]:.0f} текстов/с)")
+    print(f"🚀 Ускорение: x{timings['legacy'] / timings['compiled']:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк extract_tech_keywords")
+    parser.add_argument("--limit", type=int, default=1000, help="Сколько документов взять из documents.jsonl")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=10, help="Во сколько раз увеличить словарь во втором замере")
+    args = parser.parse_args()
+
+    texts = load_texts(args.limit)
+    total_chars = sum(len(t) for t in texts)
+    print(f"📄 Текстов: {len(texts)}, символов: {total_chars}")
+
+    print(f"\n📚 Текущий словарь ({sum(len(p) for p in TECH_SYNONYMS.values())} синонимов)")
+    compare(texts, TECH_SYNONYMS, args.repeat)
+    if args.scale > 1:
+        synonyms = scaled_synonyms(args.scale)
+        print(f"\n📚 Словарь x{args.scale} ({sum(len(p) for p in synonyms.values())} синонимов)")
+        compare(texts, synonyms, args.repeat)
+
+    print()
+    matcher = TechMatcher(TECH_SYNONYMS)
+    # Расхождения показывают ложные срабатывания старой реализации ('go' в 'google' и т.п.)
+    diffs = 0
+    for text in texts:
+        legacy, compiled = set(extract_tech_keywords_legacy(text)), set(matcher.find(text))
+        if legacy != compiled:
+            diffs += 1
+            if diffs <= 3:
+                print(f"🔎 Только legacy: {sorted(legacy - compiled)}, только compiled: {sorted(compiled - legacy)}")
+    print(f"📊 Текстов с различающимся результатом: {diffs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# bm25_index.py
+import re
+import math
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BM25_INDEX_PATH = "./vectorstore/bm25_index.npz"
+
+# Токен сохраняет точки, '#' и '+' внутри названий технологий: 'nuxt.js', 'c#', 'c++', '1с'
+TOKEN_RE = re.compile(r'[a-zа-яё0-9][a-zа-яё0-9_#+]*(?:\.[a-zа-яё0-9_#+]+)*')
+
+# Частые окончания русских слов: грубый стемминг без словарей, чтобы «разработчиков» находило «разработчик»
+RU_ENDINGS = sorted([
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее',
+    'ые', 'ие', 'ов', 'ев', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ию', 'ия', 'ии', 'а', 'я', 'о', 'е',
+    'ы', 'и', 'у', 'ю', 'ь',
+], key=len, reverse=True)
+_CYRILLIC_RE = re.compile(r'^[а-яё]+$')
+
+
+def _stem(token: str) -> str:
+    if len(token) > 4 and _CYRILLIC_RE.match(token):
+        for ending in RU_ENDINGS:
+            if token.endswith(ending) and len(token) - len(ending) >= 3:
+                return token[:-len(ending)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Термы BM25: нормализованные слова; для 'nuxt.js' дополнительно 'nuxt'."""
+    terms = []
+    for token in TOKEN_RE.findall(text.lower().replace('ё', 'е')):
+        terms.append(_stem(token))
+        if '.' in token:
+            head = token.split('.', 1)[0]
+            if len(head) > 1:
+                terms.append(head)
+    return terms
+
+
+class BM25Index:
+    """Лексический индекс BM25 с постингами в CSR-массивах (терм → номера документов и частоты)."""
+
+    def __init__(self, ids: np.ndarray, terms: np.ndarray, offsets: np.ndarray, rows: np.ndarray,
+                 tfs: np.ndarray, doc_lens: np.ndarray, k1: float = 1.2, b: float = 0.75):
+        self.ids = ids
+        self.terms = terms
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+        self.avgdl = float(doc_lens.mean()) if len(doc_lens) else 0.0
+        self._positions = {term: i for i, term in enumerate(terms.tolist())}
+        # Знаменатель BM25 без tf зависит только от длины документа — считаем один раз
+        self._norms = (k1 * (1 - b + b * doc_lens / max(self.avgdl, 1.0))).astype(np.float32)
+
+    @classmethod
+    def build(cls, ids: List[str], documents: Iterable[str], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        postings = {}
+        doc_lens = []
+        for row, doc in enumerate(documents):
+            counts = Counter(tokenize(doc))
+            doc_lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((row, tf))
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[t]) for t in terms])
+        rows = np.array([row for t in terms for row, _ in postings[t]], dtype=np.int32)
+        # uint16 хватает для частоты терма в одном резюме и вдвое экономит место
+        tfs = np.array([min(tf, 65535) for t in terms for _, tf in postings[t]], dtype=np.uint16)
+        return cls(np.array(ids, dtype=str), np.array(terms, dtype=str), offsets, rows, tfs,
+                   np.array(doc_lens, dtype=np.int32), k1, b)
+
+    @classmethod
+    def load(cls, path: str = BM25_INDEX_PATH) -> "BM25Index":
+        data = np.load(path)
+        k1, b = data["params"].tolist()
+        return cls(data["ids"], data["terms"], data["offsets"], data["rows"], data["tfs"], data["doc_lens"], k1, b)
+
+    def save(self, path: str = BM25_INDEX_PATH):
+        np.savez_compressed(path, ids=self.ids, terms=self.terms, offsets=self.offsets, rows=self.rows,
+                            tfs=self.tfs, doc_lens=self.doc_lens, params=np.array([self.k1, self.b]))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, top_k: int = 100) -> List[Tuple[str, float]]:
+        """Top-k документов по BM25: список (id, score) по убыванию score."""
+        n_docs = len(self.ids)
+        scores = np.zeros(n_docs, dtype=np.float32)
+        matched = False
+        for term in set(tokenize(query)):
+            pos = self._positions.get(term)
+            if pos is None:
+                continue
+            start, end = self.offsets[pos], self.offsets[pos + 1]
+            rows = self.rows[start:end]
+            tfs = self.tfs[start:end].astype(np.float32)
+            idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + self._norms[rows])
+            matched = True
+        if not matched:
+            return []
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(str(self.ids[row]), float(scores[row])) for row in order]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60, limit: Optional[int] = None) -> List[str]:
+    """Объединяет ранжированные списки id: score = Σ 1 / (k + rank)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores, key=lambda doc_id: -scores[doc_id])
+    return fused[:limit] if limit is not None else fused
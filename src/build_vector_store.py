@@ -1,13 +1,36 @@
 import json
 import os
+import argparse
+import hashlib
 from tqdm import tqdm
-from sentence_transformers import SentenceTransformer
+import numpy as np
 import chromadb
 from chromadb.config import Settings
 
+from embedding_cache import EmbeddingCache
+from encoders import load_encoder, ENCODER_BACKENDS
+from skill_index import SkillIndex, SKILL_INDEX_PATH
+from bm25_index import BM25Index, BM25_INDEX_PATH
+from metadata_schema import MetadataSchema, METADATA_SCHEMA_PATH, split_skills
+from retrieval_backend import NumpyBackend, NUMPY_STORE_PATH, NUMPY_CHUNK_STORE_PATH
+from quantization import recall_report
+from result_cache import write_build_info, BUILD_INFO_PATH
+
 DOCUMENTS_PATH = "./data/processed/documents.jsonl"
 METADATA_PATH = "./data/processed/metadata.jsonl"
+CHUNKS_PATH = "./data/processed/chunks.jsonl"
+EVAL_QUERIES_PATH = "./data/eval/queries.jsonl"
 CHROMA_PATH = "./vectorstore/chroma_db"
+EMBEDDING_CACHE_PATH = "./vectorstore/embedding_cache/documents"
+MODEL_NAME = "all-MiniLM-L6-v2"
+COLLECTION_NAME = "resumes"
+CHUNK_COLLECTION_NAME = "resume_chunks"
+BATCH_SIZE = 1000
+
+def content_hash(doc_text: str, metadata: dict) -> str:
+    """Хеш текста и метаданных документа для инкрементальной синхронизации."""
+    payload = json.dumps({"text": doc_text, "metadata": metadata}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
 
 def load_documents_and_metadata():
     documents = []
@@ -32,7 +55,7 @@ def load_documents_and_metadata():
             documents.append(doc_text)
             
             # УЛУЧШЕННЫЕ МЕТАДАННЫЕ с фильтруемыми полями
-            metadatas.append({
+            metadata = {
                 "id": meta["id"],
                 "url": meta["url"].strip(),
                 "desired_position": meta["desired_position"].lower() if meta["desired_position"] else "",
@@ -41,49 +64,104 @@ def load_documents_and_metadata():
                 "specialty_category": meta["specialty_category"].lower() if meta["specialty_category"] else "",
                 "all_skills": ", ".join(meta["skills"]).lower() if meta["skills"] else "",
                 "top_skills": ", ".join(meta["top_5_skills"]).lower() if meta.get("top_5_skills") else ""
-            })
+            }
+            metadatas.append(metadata)
 
     print(f"✅ Загружено {len(documents)} документов.")
     print(f"📊 Пример метаданных: {metadatas[0] if metadatas else 'Нет данных'}")
     return ids, documents, metadatas
 
-def main():
-    os.makedirs(CHROMA_PATH, exist_ok=True)
+def load_chunks(metadatas):
+    """Чанки из chunks.jsonl с метаданными родительского резюме.
 
-    print("📥 Загрузка документов...")
-    ids, documents, metadatas = load_documents_and_metadata()
+    Поле id в метаданных чанка — id резюме, поэтому фильтры where (город, опыт,
+    навыки, id $in) работают для чанков так же, как для резюме.
+    """
+    parents = {meta["id"]: meta for meta in metadatas}
+    chunk_ids, chunk_texts, chunk_metas = [], [], []
+    with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            chunk = json.loads(line)
+            parent = parents.get(chunk["parent_id"])
+            if parent is None:
+                continue
+            meta = {key: value for key, value in parent.items() if key != "content_hash"}
+            meta.update({"chunk_id": chunk["id"], "section": chunk["section"]})
+            chunk_ids.append(chunk["id"])
+            chunk_texts.append(chunk["text"])
+            chunk_metas.append(meta)
+    print(f"🧩 Загружено {len(chunk_ids)} чанков ({len(chunk_ids) / max(len(parents), 1):.1f} на резюме)")
+    return chunk_ids, chunk_texts, chunk_metas
 
-    if not documents:
-        print("❌ Нет документов для обработки!")
-        return
+def add_structured_metadata(metadatas, top_n: int) -> MetadataSchema:
+    """Добавляет в метаданные флаги популярных навыков, код города и корзину опыта.
+
+    Коды прошлой схемы сохраняются, новые навыки и города получают следующие коды.
+    """
+    previous = MetadataSchema.load(METADATA_SCHEMA_PATH) if os.path.exists(METADATA_SCHEMA_PATH) else None
+    schema = MetadataSchema.build(metadatas, top_n=top_n, previous=previous)
+    for metadata in metadatas:
+        metadata.update(schema.structured_fields(metadata))
+    print(f"🗂 Схема метаданных: {len(schema.skill_fields)} флагов навыков, {len(schema.city_codes)} городов")
+    return schema
+
+def add_content_hashes(documents, metadatas):
+    for doc_text, metadata in zip(documents, metadatas):
+        metadata["content_hash"] = content_hash(doc_text, metadata)
+
+def create_collection(client, name: str = COLLECTION_NAME):
+    return client.get_or_create_collection(
+        name=name,
+        metadata={"hnsw:space": "cosine"},
+        # Оптимизация для фильтрации
+        embedding_function=None  # Используем предрасчитанные эмбеддинги
+    )
+
+def load_existing_hashes(collection) -> dict:
+    """Читает id и content_hash всех документов коллекции постранично."""
+    hashes = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=BATCH_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        for doc_id, meta in zip(page["ids"], page["metadatas"]):
+            hashes[doc_id] = (meta or {}).get("content_hash")
+        offset += len(page["ids"])
+    return hashes
 
+def encode_documents(documents, encoder=None) -> np.ndarray:
+    """Эмбеддинги документов через персистентный кэш: повторно кодируются только новые тексты."""
+    encoder = encoder or load_encoder(MODEL_NAME)
+    cache = EmbeddingCache(EMBEDDING_CACHE_PATH, encoder.cache_name, encoder.get_sentence_embedding_dimension(),
+                           flush_every=BATCH_SIZE)
+    embeddings = cache.encode(encoder, documents, show_progress_bar=True)
+    cache.close()
+    stats = cache.stats()
+    print(f"💾 Кэш эмбеддингов: {stats['hits']} из кэша, {stats['misses']} закодировано")
+    # ChromaDB принимает массив float32 напрямую: без .tolist() нет копии в виде списков float64
+    return np.asarray(embeddings, dtype=np.float32)
+
+def full_rebuild(client, ids, documents, metadatas, encoder=None, name: str = COLLECTION_NAME):
+    """Полная пересборка: удаляет коллекцию и заново кодирует все документы."""
     print("🧠 Генерация эмбеддингов...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    embeddings = model.encode(documents, show_progress_bar=True, batch_size=32).tolist()
+    embeddings = encode_documents(documents, encoder)
 
     print("💾 Сохранение в ChromaDB...")
-    client = chromadb.PersistentClient(path=CHROMA_PATH, settings=Settings(allow_reset=True))
-
     # Удаляем старую коллекцию (если есть)
     try:
-        client.delete_collection("resumes")
+        client.delete_collection(name)
     except:
         pass
 
-    collection = client.create_collection(
-        name="resumes",
-        metadata={"hnsw:space": "cosine"},
-        # Оптимизация для фильтрации
-        embedding_function=None  # Используем предрасчитанные эмбеддинги
-    )
+    collection = create_collection(client, name)
 
     # Добавляем данные партиями для больших наборов
-    batch_size = 1000
-    for i in tqdm(range(0, len(ids), batch_size), desc="Добавление в ChromaDB"):
-        batch_ids = ids[i:i+batch_size]
-        batch_embeddings = embeddings[i:i+batch_size]
-        batch_documents = documents[i:i+batch_size]
-        batch_metadatas = metadatas[i:i+batch_size]
+    for i in tqdm(range(0, len(ids), BATCH_SIZE), desc="Добавление в ChromaDB"):
+        batch_ids = ids[i:i+BATCH_SIZE]
+        batch_embeddings = embeddings[i:i+BATCH_SIZE]
+        batch_documents = documents[i:i+BATCH_SIZE]
+        batch_metadatas = metadatas[i:i+BATCH_SIZE]
         
         collection.add(
             ids=batch_ids,
@@ -91,8 +169,187 @@ def main():
             documents=batch_documents,
             metadatas=batch_metadatas
         )
+    return collection
+
+def incremental_sync(client, ids, documents, metadatas, encoder=None, name: str = COLLECTION_NAME):
+    """Инкрементальная синхронизация: кодирует только новые и изменённые документы, удаляет исчезнувшие.
+
+    Живая коллекция не удаляется, поэтому бот продолжает отвечать во время обновления.
+    """
+    collection = create_collection(client, name)
+    existing_hashes = load_existing_hashes(collection)
+
+    current_ids = set(ids)
+    changed = [i for i, (doc_id, meta) in enumerate(zip(ids, metadatas))
+               if existing_hashes.get(doc_id) != meta["content_hash"]]
+    removed = [doc_id for doc_id in existing_hashes if doc_id not in current_ids]
+    print(f"🔄 Без изменений: {len(ids) - len(changed)}, новых/изменённых: {len(changed)}, удалённых: {len(removed)}")
+
+    for i in range(0, len(removed), BATCH_SIZE):
+        collection.delete(ids=removed[i:i+BATCH_SIZE])
+
+    if changed:
+        print("🧠 Генерация эмбеддингов для изменённых документов...")
+        embeddings = encode_documents([documents[i] for i in changed], encoder)
+
+        for start in tqdm(range(0, len(changed), BATCH_SIZE), desc="Обновление ChromaDB"):
+            batch = changed[start:start+BATCH_SIZE]
+            # Изменённые документы удаляем перед добавлением: upsert не убирает
+            # из метаданных поля, которых больше нет (например, флаги навыков)
+            stale = [ids[i] for i in batch if ids[i] in existing_hashes]
+            if stale:
+                collection.delete(ids=stale)
+            collection.upsert(
+                ids=[ids[i] for i in batch],
+                embeddings=embeddings[start:start+BATCH_SIZE],
+                documents=[documents[i] for i in batch],
+                metadatas=[metadatas[i] for i in batch]
+            )
+    return collection
+
+def recall_queries(metadatas, sample: int = 200, seed: int = 0) -> list:
+    """Запросы для оценки квантования: оценочные из test_retrieval.py или «<навык> разработчик, город <город>»."""
+    if os.path.exists(EVAL_QUERIES_PATH):
+        with open(EVAL_QUERIES_PATH, "r", encoding="utf-8") as f:
+            queries = [json.loads(line)["query"] for line in f if line.strip()]
+        if queries:
+            return queries[:sample]
+    rng = np.random.default_rng(seed)
+    queries = []
+    for row in rng.permutation(len(metadatas))[:sample]:
+        skills = split_skills(metadatas[row].get("all_skills", ""))
+        if skills:
+            city = metadatas[row].get("location")
+            queries.append(f"{skills[0]} разработчик" + (f", город {city.title()}" if city else ""))
+    return queries
+
+def export_numpy_store(ids, documents, metadatas, dtype: str = "float32", rescore_dtype: str = None,
+                       encoder=None, path: str = NUMPY_STORE_PATH):
+    """Экспорт в NumpyBackend: эмбеддинги берутся из кэша, повторного кодирования нет."""
+    print("📦 Экспорт хранилища NumPy...")
+    encoder = encoder or load_encoder(MODEL_NAME)
+    embeddings = encode_documents(documents, encoder)
+    NumpyBackend.build(path, ids, embeddings, documents, metadatas, dtype=dtype,
+                       skills_per_doc=[split_skills(meta["all_skills"]) for meta in metadatas],
+                       rescore_dtype=rescore_dtype)
+    backend = NumpyBackend(path)
+    # Всё, что хранилище держит ради векторного поиска: с пересчётом и HNSW это больше самих кодов
+    stored_mb = backend.vector_nbytes() / 2**20
+    rescore = f" + пересчёт {rescore_dtype}" if rescore_dtype and rescore_dtype != dtype else ""
+    print(f"✅ Хранилище NumPy сохранено в {path}: векторы {dtype}{rescore} {stored_mb:.1f} МБ "
+          f"(эмбеддинги float32 — {embeddings.nbytes / 2**20:.1f} МБ)")
+    if dtype != "float32":
+        # Качество квантования: доля точного top-k по float32, которую находит хранилище
+        queries = recall_queries(metadatas)
+        if not queries:
+            return
+        recalls = recall_report(embeddings, ids, backend, encoder.encode(queries))
+        print(f"🎯 recall@k относительно float32 на {len(queries)} запросах: " +
+              ", ".join(f"@{k}={value:.3f}" for k, value in recalls.items()))
+
+def main():
+    parser = argparse.ArgumentParser(description="Построение векторного хранилища резюме")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Обновить только новые/изменённые резюме, не пересоздавая коллекцию")
+    parser.add_argument("--structured-metadata", action="store_true",
+                        help="Добавить фильтруемые поля: флаги навыков, код города, корзину опыта")
+    parser.add_argument("--top-skills", type=int, default=100,
+                        help="Сколько самых частых навыков получают собственный флаг")
+    parser.add_argument("--numpy-store", action="store_true",
+                        help="Дополнительно экспортировать хранилище для RETRIEVAL_BACKEND=numpy")
+    parser.add_argument("--numpy-dtype", choices=["float32", "float16", "int8"], default="float32",
+                        help="Тип эмбеддингов в хранилище NumPy (int8 — с масштабом на вектор)")
+    parser.add_argument("--numpy-rescore", choices=["none", "float16", "float32"], default="float16",
+                        help="Копия эмбеддингов для пересчёта лучших кандидатов квантованного хранилища")
+    parser.add_argument("--chunks", action="store_true",
+                        help="Проиндексировать chunks.jsonl (prepare_documents.py --chunks) как отдельные векторы")
+    parser.add_argument("--encoder-backend", choices=ENCODER_BACKENDS, default=None,
+                        help="Бэкенд энкодера (по умолчанию ENCODER_BACKEND или torch)")
+    parser.add_argument("--batch-size", type=int, default=None, help="Размер батча энкодера")
+    parser.add_argument("--threads", type=int, default=None, help="Число потоков энкодера")
+    args = parser.parse_args()
+
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+
+    print("📥 Загрузка документов...")
+    ids, documents, metadatas = load_documents_and_metadata()
+
+    if not documents:
+        print("❌ Нет документов для обработки!")
+        return
+
+    schema = add_structured_metadata(metadatas, args.top_skills) if args.structured_metadata else None
+    add_content_hashes(documents, metadatas)
+
+    encoder = load_encoder(MODEL_NAME, backend=args.encoder_backend, batch_size=args.batch_size, threads=args.threads)
+    print(f"🧠 Энкодер: {encoder.backend}, батч {encoder.batch_size}, потоков {encoder.threads or 'по умолчанию'}")
+
+    client = chromadb.PersistentClient(path=CHROMA_PATH, settings=Settings(allow_reset=True))
+    if args.incremental:
+        collection = incremental_sync(client, ids, documents, metadatas, encoder)
+    else:
+        collection = full_rebuild(client, ids, documents, metadatas, encoder)
 
     print(f"✅ Векторное хранилище сохранено. Всего: {collection.count()} резюме.")
+
+    rescore_dtype = None if args.numpy_rescore == "none" or args.numpy_dtype == "float32" else args.numpy_rescore
+    if args.numpy_store:
+        export_numpy_store(ids, documents, metadatas, args.numpy_dtype, rescore_dtype, encoder)
+
+    chunk_texts_by_parent = {}
+    if args.chunks:
+        # Чанки синхронизируются так же, как резюме: с --incremental коллекция не пересоздаётся,
+        # а хеш чанка включает метаданные родителя, поэтому их изменение тоже обновляет чанк
+        chunk_ids, chunk_texts, chunk_metas = load_chunks(metadatas)
+        add_content_hashes(chunk_texts, chunk_metas)
+        if args.incremental:
+            chunk_collection = incremental_sync(client, chunk_ids, chunk_texts, chunk_metas, encoder,
+                                                CHUNK_COLLECTION_NAME)
+        else:
+            chunk_collection = full_rebuild(client, chunk_ids, chunk_texts, chunk_metas, encoder,
+                                            CHUNK_COLLECTION_NAME)
+        print(f"✅ Коллекция чанков сохранена. Всего: {chunk_collection.count()} чанков.")
+        if args.numpy_store:
+            export_numpy_store(chunk_ids, chunk_texts, chunk_metas, args.numpy_dtype, rescore_dtype, encoder,
+                               NUMPY_CHUNK_STORE_PATH)
+        for text, meta in zip(chunk_texts, chunk_metas):
+            chunk_texts_by_parent.setdefault(meta["id"], []).append(text)
+    else:
+        # Чанки от прошлой сборки не соответствуют новым документам
+        try:
+            client.delete_collection(CHUNK_COLLECTION_NAME)
+        except Exception:
+            pass
+
+    if schema is not None:
+        schema.save(METADATA_SCHEMA_PATH)
+    elif os.path.exists(METADATA_SCHEMA_PATH):
+        # Схема от прошлой сборки не соответствует новым метаданным
+        os.remove(METADATA_SCHEMA_PATH)
+
+    # Индекс навык → резюме строится заново по всем документам: это быстро и не требует эмбеддингов
+    skill_index = SkillIndex.build(
+        [meta["id"] for meta in metadatas],
+        [split_skills(meta["all_skills"]) for meta in metadatas]
+    )
+    skill_index.save(SKILL_INDEX_PATH)
+    print(f"🔧 Индекс навыков сохранён: {len(skill_index.skills)} навыков")
+
+    # Лексический индекс BM25 для гибридного поиска тоже пересобирается целиком;
+    # с чанками он покрывает полный текст резюме, а не только обрезанный документ
+    bm25_index = BM25Index.build(ids, ["\n".join([doc] + chunk_texts_by_parent.get(doc_id, []))
+                                       for doc_id, doc in zip(ids, documents)])
+    bm25_index.save(BM25_INDEX_PATH)
+    print(f"🔤 Индекс BM25 сохранён: {len(bm25_index.terms)} термов, {len(bm25_index.rows)} постингов")
+
+    # Версия сборки зависит от содержимого резюме и параметров сборки: бот по ней
+    # отбрасывает закэшированные результаты, полученные на прошлых индексах
+    build_hash = hashlib.sha256(json.dumps(
+        [vars(args), encoder.cache_name, sorted(meta["content_hash"] for meta in metadatas)]
+    ).encode()).hexdigest()[:16]
+    write_build_info(build_hash, BUILD_INFO_PATH, documents=len(ids), chunks=args.chunks,
+                     numpy_store=args.numpy_store)
+    print(f"🏷 Версия сборки: {build_hash}")
     
     # Проверка доступности коллекции
     print("🔍 Проверка коллекции...")
@@ -108,4 +365,4 @@ def main():
         print(f"     Навыки: {meta.get('all_skills', 'N/A')[:100]}...")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,100 @@
+# context_builder.py
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bm25_index import tokenize
+
+# Строки документа, которые дублируют поля карточки резюме в промпте (должность, навыки, город, стаж)
+# («Опыт работы: 5 лет в банке» — уже описание опыта, а не стаж, и остаётся в тексте)
+REDUNDANT_LINE_RE = re.compile(r'^(?:Ищу позицию|Ключевые навыки|Локация):'
+                               r'|^Опыт работы: (?:\d+ (?:год(?:а|ов)?|лет)(?: \d+ месяц(?:а|ев)?)?|\d+ месяц(?:а|ев)?)$')
+# Доля бюджета кандидата на строку навыков; остальное — описание опыта
+SKILLS_SHARE = 0.35
+
+
+def approx_tokens(text: str) -> int:
+    """Грубая оценка числа токенов без токенизатора: около 3,5 символа на токен."""
+    return (len(text) * 2 + 6) // 7
+
+
+def strip_redundant(text: str) -> str:
+    """Текст документа без строк, повторяющих должность, навыки, город и стаж."""
+    return "\n".join(line for line in text.split("\n") if not REDUNDANT_LINE_RE.match(line.strip()))
+
+
+class ContextBuilder:
+    """Контекст резюме для промпта анализа в пределах бюджета токенов.
+
+    Бюджет распределяется по рангу: кандидат получает долю оставшегося бюджета
+    с весом 1 / (ранг + 1), поэтому сильные кандидаты описываются подробнее, а
+    неиспользованный короткими резюме запас переходит следующим. Почти одинаковые
+    резюме (один человек с несколькими резюме) попадают в контекст один раз.
+    """
+
+    def __init__(self, max_tokens: int = 1200, count_tokens: Optional[Callable[[str], int]] = None,
+                 dedupe_threshold: float = 0.9):
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens or approx_tokens
+        self.dedupe_threshold = dedupe_threshold
+        self._label_tokens = self.count_tokens("\nКраткое описание: ")
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """Обрезает текст по границе слова так, чтобы он занимал не больше max_tokens."""
+        if max_tokens <= 0 or not text:
+            return ""
+        tokens = self.count_tokens(text)
+        if tokens <= max_tokens:
+            return text
+        length = int(len(text) * max_tokens / tokens)
+        while length > 0:
+            cut = text[:length].rsplit(" ", 1)[0] if " " in text[:length] else text[:length]
+            candidate = cut.rstrip(" ,.;:") + "…"
+            if self.count_tokens(candidate) <= max_tokens:
+                return candidate
+            length = int(length * 0.9)
+        return ""
+
+    def _deduplicate(self, resumes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        kept, kept_terms = [], []
+        for r in resumes:
+            terms = set(tokenize(f"{r['position']} {r['skills']} {r['text']}"))
+            duplicate = any(len(terms & other) / max(len(terms | other), 1) >= self.dedupe_threshold
+                            for other in kept_terms)
+            if not duplicate:
+                kept.append(r)
+                kept_terms.append(terms)
+        return kept
+
+    def build(self, resumes: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+        """Возвращает (контекст, резюме в контексте); номера «Резюме #N» соответствуют второму списку."""
+        resumes = self._deduplicate(resumes)
+        headers = []
+        for i, r in enumerate(resumes, 1):
+            headers.append(
+                f"Резюме #{i}:\n"
+                f"Должность: {r['position']}\n"
+                f"Город: {r['location']}\n"
+                f"Опыт: {r['experience_months'] // 12} лет"
+            )
+        # Заголовки карточек обязательны: если одни они не помещаются в бюджет, отбрасываются
+        # кандидаты с конца выдачи; на навыки и описания остаётся остаток бюджета
+        header_tokens = [self.count_tokens(header) for header in headers]
+        while len(headers) > 1 and sum(header_tokens) > self.max_tokens:
+            headers.pop()
+            header_tokens.pop()
+            resumes = resumes[:-1]
+        remaining = self.max_tokens - sum(header_tokens)
+        weights = [1.0 / rank for rank in range(1, len(resumes) + 1)]
+
+        parts = []
+        for i, (r, header) in enumerate(zip(resumes, headers)):
+            allowance = int(max(remaining, 0) * weights[i] / sum(weights[i:]))
+            skills = self._truncate(r['skills'], int(allowance * SKILLS_SHARE) - self._label_tokens)
+            body = f"\nКлючевые навыки: {skills}" if skills else ""
+            description = strip_redundant(r['text']).replace("\n", " ")
+            description = self._truncate(description, allowance - self.count_tokens(body) - self._label_tokens)
+            if description:
+                body += f"\nКраткое описание: {description}"
+            remaining -= self.count_tokens(body)
+            parts.append(header + body)
+        return "\n\n".join(parts), resumes
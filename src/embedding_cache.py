@@ -0,0 +1,260 @@
+# embedding_cache.py
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Union
+
+import numpy as np
+
+from observability import fields
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: блокировки нет, один писатель на каталог
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.f32"
+INDEX_FILE = "index.json"
+KEYS_FILE = "keys.bin"
+LOCK_FILE = "lock"
+KEY_BYTES = 20  # sha1 ключа записи рядом с её вектором
+MIN_CAPACITY = 1024
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация текста перед хешированием: NFC и схлопывание пробелов."""
+    return re.sub(r'\s+', ' ', unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model_name: str, text: str) -> str:
+    """Ключ кэша: хеш имени модели и нормализованного текста."""
+    payload = f"{model_name}\0{normalize_text(text)}"
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Персистентный кэш эмбеддингов: float32-матрица в memmap и индекс ключ → строка.
+
+    Без max_entries кэш только растёт (сторона индексатора); с max_entries
+    вытесняются давно не использованные записи (сторона запросов бота).
+
+    Индекс сохраняется раз в flush_every записей, а строки вытесненных записей
+    переиспользуются сразу, поэтому рядом с каждым вектором хранится хеш его ключа:
+    после сбоя строка, занятая другим текстом, читается как промах. Писатель у
+    каталога один (блокировка файла lock); другие процессы открывают кэш только на чтение.
+    """
+
+    def __init__(self, path: str, model_name: str, dim: int,
+                 max_entries: Optional[int] = None, flush_every: int = 1):
+        self.path = path
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+        self.flush_every = max(1, flush_every)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._rows = OrderedDict()  # ключ → номер строки, порядок = LRU
+        self._capacity = 0
+        self._vectors = None
+        self._keys = None
+        self._next_row = 0  # первая ни разу не занятая строка
+        self._free_rows = []  # строки записей, отброшенных при проверке хеша ключа
+        self._unflushed = 0
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = None
+        self.read_only = not self._acquire_writer_lock()
+        if self.read_only:
+            logger.warning("Кэш эмбеддингов открыт другим процессом, новые записи не сохраняются",
+                           extra=fields(path=self.path))
+        self._load()
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, VECTORS_FILE)
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.path, INDEX_FILE)
+
+    @property
+    def _keys_path(self) -> str:
+        return os.path.join(self.path, KEYS_FILE)
+
+    def _acquire_writer_lock(self) -> bool:
+        if fcntl is None:
+            return True
+        self._lock_file = open(os.path.join(self.path, LOCK_FILE), "a+")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def _open_memmaps(self, capacity: int):
+        mode = "r" if self.read_only else "r+"
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(capacity, self.dim))
+        self._keys = np.memmap(self._keys_path, dtype=np.uint8, mode=mode, shape=(capacity, KEY_BYTES))
+        self._capacity = capacity
+
+    def _load(self):
+        if not os.path.exists(self._index_path) or not os.path.exists(self._vectors_path):
+            return
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Индекс кэша эмбеддингов повреждён, кэш будет пересоздан",
+                           extra=fields(path=self.path, error=str(e)))
+            return
+        if index.get("model") != self.model_name or index.get("dim") != self.dim:
+            logger.warning("Кэш эмбеддингов создан для другой модели, кэш будет пересоздан",
+                           extra=fields(path=self.path, model=index.get("model"), expected=self.model_name))
+            return
+        capacity = os.path.getsize(self._vectors_path) // (self.dim * 4)
+        if capacity < index.get("capacity", 0):
+            logger.warning("Файл векторов кэша короче индекса, кэш будет пересоздан", extra=fields(path=self.path))
+            return
+        if not os.path.exists(self._keys_path) or os.path.getsize(self._keys_path) < capacity * KEY_BYTES:
+            logger.warning("Кэш эмбеддингов без хешей ключей строк, кэш будет пересоздан", extra=fields(path=self.path))
+            return
+        self._open_memmaps(capacity)
+        self._rows = OrderedDict((key, row) for key, row in index["entries"])
+        self._next_row = max(self._rows.values(), default=-1) + 1
+
+    def _ensure_capacity(self, needed: int):
+        if needed <= self._capacity:
+            return
+        new_capacity = max(needed, self._capacity * 2, MIN_CAPACITY)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._keys.flush()
+            self._vectors = self._keys = None
+        for file_path, row_bytes in ((self._vectors_path, self.dim * 4), (self._keys_path, KEY_BYTES)):
+            with open(file_path, "a+b") as f:
+                f.truncate(new_capacity * row_bytes)
+        self._open_memmaps(new_capacity)
+
+    def _allocate_row(self) -> int:
+        if self._free_rows:
+            return self._free_rows.pop()
+        if self.max_entries and len(self._rows) >= self.max_entries:
+            # Вытесняем самую давно использованную запись и переиспользуем её строку
+            _, row = self._rows.popitem(last=False)
+            return row
+        row = self._next_row
+        self._ensure_capacity(row + 1)
+        self._next_row += 1
+        return row
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = cache_key(self.model_name, text)
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                return None
+            if self._keys[row].tobytes() != bytes.fromhex(key):
+                # Строку переиспользовала запись, не попавшая в сохранённый индекс
+                del self._rows[key]
+                if row not in self._rows.values():
+                    self._free_rows.append(row)
+                return None
+            self._rows.move_to_end(key)
+            return np.array(self._vectors[row])
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        if self.read_only:
+            return
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = cache_key(self.model_name, text)
+                row = self._rows.get(key)
+                if row is None:
+                    row = self._allocate_row()
+                # Хеш ключа пишется последним: прерванная запись строки не совпадёт ни с одним ключом
+                self._keys[row] = 0
+                self._vectors[row] = vector
+                self._keys[row] = np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+                self._rows[key] = row
+                self._rows.move_to_end(key)
+                self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self._flush_locked()
+
+    def encode(self, model, texts: Union[str, List[str]], **encode_kwargs) -> np.ndarray:
+        """Читающий через кэш аналог model.encode: кодирует только отсутствующие тексты."""
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        result = [None] * len(batch)
+        missing = {}  # нормализованный ключ → текст, без дублей внутри батча
+        for i, text in enumerate(batch):
+            vector = self.get(text)
+            if vector is None:
+                missing.setdefault(cache_key(self.model_name, text), text)
+            result[i] = vector
+
+        with self._lock:
+            self.hits += sum(1 for v in result if v is not None)
+            self.misses += len(batch) - sum(1 for v in result if v is not None)
+
+        if missing:
+            missing_texts = list(missing.values())
+            encoded = np.asarray(model.encode(missing_texts, **encode_kwargs), dtype=np.float32)
+            self.put_many(missing_texts, encoded)
+            by_key = dict(zip(missing.keys(), encoded))
+            for i, text in enumerate(batch):
+                if result[i] is None:
+                    result[i] = by_key[cache_key(self.model_name, text)]
+
+        matrix = np.stack(result) if result else np.zeros((0, self.dim), dtype=np.float32)
+        return matrix[0] if single else matrix
+
+    def _flush_locked(self):
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._keys.flush()
+        index = {
+            "model": self.model_name,
+            "dim": self.dim,
+            "capacity": self._capacity,
+            "entries": list(self._rows.items()),
+        }
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._index_path)
+        self._unflushed = 0
+
+    def flush(self):
+        """Сохраняет векторы и индекс на диск."""
+        with self._lock:
+            if self._unflushed and not self.read_only:
+                self._flush_locked()
+
+    def close(self):
+        """Сохраняет кэш и снимает блокировку писателя."""
+        self.flush()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._rows),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
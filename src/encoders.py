@@ -0,0 +1,95 @@
+# encoders.py
+import os
+from typing import List, Optional, Union
+
+import numpy as np
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+# torch — штатный SentenceTransformer, onnx — ONNX Runtime (нужны optimum и onnxruntime),
+# torch-int8 — динамическое int8-квантование линейных слоёв
+ENCODER_BACKENDS = ("torch", "onnx", "torch-int8")
+DEFAULT_BATCH_SIZE = 32
+
+
+class SentenceEncoder:
+    """Энкодер текстов на CPU с выбираемым бэкендом и интерфейсом model.encode.
+
+    Батчи похожей длины собирает сам SentenceTransformer.encode: он сортирует
+    тексты по длине перед разбиением на батчи, поэтому паддинга почти нет.
+
+    torch и sentence-transformers импортируются при создании энкодера, а не модуля:
+    бот загружает модель в отдельном потоке параллельно с остальной инициализацией.
+    """
+
+    def __init__(self, model_name: str = MODEL_NAME, backend: str = "torch",
+                 batch_size: int = DEFAULT_BATCH_SIZE, threads: Optional[int] = None):
+        if backend not in ENCODER_BACKENDS:
+            raise ValueError(f"Неизвестный бэкенд энкодера: {backend} (доступны: {', '.join(ENCODER_BACKENDS)})")
+        if backend == "onnx":
+            # Без optimum SentenceTransformer падает только при загрузке модели, с невнятной ошибкой
+            try:
+                import onnxruntime
+                import optimum.onnxruntime  # noqa: F401
+            except ImportError as e:  # pragma: no cover - необязательная зависимость
+                raise ImportError(f"Для ENCODER_BACKEND=onnx установите optimum[onnxruntime]: {e}") from e
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.threads = threads
+        if threads:
+            torch.set_num_threads(threads)
+
+        if backend == "onnx":
+            options = onnxruntime.SessionOptions()
+            if threads:
+                options.intra_op_num_threads = threads
+            self.model = SentenceTransformer(model_name, device="cpu", backend="onnx",
+                                             model_kwargs={"session_options": options,
+                                                           "provider": "CPUExecutionProvider"})
+        else:
+            self.model = SentenceTransformer(model_name, device="cpu")
+            if backend == "torch-int8":
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    @property
+    def cache_name(self) -> str:
+        """Имя модели для ключей кэша эмбеддингов: int8-векторы отличаются от float32."""
+        return f"{self.model_name}:int8" if self.backend == "torch-int8" else self.model_name
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def count_tokens(self, text: str) -> int:
+        """Число токенов текста по токенизатору модели, без обрезки до max_seq_length."""
+        return len(self.model.tokenizer(text, add_special_tokens=False, truncation=False)["input_ids"])
+
+    def encode(self, texts: Union[str, List[str]], batch_size: Optional[int] = None,
+               show_progress_bar: bool = False, **encode_kwargs) -> np.ndarray:
+        """Аналог SentenceTransformer.encode: строка → вектор, список → матрица float32."""
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        dim = self.get_sentence_embedding_dimension()
+        if not texts:
+            return np.empty((0, dim), dtype=np.float32)
+
+        vectors = self.model.encode(texts, batch_size=batch_size or self.batch_size, convert_to_numpy=True,
+                                    show_progress_bar=show_progress_bar, **encode_kwargs)
+        result = np.asarray(vectors, dtype=np.float32)
+        return result[0] if single else result
+
+    def warmup(self, text: str = "Python разработчик") -> None:
+        """Пробное кодирование: первый запрос пользователя не платит за ленивую инициализацию модели."""
+        self.encode(text)
+
+
+def load_encoder(model_name: str = MODEL_NAME, backend: Optional[str] = None,
+                 batch_size: Optional[int] = None, threads: Optional[int] = None) -> SentenceEncoder:
+    """Энкодер с параметрами из аргументов или переменных окружения
+    ENCODER_BACKEND, ENCODER_BATCH_SIZE, ENCODER_THREADS."""
+    backend = backend or os.getenv("ENCODER_BACKEND", "torch")
+    batch_size = batch_size or int(os.getenv("ENCODER_BATCH_SIZE", str(DEFAULT_BATCH_SIZE)))
+    threads = threads or (int(os.getenv("ENCODER_THREADS")) if os.getenv("ENCODER_THREADS") else None)
+    return SentenceEncoder(model_name, backend=backend, batch_size=batch_size, threads=threads)
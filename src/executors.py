@@ -0,0 +1,107 @@
+# executors.py
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from observability import fields
+
+logger = logging.getLogger(__name__)
+
+# Размеры пулов по умолчанию: LLM — сетевые вызовы, энкодер — CPU, chroma — хранилище резюме
+# (SQLite + HNSW или NumpyBackend), lexical — поиск BM25 по локальному индексу (NumPy)
+DEFAULT_POOL_SIZES = {
+    "llm": 8,
+    "encoder": 2,
+    "chroma": 4,
+    "lexical": 2,
+}
+
+
+class BackendPool:
+    """Ограниченный пул потоков для одного бэкенда с подсчётом глубины очереди."""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._queued = 0  # Задачи, ожидающие свободный поток
+        self._active = 0  # Задачи, выполняющиеся прямо сейчас
+        self.completed = 0
+        self.max_queue_depth = 0
+
+    def _run(self, fn, args, kwargs):
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self.completed += 1
+
+    def _on_done(self, future):
+        # Отменённая до старта задача не попала в _run — снимаем её с очереди здесь
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Выполняет блокирующую функцию в пуле, не блокируя event loop."""
+        with self._lock:
+            self._queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queued)
+        future = self._executor.submit(self._run, fn, args, kwargs)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "queued": self._queued,
+                "active": self._active,
+                "completed": self.completed,
+                "max_queue_depth": self.max_queue_depth,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+class ExecutionLayer:
+    """Набор пулов потоков для блокирующих бэкендов: LLM, энкодер, Chroma и BM25."""
+
+    def __init__(self, pool_sizes: Optional[Dict[str, int]] = None):
+        sizes = dict(DEFAULT_POOL_SIZES)
+        sizes.update(pool_sizes or {})
+        self.pools = {name: BackendPool(name, max(1, int(size))) for name, size in sizes.items()}
+
+    @classmethod
+    def from_env(cls) -> "ExecutionLayer":
+        """Размеры пулов из переменных окружения LLM_POOL_SIZE, ENCODER_POOL_SIZE, CHROMA_POOL_SIZE, LEXICAL_POOL_SIZE."""
+        sizes = {}
+        for name in DEFAULT_POOL_SIZES:
+            value = os.getenv(f"{name.upper()}_POOL_SIZE")
+            if value:
+                try:
+                    sizes[name] = int(value)
+                except ValueError:
+                    logger.warning("Некорректный размер пула, используется значение по умолчанию",
+                                   extra=fields(variable=f"{name.upper()}_POOL_SIZE", value=value))
+        return cls(sizes)
+
+    async def run(self, backend: str, fn, *args, **kwargs):
+        """Выполняет вызов в пуле указанного бэкенда."""
+        return await self.pools[backend].run(fn, *args, **kwargs)
+
+    def stats(self) -> Dict[str, dict]:
+        return {name: pool.stats() for name, pool in self.pools.items()}
+
+    def shutdown(self, wait: bool = True):
+        for pool in self.pools.values():
+            pool.shutdown(wait=wait)
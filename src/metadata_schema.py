@@ -0,0 +1,127 @@
+# metadata_schema.py
+import os
+import re
+import json
+from collections import Counter
+from typing import Dict, List, Optional
+
+from skill_index import skill_keys
+
+METADATA_SCHEMA_PATH = "./vectorstore/metadata_schema.json"
+
+# Границы корзин опыта в месяцах: <1 года, 1–3, 3–5, 5–10, 10+ лет
+EXPERIENCE_BUCKETS = [12, 36, 60, 120]
+
+
+def split_skills(all_skills: str) -> List[str]:
+    """Список навыков из строки all_skills метаданных ChromaDB."""
+    return [s for s in all_skills.split(", ") if s] if all_skills else []
+
+
+def experience_bucket(months: int) -> int:
+    bucket = 0
+    for bound in EXPERIENCE_BUCKETS:
+        if (months or 0) >= bound:
+            bucket += 1
+    return bucket
+
+
+class MetadataSchema:
+    """Схема фильтруемых метаданных: булевы флаги популярных навыков, код города, корзина опыта.
+
+    Флаг навыка хранится только у резюме, где навык есть, поэтому условие
+    {"skill_react": {"$eq": True}} ChromaDB проверяет сама, без постфильтрации.
+    """
+
+    def __init__(self, skill_fields: Dict[str, str], city_codes: Dict[str, int]):
+        self.skill_fields = skill_fields
+        self.city_codes = city_codes
+
+    @classmethod
+    def build(cls, metadatas: List[dict], top_n: int = 100,
+              previous: Optional["MetadataSchema"] = None) -> "MetadataSchema":
+        """Схема по метаданным резюме.
+
+        С previous (схема прошлой сборки) имеющиеся поля навыков и коды городов
+        сохраняются, а новые добавляются в конец: иначе при смене порядка частот
+        коды переназначаются, и условия where бота расходятся с метаданными хранилища.
+        """
+        skill_counts = Counter()
+        city_counts = Counter()
+        for meta in metadatas:
+            keys = set()
+            for skill in split_skills(meta.get("all_skills", "")):
+                keys |= skill_keys(skill)
+            skill_counts.update(keys)
+            if meta.get("location"):
+                city_counts[meta["location"]] += 1
+
+        skill_fields = dict(previous.skill_fields) if previous else {}
+        used = set(skill_fields.values())
+        for skill, _ in skill_counts.most_common(top_n):
+            if skill in skill_fields:
+                continue
+            base = "skill_" + (re.sub(r'[^a-zа-яё0-9]+', '_', skill.replace('#', 'sharp').replace('+', 'plus')).strip('_') or "x")
+            field, n = base, 1
+            while field in used:
+                n += 1
+                field = f"{base}_{n}"
+            used.add(field)
+            skill_fields[skill] = field
+        # Код 0 зарезервирован для неизвестного города
+        city_codes = dict(previous.city_codes) if previous else {}
+        next_code = max(city_codes.values(), default=0) + 1
+        for city, _ in city_counts.most_common():
+            if city not in city_codes:
+                city_codes[city] = next_code
+                next_code += 1
+        return cls(skill_fields, city_codes)
+
+    @classmethod
+    def load(cls, path: str = METADATA_SCHEMA_PATH) -> "MetadataSchema":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["skill_fields"], data["city_codes"])
+
+    def save(self, path: str = METADATA_SCHEMA_PATH):
+        # Запись через временный файл: бот может перечитывать схему во время сборки
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "skill_fields": self.skill_fields,
+                "city_codes": self.city_codes,
+                "experience_buckets": EXPERIENCE_BUCKETS
+            }, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def city_code(self, city: Optional[str]) -> int:
+        return self.city_codes.get((city or "").lower(), 0)
+
+    def structured_fields(self, meta: dict) -> dict:
+        """Дополнительные поля метаданных для одного резюме."""
+        fields = {
+            "city_code": self.city_code(meta.get("location")),
+            "experience_bucket": experience_bucket(meta.get("total_experience_months", 0)),
+        }
+        for skill in split_skills(meta.get("all_skills", "")):
+            for key in skill_keys(skill):
+                if key in self.skill_fields:
+                    fields[self.skill_fields[key]] = True
+        return fields
+
+    def where_for_skills(self, skills: List[str]) -> Optional[dict]:
+        """Условие where «есть хотя бы один из навыков».
+
+        None, если какой-то навык не входит в словарь схемы: тогда фильтр
+        потерял бы подходящие резюме и навыки нужно проверять иначе.
+        """
+        conditions = []
+        for skill in skills:
+            fields = sorted({self.skill_fields[key] for key in skill_keys(skill) if key in self.skill_fields})
+            if not fields:
+                return None
+            conditions.extend({field: {"$eq": True}} for field in fields)
+        if not conditions:
+            return None
+        unique = list({json.dumps(c): c for c in conditions}.values())
+        return unique[0] if len(unique) == 1 else {"$or": unique}
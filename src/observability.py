@@ -0,0 +1,207 @@
+# observability.py
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы длительности этапов, секунды
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Сколько последних замеров этапа хранится для перцентилей в /stats
+SPAN_RESERVOIR = 1000
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def fields(**values) -> dict:
+    """Поля структурированной записи лога: logger.info("...", extra=fields(city=city))."""
+    return {"fields": values}
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной JSON-строкой: время, уровень, логгер, сообщение и поля из extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Человекочитаемый формат: сообщение и поля key=value."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extra = getattr(record, "fields", None)
+        if extra:
+            line += " " + " ".join(f"{key}={value}" for key, value in extra.items())
+        return line
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None):
+    """Логирование из LOG_LEVEL (INFO) и LOG_FORMAT (text или json)."""
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "text")).lower()
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+class Metrics:
+    """Метрики процесса: счётчики, гистограммы длительности этапов и коллекторы состояния.
+
+    Коллекторы — функции, которые при выгрузке возвращают текущие значения
+    (размеры очередей, статистику кэшей) как (имя, метки, значение), чтобы
+    не дублировать уже существующие счётчики компонентов.
+    """
+
+    def __init__(self, buckets: Iterable[float] = SPAN_BUCKETS, reservoir: int = SPAN_RESERVOIR):
+        self.buckets = tuple(buckets)
+        self.reservoir = reservoir
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._histograms: Dict[str, dict] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            hist = self._histograms.get(stage)
+            if hist is None:
+                hist = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0,
+                        "recent": deque(maxlen=self.reservoir)}
+                self._histograms[stage] = hist
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    hist["buckets"][i] += 1
+            hist["count"] += 1
+            hist["sum"] += seconds
+            hist["recent"].append(seconds)
+
+    @contextmanager
+    def span(self, stage: str, **details):
+        """Замер этапа: длительность попадает в гистограмму, ошибка — в счётчик, запись — в лог (DEBUG)."""
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            self.inc("rag_stage_errors_total", stage=stage)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(stage, elapsed)
+            logger.debug("span", extra=fields(stage=stage, ms=round(elapsed * 1000, 2), status=status, **details))
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self._collectors.append(collector)
+
+    def counter(self, name: str, **labels) -> float:
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            return self._counters.get(key, 0.0)
+
+    def total(self, name: str) -> float:
+        """Сумма счётчика по всем значениям меток."""
+        with self._lock:
+            return sum(value for (counter, _), value in self._counters.items() if counter == name)
+
+    def stage_summary(self) -> Dict[str, dict]:
+        """Этап → число замеров и p50/p95 по последним замерам, мс."""
+        with self._lock:
+            recent = {stage: (hist["count"], list(hist["recent"])) for stage, hist in self._histograms.items()}
+        return {
+            stage: {"count": count, "p50": float(np.percentile(values, 50) * 1000),
+                    "p95": float(np.percentile(values, 95) * 1000)}
+            for stage, (count, values) in recent.items() if values
+        }
+
+    def render_prometheus(self) -> str:
+        """Текстовый формат экспозиции Prometheus."""
+        def labels_text(labels) -> str:
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels) + "}"
+
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = {stage: (list(h["buckets"]), h["count"], h["sum"]) for stage, h in self._histograms.items()}
+
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{labels_text(labels)} {value:g}")
+
+        if histograms:
+            lines.append("# TYPE rag_stage_seconds histogram")
+        for stage, (buckets, count, total) in sorted(histograms.items()):
+            for bound, value in zip(self.buckets, buckets):
+                lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {value}')
+            lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'rag_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'rag_stage_seconds_count{{stage="{stage}"}} {count}')
+
+        collected = {}
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    collected.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+            except Exception as e:
+                logger.warning("Коллектор метрик завершился ошибкой", extra=fields(error=str(e)))
+        for name, samples in sorted(collected.items()):
+            # Накопительные значения коллекторов (попадания кэшей и т.п.) по соглашению оканчиваются на _total
+            lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            for labels, value in samples:
+                lines.append(f"{name}{labels_text(labels)} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+# Общий реестр процесса: бот, AgenticRAGHandler и пулы пишут в него
+METRICS = Metrics()
+
+
+async def start_metrics_server(host: str, port: int, metrics: Metrics = METRICS):
+    """HTTP-эндпоинт /metrics в формате Prometheus на aiohttp (зависимость aiogram)."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Эндпоинт метрик запущен", extra=fields(url=f"http://{host}:{port}/metrics"))
+    return runner
@@ -0,0 +1,79 @@
+# plan_cache.py
+import re
+import copy
+import threading
+from typing import Optional
+
+import numpy as np
+
+from ttl_cache import TTLCache
+
+
+def normalize_query(query: str) -> str:
+    """Нормализация текста запроса: регистр, пробелы и концевая пунктуация."""
+    query = re.sub(r'\s+', ' ', query.lower()).strip()
+    return query.strip(' .,!?;:')
+
+
+class PlanCache:
+    """Кэш планов поиска: точное совпадение нормализованного запроса,
+    затем (опционально) ближайший по эмбеддингу запрос выше порога сходства."""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: Optional[float] = 3600,
+                 similarity_threshold: Optional[float] = None):
+        self.similarity_threshold = similarity_threshold
+        self._entries = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def uses_embeddings(self) -> bool:
+        return self.similarity_threshold is not None
+
+    def _semantic_lookup(self, embedding: np.ndarray):
+        entries = [(key, value) for key, value in self._entries.items() if value[1] is not None]
+        if not entries:
+            return None
+        matrix = np.stack([value[1] for _, value in entries])
+        query = embedding / (np.linalg.norm(embedding) or 1.0)
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        key, value = entries[best]
+        self._entries.touch(key)
+        return value[0]
+
+    def get(self, query: str, embedding: Optional[np.ndarray] = None) -> Optional[dict]:
+        """Возвращает копию закэшированного плана или None."""
+        entry = self._entries.get(normalize_query(query))
+        plan = entry[0] if entry is not None else None
+        with self._lock:
+            if plan is not None:
+                self.exact_hits += 1
+            elif self.uses_embeddings and embedding is not None:
+                plan = self._semantic_lookup(embedding)
+                if plan is not None:
+                    self.semantic_hits += 1
+            if plan is None:
+                self.misses += 1
+        return copy.deepcopy(plan) if plan is not None else None
+
+    def put(self, query: str, plan: dict, embedding: Optional[np.ndarray] = None):
+        if embedding is not None and self.uses_embeddings:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        else:
+            embedding = None
+        self._entries.put(normalize_query(query), (copy.deepcopy(plan), embedding))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+            }
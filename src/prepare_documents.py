@@ -1,6 +1,9 @@
 import json
 import re
 import os
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 
 def parse_experience_to_months(exp_str: str) -> int:
@@ -26,56 +29,65 @@ def extract_skills_from_experience(resume: dict) -> set:
                     skills.add(s.title())
     return skills
 
+TECH_SYNONYMS_PATH = os.getenv(
+    "TECH_SYNONYMS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tech_synonyms.json")
+)
+
+def load_tech_synonyms(path: str) -> dict:
+    """Загружает словарь «технология → синонимы» (JSON, синонимы в нижнем регистре)."""
+    with open(path, "r", encoding="utf-8") as f:
+        synonyms = json.load(f)
+    return {tech.lower(): [s.lower() for s in patterns] for tech, patterns in synonyms.items()}
+
+class TechMatcher:
+    """Поиск технологий за один проход по тексту с учётом границ слов.
+
+    Текст один раз режется на латинские токены, которые сверяются со словарём
+    синонимов через хеш-таблицу, — время не зависит от размера словаря.
+    Синонимы из нескольких слов или не латиницей проверяются отдельными
+    регулярными выражениями. Синоним засчитывается только целым словом:
+    'js' не находится внутри слов, 'go' — в 'google', 'java' — в 'javascript'.
+    Номер версии в конце токена отбрасывается: 'html5', 'python3', 'angular2+'
+    находятся как 'html', 'python', 'angular'.
+    """
+
+    TOKEN_RE = re.compile(r'[a-z0-9][a-z0-9_#+]*(?:\.[a-z0-9_#+]+)*')
+    VERSION_RE = re.compile(r'(?<=[a-z#+])\d+\+?$')
+
+    def __init__(self, synonyms: dict):
+        self.tokens = {}
+        self.phrases = []
+        for tech, patterns in synonyms.items():
+            for pattern in patterns:
+                if self.TOKEN_RE.fullmatch(pattern):
+                    self.tokens.setdefault(pattern, tech.title())
+                else:
+                    regex = re.compile(rf'(?<![\w#+.]){re.escape(pattern)}(?![\w#+])')
+                    self.phrases.append((pattern, tech.title(), regex))
+
+    @classmethod
+    def from_file(cls, path: str) -> "TechMatcher":
+        return cls(load_tech_synonyms(path))
+
+    def find(self, text: str) -> list:
+        if not text:
+            return []
+        text_lower = text.lower()
+        tokens = set(self.TOKEN_RE.findall(text_lower))
+        tokens |= {self.VERSION_RE.sub('', t) for t in tokens}
+        found = {self.tokens[t] for t in self.tokens.keys() & tokens}
+        for phrase, tech, regex in self.phrases:
+            if tech not in found and phrase in text_lower and regex.search(text_lower):
+                found.add(tech)
+        return list(found)
+
+# Технологии и их синонимы (в нижнем регистре)
+TECH_SYNONYMS = load_tech_synonyms(TECH_SYNONYMS_PATH)
+TECH_MATCHER = TechMatcher(TECH_SYNONYMS)
+
 def extract_tech_keywords(text: str) -> list:
     """Извлекает технологические ключевые слова из текста описания."""
-    if not text:
-        return []
-    tech_patterns = {
-        'react': ['react', 'react.js', 'reactjs'],
-        'vue': ['vue', 'vue.js', 'vuejs', 'nuxt', 'nuxt.js'],
-        'angular': ['angular'],
-        'jquery': ['jquery'],
-        'javascript': ['javascript', 'js', 'ecmascript'],
-        'typescript': ['typescript', 'ts'],
-        'python': ['python'],
-        'django': ['django'],
-        'flask': ['flask'],
-        'fastapi': ['fastapi'],
-        'node': ['node', 'node.js', 'nodejs'],
-        'java': ['java'],
-        'spring': ['spring'],
-        'c#': ['c#', 'c sharp'],
-        'php': ['php'],
-        'laravel': ['laravel'],
-        'ruby': ['ruby'],
-        'rails': ['rails'],
-        'go': ['go', 'golang'],
-        'docker': ['docker'],
-        'kubernetes': ['kubernetes', 'k8s'],
-        'aws': ['aws', 'amazon web services'],
-        'sql': ['sql', 'postgresql', 'mysql', 'oracle'],
-        'mongodb': ['mongodb', 'mongo'],
-        'redis': ['redis'],
-        'git': ['git', 'github', 'gitlab'],
-        'html': ['html'],
-        'css': ['css', 'sass', 'scss', 'less'],
-        'webpack': ['webpack'],
-        'redux': ['redux'],
-        'graphql': ['graphql'],
-        'rest': ['rest', 'rest api'],
-        'websocket': ['websocket'],
-        'ml': ['машинное обучение', 'ml', 'machine learning'],
-        'ai': ['искусственный интеллект', 'ai', 'artificial intelligence'],
-        'data science': ['data science']
-    }
-    text_lower = text.lower()
-    found_tech = set()
-    for tech, patterns in tech_patterns.items():
-        for pattern in patterns:
-            if pattern in text_lower:
-                found_tech.add(tech.title())
-                break  # Не ищем другие синонимы той же технологии
-    return list(found_tech)
+    return TECH_MATCHER.find(text)
 
 def extract_descriptions(resume: dict) -> str:
     seen = set()
@@ -88,7 +100,7 @@ def extract_descriptions(resume: dict) -> str:
             seen.add(d)
     return " ".join(descs)
 
-def extract_all_skills(resume: dict) -> list:
+def extract_all_skills(resume: dict, exp_text: str = None) -> list:
     skills = set()
     # 1. Основные навыки из раздела skills
     for s in (resume.get("skills") or []):
@@ -106,7 +118,8 @@ def extract_all_skills(resume: dict) -> list:
     if about_text:
         skills.update(extract_tech_keywords(about_text))
     # 5. Ключевые слова из текста описания опыта (самое важное!)
-    exp_text = extract_descriptions(resume)
+    if exp_text is None:
+        exp_text = extract_descriptions(resume)
     if exp_text:
         skills.update(extract_tech_keywords(exp_text))
     return sorted(skills)
@@ -125,98 +138,251 @@ def clean_location(loc: str) -> str:
         return ""
     return re.split(r'[,\–—]', loc)[0].strip()
 
-def process_resumes(input_path: str, output_dir: str):
+def build_document(resume: dict) -> tuple:
+    """Формирует текстовый документ и метаданные для одного резюме."""
+    res_id = resume.get("id", "")
+    url = resume.get("url", "").strip()
+    pos = resume.get("desired_position", "")
+    loc = clean_location(resume.get("location_relocation") or resume.get("personal_info", {}).get("location", ""))
+    exp_months = parse_experience_to_months(resume.get("total_experience", ""))
+    # === ОБРАБОТКА ОПИСАНИЯ ОПЫТА ===
+    experience_desc = extract_descriptions(resume)
+    # === ИЗВЛЕЧЕНИЕ НАВЫКОВ ===
+    skills_list = extract_all_skills(resume, experience_desc)
+    # === ОБРАБОТКА ОБРАЗОВАНИЯ ===
+    edu = extract_education(resume)
+    # === ФОРМИРОВАНИЕ БОГАТОГО ТЕКСТОВОГО ДОКУМЕНТА ===
+    doc_parts = []
+    # 1. Ключевая информация первой строкой (для релевантности)
+    if pos:
+        doc_parts.append(f"Ищу позицию: {pos}")
+    if skills_list:
+        # Навыки - В НАЧАЛЕ документа для повышения релевантности
+        doc_parts.append(f"Ключевые навыки: {', '.join(skills_list[:20])}")
+    # 2. Локация и опыт
+    if loc:
+        doc_parts.append(f"Локация: {loc}")
+    if exp_months > 0:
+        years = exp_months // 12
+        months = exp_months % 12
+        exp_text = f"{years} год{'а' if years % 10 in [2,3,4] and years % 100 not in [12,13,14] else 'ов'}" if years > 0 else ""
+        if months > 0:
+            exp_text += f" {months} месяц{'а' if months % 10 in [2,3,4] and months % 100 not in [12,13,14] else 'ев'}" if months > 0 else ""
+        doc_parts.append(f"Опыт работы: {exp_text.strip()}")
+    # 3. Описание опыта (основной контент)
+    if experience_desc:
+        clean_desc = re.sub(r'\s+', ' ', experience_desc)
+        if len(clean_desc) > 800:
+            clean_desc = clean_desc[:800] + "..."
+        doc_parts.append(f"Опыт работы: {clean_desc}")
+    # 4. Образование и дополнительная информация
+    if edu:
+        doc_parts.append(f"Образование: {edu}")
+    about = resume.get("additional_info", {}).get("about", "")
+    if about and len(about) > 30:
+        clean_about = re.sub(r'\s+', ' ', about)
+        if len(clean_about) > 200:
+            clean_about = clean_about[:200] + "..."
+        doc_parts.append(f"О себе: {clean_about}")
+    # 5. Специальность
+    specialty = resume.get("specialty_category", "")
+    if specialty:
+        doc_parts.append(f"Специализация: {specialty}")
+    # Формируем итоговый текст документа
+    doc_text = "\n".join(doc_parts)
+    # Минимальная проверка качества документа
+    if len(doc_text.strip()) < 100:
+        doc_text = f"Кандидат: {pos or 'не указана'}. Навыки: {', '.join(skills_list[:5]) if skills_list else 'не указаны'}. Город: {loc or 'не указан'}."
+    # Документ и метаданные (с полным списком навыков для фильтрации)
+    document = {"id": res_id, "text": doc_text}
+    metadata = {
+        "id": res_id,
+        "url": url,
+        "desired_position": pos,
+        "location": loc,
+        "total_experience_months": exp_months,
+        "skills": skills_list,  # Полный список навыков
+        "top_5_skills": skills_list[:5] if skills_list else [],
+        "specialty_category": specialty,
+        "education": edu
+    }
+    return document, metadata
+
+# Максимальная длина чанка в символах: ~256 токенов MiniLM для русского текста,
+# дальше энкодер обрезает вход
+CHUNK_MAX_CHARS = 600
+
+def split_text(text: str, max_chars: int = CHUNK_MAX_CHARS) -> list:
+    """Делит текст на куски не длиннее max_chars по границам предложений (длинные — по словам)."""
+    text = re.sub(r'\s+', ' ', text).strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+    pieces = []
+    current = ""
+    for sentence in re.split(r'(?<=[.!?;])\s+', text):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        pieces.append(current)
+    return pieces
+
+def build_chunks(resume: dict, metadata: dict, max_chars: int = CHUNK_MAX_CHARS) -> list:
+    """Чанки резюме по разделам: навыки, каждое место работы, образование, «о себе».
+
+    В отличие от документа, описания не обрезаются: длинный раздел делится на несколько
+    чанков, и каждый начинается с желаемой позиции, чтобы оставаться осмысленным отдельно.
+    """
+    res_id = metadata["id"]
+    header = f"Ищу позицию: {metadata['desired_position']}\n" if metadata["desired_position"] else ""
+    sections = []
+    if metadata["skills"]:
+        for part in split_text(", ".join(metadata["skills"]), max_chars):
+            sections.append(("skills", f"Ключевые навыки: {part}"))
+    seen = set()
+    for exp in resume.get("experience_details", []):
+        desc = re.sub(r'\s+', ' ', exp.get("description", "")).strip()
+        if not desc or desc in seen:
+            continue
+        seen.add(desc)
+        period = exp.get("period", "").strip()
+        # Строка «Уровни владения навыками…» — это не период, а склеенный список навыков
+        label = f"Опыт работы ({period})" if period and not period.lower().startswith("уровни владения") else "Опыт работы"
+        for part in split_text(desc, max_chars):
+            sections.append(("experience", f"{label}: {part}"))
+    if metadata["education"]:
+        for part in split_text(metadata["education"], max_chars):
+            sections.append(("education", f"Образование: {part}"))
+    about = resume.get("additional_info", {}).get("about", "")
+    if about and len(about) > 30:
+        for part in split_text(about, max_chars):
+            sections.append(("about", f"О себе: {part}"))
+    return [
+        {"id": f"{res_id}#{n}", "parent_id": res_id, "section": section, "text": header + text}
+        for n, (section, text) in enumerate(sections)
+    ]
+
+def iter_resumes(input_path: str):
+    """Потоково читает резюме из JSONL (по строке) или JSON {"resumes": [...]} через ijson.
+
+    Без ijson JSON-файл загружается целиком, как раньше.
+    """
+    if input_path.endswith(".jsonl"):
+        with open(input_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    try:
+        import ijson
+    except ImportError:
+        print("⚠️ ijson не установлен: файл будет загружен в память целиком (pip install ijson)")
+        with open(input_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        yield from data.get("resumes", [])
+        return
+    with open(input_path, 'rb') as f:
+        yield from ijson.items(f, "resumes.item", use_float=True)
+
+def _chunked(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _build_record(resume: dict, chunk_chars: int = 0) -> tuple:
+    document, metadata = build_document(resume)
+    return document, metadata, build_chunks(resume, metadata, chunk_chars) if chunk_chars else []
+
+def _build_chunk(resumes: list, chunk_chars: int = 0) -> list:
+    return [_build_record(resume, chunk_chars) for resume in resumes]
+
+def iter_documents(input_path: str, workers: int = 1, chunk_size: int = 256, chunk_chars: int = 0):
+    """Документы, метаданные и чанки (если chunk_chars > 0) в порядке входного файла.
+
+    При workers > 1 резюме обрабатываются пачками в пуле процессов; в работе
+    не больше 2 * workers пачек, поэтому потребление памяти остаётся ограниченным.
+    """
+    resumes = iter_resumes(input_path)
+    if workers <= 1:
+        for resume in resumes:
+            yield _build_record(resume, chunk_chars)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in _chunked(resumes, chunk_size):
+            pending.append(pool.submit(_build_chunk, chunk, chunk_chars))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def process_resumes(input_path: str, output_dir: str, workers: int = 1, chunk_size: int = 256,
+                    chunk_chars: int = 0):
     os.makedirs(output_dir, exist_ok=True)
-    with open(input_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    resumes = data.get("resumes", [])
-    print(f"Найдено {len(resumes)} резюме. Обработка...")
-    documents = []
-    metadata_list = []
-    for resume in tqdm(resumes):
-        res_id = resume.get("id", "")
-        url = resume.get("url", "").strip()
-        pos = resume.get("desired_position", "")
-        loc = clean_location(resume.get("location_relocation") or resume.get("personal_info", {}).get("location", ""))
-        exp_months = parse_experience_to_months(resume.get("total_experience", ""))
-        # === ИЗВЛЕЧЕНИЕ НАВЫКОВ ===
-        skills_list = extract_all_skills(resume)
-        # === ОБРАБОТКА ОПИСАНИЯ ОПЫТА ===
-        experience_desc = extract_descriptions(resume)
-        # === ОБРАБОТКА ОБРАЗОВАНИЯ ===
-        edu = extract_education(resume)
-        # === ФОРМИРОВАНИЕ БОГАТОГО ТЕКСТОВОГО ДОКУМЕНТА ===
-        doc_parts = []
-        # 1. Ключевая информация первой строкой (для релевантности)
-        if pos:
-            doc_parts.append(f"Ищу позицию: {pos}")
-        if skills_list:
-            # Навыки - В НАЧАЛЕ документа для повышения релевантности
-            doc_parts.append(f"Ключевые навыки: {', '.join(skills_list[:20])}")
-        # 2. Локация и опыт
-        if loc:
-            doc_parts.append(f"Локация: {loc}")
-        if exp_months > 0:
-            years = exp_months // 12
-            months = exp_months % 12
-            exp_text = f"{years} год{'а' if years % 10 in [2,3,4] and years % 100 not in [12,13,14] else 'ов'}" if years > 0 else ""
-            if months > 0:
-                exp_text += f" {months} месяц{'а' if months % 10 in [2,3,4] and months % 100 not in [12,13,14] else 'ев'}" if months > 0 else ""
-            doc_parts.append(f"Опыт работы: {exp_text.strip()}")
-        # 3. Описание опыта (основной контент)
-        if experience_desc:
-            clean_desc = re.sub(r'\s+', ' ', experience_desc)
-            if len(clean_desc) > 800:
-                clean_desc = clean_desc[:800] + "..."
-            doc_parts.append(f"Опыт работы: {clean_desc}")
-        # 4. Образование и дополнительная информация
-        if edu:
-            doc_parts.append(f"Образование: {edu}")
-        about = resume.get("additional_info", {}).get("about", "")
-        if about and len(about) > 30:
-            clean_about = re.sub(r'\s+', ' ', about)
-            if len(clean_about) > 200:
-                clean_about = clean_about[:200] + "..."
-            doc_parts.append(f"О себе: {clean_about}")
-        # 5. Специальность
-        specialty = resume.get("specialty_category", "")
-        if specialty:
-            doc_parts.append(f"Специализация: {specialty}")
-        # Формируем итоговый текст документа
-        doc_text = "\n".join(doc_parts)
-        # Минимальная проверка качества документа
-        if len(doc_text.strip()) < 100:
-            doc_text = f"Кандидат: {pos or 'не указана'}. Навыки: {', '.join(skills_list[:5]) if skills_list else 'не указаны'}. Город: {loc or 'не указан'}."
-        # Сохраняем документ
-        documents.append({"id": res_id, "text": doc_text})
-        # Сохраняем метаданные (с полным списком навыков для фильтрации)
-        metadata_list.append({
-            "id": res_id,
-            "url": url,
-            "desired_position": pos,
-            "location": loc,
-            "total_experience_months": exp_months,
-            "skills": skills_list,  # Полный список навыков
-            "top_5_skills": skills_list[:5] if skills_list else [],
-            "specialty_category": specialty,
-            "education": edu
-        })
-    # Сохранение результатов
-    with open(os.path.join(output_dir, "documents.jsonl"), "w", encoding="utf-8") as f:
-        for doc in documents:
-            f.write(json.dumps(doc, ensure_ascii=False) + "\n")
-    with open(os.path.join(output_dir, "metadata.jsonl"), "w", encoding="utf-8") as f:
-        for meta in metadata_list:
-            f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+    print(f"Обработка резюме из {input_path} (процессов: {workers})...")
+    # Документы пишутся по мере обработки, статистика считается нарастающим итогом,
+    # поэтому потребление памяти не зависит от размера выгрузки
+    total = 0
+    with_skills = 0
+    skills_count = 0
+    skills_list = []
+    chunks_count = 0
+    chunks_path = os.path.join(output_dir, "chunks.jsonl")
+    if not chunk_chars and os.path.exists(chunks_path):
+        # Чанки от прошлого запуска не соответствуют новым документам
+        os.remove(chunks_path)
+    with open(os.path.join(output_dir, "documents.jsonl"), "w", encoding="utf-8") as f_doc, \
+         open(os.path.join(output_dir, "metadata.jsonl"), "w", encoding="utf-8") as f_meta, \
+         (open(chunks_path, "w", encoding="utf-8") if chunk_chars else open(os.devnull, "w")) as f_chunks:
+        for document, metadata, chunks in tqdm(iter_documents(input_path, workers, chunk_size, chunk_chars)):
+            f_doc.write(json.dumps(document, ensure_ascii=False) + "\n")
+            f_meta.write(json.dumps(metadata, ensure_ascii=False) + "\n")
+            for chunk in chunks:
+                f_chunks.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            chunks_count += len(chunks)
+            skills_list = metadata["skills"]
+            total += 1
+            with_skills += 1 if skills_list else 0
+            skills_count += len(skills_list)
+    avg_skills = skills_count / total if total else 0
     with open(os.path.join(output_dir, "stats.json"), "w", encoding="utf-8") as f:
         json.dump({
-            "total": len(resumes),
-            "with_skills": sum(1 for m in metadata_list if m["skills"]),
-            "avg_skills_per_resume": sum(len(m["skills"]) for m in metadata_list) / len(metadata_list) if metadata_list else 0,
+            "total": total,
+            "with_skills": with_skills,
+            "avg_skills_per_resume": avg_skills,
             "sample_skills": skills_list[:10] if skills_list else []  # Пример извлеченных навыков
         }, f, ensure_ascii=False, indent=2)
-    print(f"✅ Готово! Обработано {len(resumes)} резюме.")
-    print(f"📊 Статистика: среднее количество навыков на резюме: {sum(len(m['skills']) for m in metadata_list) / len(metadata_list):.1f}")
+    print(f"✅ Готово! Обработано {total} резюме.")
+    print(f"📊 Статистика: среднее количество навыков на резюме: {avg_skills:.1f}")
+    if chunk_chars:
+        print(f"🧩 Чанков: {chunks_count} ({chunks_count / total if total else 0:.1f} на резюме)")
 
 if __name__ == "__main__":
-    process_resumes("./data/resumes.json", "./data/processed")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Подготовка документов из выгрузки резюме hh.ru")
+    parser.add_argument("--input", default="./data/resumes.json",
+                        help="JSON {\"resumes\": [...]} или JSONL с одним резюме на строку")
+    parser.add_argument("--output", default="./data/processed")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Число процессов; результат идентичен последовательному запуску")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Резюме в одной пачке для процесса")
+    parser.add_argument("--chunks", action="store_true",
+                        help="Дополнительно записать chunks.jsonl: разделы резюме без обрезки для мультивекторного поиска")
+    parser.add_argument("--chunk-chars", type=int, default=CHUNK_MAX_CHARS, help="Максимальная длина чанка в символах")
+    args = parser.parse_args()
+    process_resumes(args.input, args.output, args.workers, args.chunk_size,
+                    args.chunk_chars if args.chunks else 0)
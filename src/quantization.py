@@ -0,0 +1,65 @@
+# quantization.py
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Поддерживаемые типы хранения эмбеддингов: байт на компоненту 4 / 2 / 1
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+
+def quantize(embeddings: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Эмбеддинги в тип хранения; для int8 — симметричное квантование с масштабом на вектор.
+
+    Возвращает (коды, масштабы); масштабы есть только у int8: x ≈ codes * scale.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if dtype == "int8":
+        scales = np.abs(embeddings).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Неизвестный тип хранения эмбеддингов: {dtype}")
+    return embeddings.astype(dtype), None
+
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    vectors = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        vectors = vectors * np.asarray(scales, dtype=np.float32)[:, None]
+    return vectors
+
+
+def recall_at_k(expected: List[List[str]], found: List[List[str]], k: int) -> float:
+    """Средняя доля точного top-k, найденная приближённым поиском."""
+    if not expected:
+        return 0.0
+    total = 0.0
+    for exact, approx in zip(expected, found):
+        exact = exact[:k]
+        if exact:
+            total += len(set(exact) & set(approx[:k])) / len(exact)
+    return total / len(expected)
+
+
+def recall_report(embeddings: np.ndarray, ids: List[str], backend, queries: np.ndarray,
+                  ks=(1, 10, 50)) -> dict:
+    """recall@k хранилища относительно точного поиска по float32.
+
+    queries — эмбеддинги запросов, а не векторы самого корпуса: документ-запрос
+    находит сам себя с оценкой 1 при любом квантовании и завышает recall@1.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = embeddings / np.where(norms == 0, 1, norms)
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = queries / np.where(query_norms == 0, 1, query_norms)
+    max_k = min(max(ks), len(ids))
+
+    scores = queries @ normalized.T
+    top = np.argsort(-scores, axis=1, kind="stable")[:, :max_k]
+    expected = [[ids[row] for row in order] for order in top]
+    # Пустой include хранилища заменяют набором по умолчанию; расстояния не требуют чтения записей
+    found = backend.query(queries, n_results=max_k, include=["distances"])["ids"]
+    return {k: recall_at_k(expected, found, k) for k in ks if k <= max_k}
@@ -0,0 +1,85 @@
+# replay_llm.py
+import os
+import json
+import time
+import hashlib
+import threading
+from types import SimpleNamespace
+from typing import Iterator
+
+LLM_REPLAY_PATH = "./data/eval/llm_replay.jsonl"
+# Ответ на промпт без записи: план из него не разбирается (агент возьмёт план по умолчанию),
+# а анализ выбирает первые три резюме — результат детерминирован
+MISSING_RESPONSE = "**Анализ:**\n1, 2, 3 - записанный ответ не найден"
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def _response(content: str) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def _chunk(content: str) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class ReplayGigaChat:
+    """Локальная замена клиента GigaChat для бенчмарков: ответы по хешу промпта из JSONL.
+
+    С client (настоящий GigaChat) работает в режиме записи: на промах вызывает
+    клиента и дописывает ответ в файл. latency_ms имитирует фиксированную задержку сети.
+    """
+
+    def __init__(self, path: str = LLM_REPLAY_PATH, client=None, latency_ms: float = 0.0):
+        self.path = path
+        self.client = client
+        self.latency_ms = latency_ms
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._responses = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._responses[record["key"]] = record["response"]
+
+    def _content(self, prompt: str) -> str:
+        key = prompt_key(prompt)
+        with self._lock:
+            content = self._responses.get(key)
+            if content is not None:
+                self.hits += 1
+        if content is None:
+            with self._lock:
+                self.misses += 1
+            if self.client is not None:
+                return self._record(prompt, key)
+            content = MISSING_RESPONSE
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return content
+
+    def _record(self, prompt: str, key: str) -> str:
+        content = self.client.chat(prompt).choices[0].message.content
+        with self._lock:
+            self._responses[key] = content
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "prompt": prompt[:200], "response": content},
+                                   ensure_ascii=False) + "\n")
+        return content
+
+    def chat(self, prompt: str) -> SimpleNamespace:
+        return _response(self._content(prompt))
+
+    def stream(self, prompt: str) -> Iterator[SimpleNamespace]:
+        """Записанный ответ фрагментами по строкам, как потоковый ответ GigaChat."""
+        for line in self._content(prompt).splitlines(keepends=True):
+            yield _chunk(line)
+
+    def stats(self) -> dict:
+        return {"responses": len(self._responses), "hits": self.hits, "misses": self.misses}
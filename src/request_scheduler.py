@@ -0,0 +1,86 @@
+# request_scheduler.py
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+
+from plan_cache import normalize_query
+
+BUSY_MESSAGE = "⏳ Сейчас много запросов. Пожалуйста, повторите через минуту."
+USER_BUSY_MESSAGE = "⏳ Предыдущий запрос ещё обрабатывается. Дождитесь ответа и попробуйте снова."
+
+
+class SchedulerBusy(Exception):
+    """Запрос отклонён планировщиком; текст исключения — ответ пользователю."""
+
+
+class RequestScheduler:
+    """Планировщик поисковых запросов бота.
+
+    Одинаковые (после нормализации) запросы, пришедшие во время обработки, ждут
+    одного вычисления вместо повторного поиска и вызова LLM. Число одновременных
+    запросов пользователя и число разных вычислений в работе ограничены: сверх
+    лимита запрос сразу получает ответ «занято», а не копится в очереди.
+    """
+
+    def __init__(self, max_pending: int = 32, max_per_user: int = 2, max_llm_calls: int = 4):
+        self.max_pending = max_pending
+        self.max_per_user = max_per_user
+        # Общий лимит одновременных вызовов GigaChat; передаётся в AgenticRAGHandler
+        self.llm_semaphore = asyncio.Semaphore(max_llm_calls)
+        self.max_llm_calls = max_llm_calls
+        self._flights: Dict[str, asyncio.Task] = {}
+        self._per_user: Dict[Hashable, int] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.rejected_busy = 0
+        self.rejected_user = 0
+        self.max_pending_seen = 0
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+
+    async def run(self, user_id: Hashable, query: str, handler: Callable[[str], Awaitable[str]]) -> str:
+        """Выполняет handler(query) или присоединяется к уже идущему вычислению того же запроса.
+
+        Бросает SchedulerBusy до начала работы, если превышен лимит пользователя или очереди.
+        """
+        if self._per_user.get(user_id, 0) >= self.max_per_user:
+            self.rejected_user += 1
+            raise SchedulerBusy(USER_BUSY_MESSAGE)
+
+        key = normalize_query(query)
+        task = self._flights.get(key)
+        if task is None:
+            if len(self._flights) >= self.max_pending:
+                self.rejected_busy += 1
+                raise SchedulerBusy(BUSY_MESSAGE)
+            task = asyncio.ensure_future(handler(query))
+            self._flights[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+            self.started += 1
+            self.max_pending_seen = max(self.max_pending_seen, len(self._flights))
+        else:
+            self.coalesced += 1
+
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        try:
+            # shield: отмена ожидания одним пользователем не прерывает вычисление для остальных
+            return await asyncio.shield(task)
+        finally:
+            self._per_user[user_id] -= 1
+            if not self._per_user[user_id]:
+                del self._per_user[user_id]
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._flights),
+            "max_pending": self.max_pending,
+            "max_pending_seen": self.max_pending_seen,
+            "users": len(self._per_user),
+            "llm_in_use": self.max_llm_calls - self.llm_semaphore._value,
+            "max_llm_calls": self.max_llm_calls,
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "rejected_busy": self.rejected_busy,
+            "rejected_user": self.rejected_user,
+        }
@@ -0,0 +1,144 @@
+# reranker.py
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+from bm25_index import tokenize
+from metadata_schema import split_skills
+from rule_planner import normalize_city
+from skill_index import skill_keys
+
+# Веса признаков, как в системе оценки README: навыки, опыт, город, должность; плюс ранг поиска.
+# Признак, которого нет в плане (например, город), не участвует в нормировке
+FEATURE_WEIGHTS = {
+    "skills": 0.4,
+    "experience": 0.2,
+    "location": 0.15,
+    "terms": 0.1,
+    "retrieval": 0.15,
+}
+
+
+def _sigmoid(x: float) -> float:
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+class Reranker:
+    """Переранжирование кандидатов на CPU перед анализом GigaChat.
+
+    Оценка в [0, 1] — взвешенные признаки из метаданных (доля требуемых навыков,
+    соответствие опыту и городу, пересечение слов запроса с должностью и навыками,
+    ранг векторного поиска). С cross_encoder оценка усредняется с вероятностью
+    релевантности пары (запрос, резюме); если кросс-энкодер не уложился в бюджет
+    времени, используются только признаки.
+    """
+
+    def __init__(self, top_k: int = 5, min_score: float = 0.5, min_results: int = 3,
+                 cross_encoder=None, batch_size: int = 16, budget_ms: Optional[float] = 300,
+                 weights: Optional[Dict[str, float]] = None):
+        self.top_k = top_k
+        self.min_score = min_score
+        self.min_results = min_results
+        self.cross_encoder = cross_encoder
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.weights = weights or FEATURE_WEIGHTS
+        self.calls = 0
+        self.candidates_in = 0
+        self.candidates_out = 0
+        self.over_budget = 0
+
+    def _features(self, resume: Dict[str, Any], rank: int, total: int, required_skills: List[str],
+                  city: Optional[str], min_months: Optional[int], query_terms: List[set]) -> Dict[str, float]:
+        features = {"retrieval": 1.0 - rank / max(total, 1)}
+
+        if required_skills:
+            keys = set()
+            for skill in split_skills(resume["skills"]):
+                keys |= skill_keys(skill)
+            matched = sum(1 for skill in required_skills if skill_keys(skill) & keys)
+            features["skills"] = matched / len(required_skills)
+
+        if min_months:
+            features["experience"] = min(1.0, (resume["experience_months"] or 0) / min_months)
+
+        if city:
+            features["location"] = 1.0 if (resume["location"] or "").lower() == city else 0.0
+
+        if query_terms:
+            doc_terms = set(tokenize(f"{resume['position']} {resume['skills']}"))
+            features["terms"] = max(len(terms & doc_terms) / len(terms) for terms in query_terms)
+        return features
+
+    def _weighted(self, features: Dict[str, float]) -> float:
+        total = sum(self.weights[name] for name in features)
+        return sum(self.weights[name] * value for name, value in features.items()) / total
+
+    def _cross_scores(self, user_query: str, resumes: List[Dict[str, Any]]) -> Optional[List[float]]:
+        """Оценки кросс-энкодера батчами; None, если бюджет времени исчерпан.
+
+        Бюджет проверяется после каждого батча: уже запущенный predict не прерывается,
+        но его результат не используется, а оставшиеся батчи не запускаются.
+        """
+        pairs = [(user_query, f"{r['position']}. {r['skills']}. {r['text'][:500]}") for r in resumes]
+        started = time.perf_counter()
+        scores = []
+        for start in range(0, len(pairs), self.batch_size):
+            batch = self.cross_encoder.predict(pairs[start:start + self.batch_size],
+                                               batch_size=self.batch_size, show_progress_bar=False)
+            if self.budget_ms and (time.perf_counter() - started) * 1000 > self.budget_ms:
+                self.over_budget += 1
+                return None
+            scores.extend(_sigmoid(float(score)) for score in batch)
+        return scores
+
+    def rerank(self, user_query: str, plan: dict, resumes: List[Dict[str, Any]],
+               required_skills: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Лучшие top_k резюме с оценкой не ниже min_score (но не меньше min_results);
+        оценка записывается в поле "score"."""
+        if not resumes:
+            return resumes
+        plan_filters = plan.get("filters", {}) or {}
+        location = plan_filters.get("location")
+        city = None
+        if location and str(location).lower() not in ("null", "none"):
+            city = normalize_city(location) or str(location).lower()
+        try:
+            min_months = int(plan_filters.get("min_experience_years") or 0) * 12
+        except (ValueError, TypeError):
+            min_months = 0
+        query_terms = [set(terms) for terms in
+                       (tokenize(query) for query in plan.get("search_queries", [user_query])) if terms]
+
+        scores = [self._weighted(self._features(r, rank, len(resumes), required_skills or [], city,
+                                                min_months, query_terms))
+                  for rank, r in enumerate(resumes)]
+        if self.cross_encoder is not None:
+            cross = self._cross_scores(user_query, resumes)
+            if cross is not None:
+                scores = [(feature + model) / 2 for feature, model in zip(scores, cross)]
+
+        order = sorted(range(len(resumes)), key=lambda i: -scores[i])
+        selected = [i for i in order if scores[i] >= self.min_score][:self.top_k]
+        if len(selected) < self.min_results:
+            selected = order[:min(self.min_results, self.top_k)]
+
+        self.calls += 1
+        self.candidates_in += len(resumes)
+        self.candidates_out += len(selected)
+        return [dict(resumes[i], score=round(scores[i], 3)) for i in selected]
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "candidates_in": self.candidates_in,
+            "candidates_out": self.candidates_out,
+            "over_budget": self.over_budget,
+            "cross_encoder": self.cross_encoder is not None,
+        }
+
+
+def load_cross_encoder(model_name: str):
+    """CrossEncoder из sentence-transformers на CPU (нужен только при заданной модели)."""
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name, device="cpu")
@@ -0,0 +1,100 @@
+# result_cache.py
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from ttl_cache import TTLCache
+
+BUILD_INFO_PATH = "./vectorstore/build_info.json"
+
+
+def write_build_info(version: str, path: str = BUILD_INFO_PATH, **details):
+    """Сохраняет версию сборки индексов; бот сбрасывает по ней кэш результатов."""
+    info = {"build_version": version, "built_at": datetime.now().isoformat(timespec="seconds"), **details}
+    # Через временный файл: бот не прочитает недописанный JSON
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class BuildVersion:
+    """Текущая версия сборки из build_info.json.
+
+    Файл перечитывается только при изменении mtime, поэтому проверка на каждом
+    запросе стоит одного os.stat; пересборка индексов меняет версию без перезапуска бота.
+    """
+
+    def __init__(self, path: str = BUILD_INFO_PATH):
+        self.path = path
+        self._mtime = None
+        self._version = ""
+        self._lock = threading.Lock()
+
+    def current(self) -> str:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return ""
+        with self._lock:
+            if mtime != self._mtime:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        self._version = json.load(f).get("build_version", "")
+                except (OSError, ValueError):
+                    self._version = ""
+                self._mtime = mtime
+            return self._version
+
+
+def plan_key(*parts: Any) -> str:
+    """Стабильный ключ плана: части сериализуются в JSON с сортировкой ключей."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Двухуровневый кэш ответов: план → id найденных резюме, (план, id резюме) → анализ LLM.
+
+    Ключи обоих уровней включают версию сборки индексов: после пересборки старые
+    записи перестают находиться и вытесняются по LRU или TTL.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: Optional[float] = 3600,
+                 build_version: Optional[BuildVersion] = None):
+        self.build_version = build_version or BuildVersion()
+        self._results = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._answers = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    def _results_key(self, key: str) -> Tuple[str, str]:
+        return self.build_version.current(), key
+
+    def _answers_key(self, key: str, resume_ids: List[str]) -> Tuple[str, str, Tuple[str, ...]]:
+        return self.build_version.current(), key, tuple(resume_ids)
+
+    def get_results(self, key: str) -> Optional[List[str]]:
+        ids = self._results.get(self._results_key(key))
+        return list(ids) if ids is not None else None
+
+    def put_results(self, key: str, resume_ids: List[str]):
+        self._results.put(self._results_key(key), tuple(resume_ids))
+
+    def get_answer(self, key: str, resume_ids: List[str]) -> Optional[str]:
+        return self._answers.get(self._answers_key(key, resume_ids))
+
+    def put_answer(self, key: str, resume_ids: List[str], answer: str):
+        self._answers.put(self._answers_key(key, resume_ids), answer)
+
+    def clear(self):
+        self._results.clear()
+        self._answers.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "build_version": self.build_version.current(),
+            "results": self._results.stats(),
+            "answers": self._answers.stats(),
+        }
@@ -0,0 +1,533 @@
+# retrieval_backend.py
+import os
+import json
+import time
+import shutil
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from skill_index import skill_keys
+from quantization import quantize, dequantize
+
+NUMPY_STORE_PATH = "./vectorstore/numpy_store"
+NUMPY_CHUNK_STORE_PATH = "./vectorstore/numpy_store_chunks"
+
+# Строковые поля с небольшим числом различных значений (город, должность) хранятся как коды
+# словаря и фильтруются векторно; почти уникальные (id, all_skills) проверяются по записям
+CATEGORICAL_MAX_VALUES = 65536
+# Выше этого размера коллекции используется HNSW-индекс (если установлен hnswlib)
+ANN_MIN_ROWS = 50000
+# Сколько самых частых навыков попадает в битовую матрицу навыков
+SKILL_BITS_MAX = 2048
+# Псевдополе where для NumpyBackend: «есть хотя бы один из навыков» по битовой матрице
+SKILLS_FIELD = "$skills"
+# Во сколько раз больше кандидатов отбирается по квантованным векторам для пересчёта точными
+RESCORE_FACTOR = 4
+# Блок строк для точного поиска: ограничивает временный float32-буфер при хранении в float16
+SCAN_BLOCK_ROWS = 65536
+
+try:
+    import hnswlib
+except ImportError:  # pragma: no cover - необязательная зависимость
+    hnswlib = None
+
+
+class RetrievalBackend:
+    """Интерфейс хранилища резюме для AgenticRAGHandler.
+
+    Методы повторяют подмножество API коллекции ChromaDB: query по эмбеддингам,
+    get по id и/или where, count. Результаты имеют ту же форму, что у ChromaDB.
+    """
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[dict] = None,
+              include: Optional[List[str]] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None,
+            include: Optional[List[str]] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def skill_filter(self, skills: List[str]) -> Optional[dict]:
+        """Условие where «есть хотя бы один из навыков», если бэкенд умеет проверять его сам."""
+        return None
+
+
+class ChromaBackend(RetrievalBackend):
+    """Обёртка над коллекцией ChromaDB."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[dict] = None,
+              include: Optional[List[str]] = None) -> Dict[str, Any]:
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where,
+                                     include=include or ["documents", "metadatas", "distances"])
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None,
+            include: Optional[List[str]] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None) -> Dict[str, Any]:
+        return self.collection.get(ids=ids, where=where, include=include or ["documents", "metadatas"],
+                                   limit=limit, offset=offset)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+
+def as_backend(store) -> RetrievalBackend:
+    """Коллекцию ChromaDB оборачивает в ChromaBackend, готовый бэкенд возвращает как есть."""
+    return store if isinstance(store, RetrievalBackend) else ChromaBackend(store)
+
+
+class NumpyBackend(RetrievalBackend):
+    """Хранилище в памяти процесса: эмбеддинги в memory-mapped .npy, метаданные по столбцам.
+
+    Файлы открываются через np.load(mmap_mode="r"), поэтому старт занимает миллисекунды,
+    а несколько процессов бота делят одни и те же страницы в page cache.
+    Поиск точный (матричное умножение по строкам, прошедшим where); для больших
+    коллекций при наличии hnswlib используется HNSW-индекс.
+    """
+
+    def __init__(self, path: str = NUMPY_STORE_PATH):
+        # path — символическая ссылка на каталог версии (см. build); файлы, которые читаются
+        # лениво (столбцы), берутся из той же версии, даже если ссылку уже переключили
+        self.path = os.path.realpath(path)
+        path = self.path
+        with open(os.path.join(path, "schema.json"), "r", encoding="utf-8") as f:
+            self.schema = json.load(f)
+        self.embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        # int8: масштаб каждого вектора; пересчёт: копия эмбеддингов точнее хранимой,
+        # с диска читаются только строки кандидатов
+        self._scales = self._load_optional("scales.npy")
+        self._rescore = self._load_optional("embeddings_rescore.npy")
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self._record_offsets = np.load(os.path.join(path, "record_offsets.npy"), mmap_mode="r")
+        self._records = np.memmap(os.path.join(path, "records.bin"), dtype=np.uint8, mode="r") \
+            if self._record_offsets[-1] else np.empty(0, dtype=np.uint8)
+        self._columns = {}
+        self._row_of = None
+        self._skill_positions = {skill: i for i, skill in enumerate(self.schema.get("skills", []))}
+        self._skill_bits = np.load(os.path.join(path, "skill_bits.npy"), mmap_mode="r") \
+            if self._skill_positions else None
+        self._hnsw = None
+        if hnswlib is not None and os.path.exists(os.path.join(path, "hnsw.bin")):
+            self._hnsw = hnswlib.Index(space="ip", dim=self.embeddings.shape[1])
+            self._hnsw.load_index(os.path.join(path, "hnsw.bin"), max_elements=len(self.ids))
+
+    def _load_optional(self, name: str):
+        file_path = os.path.join(self.path, name)
+        return np.load(file_path, mmap_mode="r") if os.path.exists(file_path) else None
+
+    @staticmethod
+    def build(path: str, ids: List[str], embeddings: np.ndarray, documents: List[str],
+              metadatas: List[dict], dtype: str = "float32", hnsw: Optional[bool] = None,
+              skills_per_doc: Optional[List[List[str]]] = None, rescore_dtype: Optional[str] = None):
+        """Записывает хранилище: эмбеддинги (нормированные), записи, столбцы метаданных
+        и битовую матрицу навыков (строка — навык, биты — резюме).
+
+        dtype — тип хранения (float32, float16, int8 с масштабом на вектор); rescore_dtype —
+        тип копии для пересчёта лучших кандидатов, None — без пересчёта.
+
+        Файлы пишутся в новый каталог версии рядом с path, а path переключается на него
+        атомарной заменой символической ссылки: работающий бот, отобразивший в память
+        прежнюю версию, не видит недописанных файлов и переоткрывает хранилище сам.
+        """
+        link_path = path.rstrip(os.sep)
+        path = f"{link_path}.v{time.time_ns()}"
+        os.makedirs(path)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.where(norms == 0, 1, norms)
+        codes, scales = quantize(embeddings, dtype)
+        np.save(os.path.join(path, "embeddings.npy"), codes)
+        for name, data in [("scales.npy", scales),
+                           ("embeddings_rescore.npy", quantize(embeddings, rescore_dtype)[0]
+                            if rescore_dtype and rescore_dtype != dtype else None)]:
+            if data is not None:
+                np.save(os.path.join(path, name), data)
+        np.save(os.path.join(path, "ids.npy"), np.array(ids, dtype=str))
+
+        # Документ и метаданные строки в JSON подряд; смещения позволяют читать только нужные строки
+        offsets = [0]
+        with open(os.path.join(path, "records.bin"), "wb") as f:
+            for doc, meta in zip(documents, metadatas):
+                data = json.dumps([doc, meta], ensure_ascii=False).encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        np.save(os.path.join(path, "record_offsets.npy"), np.array(offsets, dtype=np.int64))
+
+        columns = {}
+        for name in sorted({key for meta in metadatas for key in meta}):
+            values = [meta.get(name) for meta in metadatas]
+            present = np.array([v is not None for v in values])
+            kinds = {type(v) for v in values if v is not None}
+            if kinds == {bool}:
+                data, kind = np.array([bool(v) for v in values]), "bool"
+            elif kinds <= {int, float} and kinds:
+                numbers = [v if v is not None else 0 for v in values]
+                if kinds == {int} and -2**31 <= min(numbers) and max(numbers) < 2**31:
+                    # Коды городов, месяцы опыта и корзины — int32: вдвое компактнее float64
+                    data = np.array(numbers, dtype=np.int32)
+                else:
+                    data = np.array(numbers, dtype=np.float64)
+                kind = "number"
+            elif kinds == {str}:
+                vocab = sorted({v for v in values if v is not None})
+                if len(vocab) > min(CATEGORICAL_MAX_VALUES, max(16, len(values) // 2)):
+                    continue
+                codes = {v: i for i, v in enumerate(vocab)}
+                data, kind = np.array([codes.get(v, -1) for v in values], dtype=np.int32), "string"
+                columns[name] = {"kind": kind, "vocab": vocab}
+            else:
+                continue
+            columns.setdefault(name, {"kind": kind})
+            np.save(os.path.join(path, f"col_{name}.npy"), data)
+            if not present.all():
+                np.save(os.path.join(path, f"col_{name}.present.npy"), present)
+            columns[name]["has_missing"] = not present.all()
+
+        skills = []
+        if skills_per_doc is not None:
+            keys_per_doc = []
+            counts = {}
+            for doc_skills in skills_per_doc:
+                keys = set()
+                for skill in doc_skills:
+                    keys |= skill_keys(skill)
+                keys_per_doc.append(keys)
+                for key in keys:
+                    counts[key] = counts.get(key, 0) + 1
+            skills = sorted(counts, key=lambda key: (-counts[key], key))[:SKILL_BITS_MAX]
+            positions = {skill: i for i, skill in enumerate(skills)}
+            matrix = np.zeros((len(skills), len(ids)), dtype=bool)
+            for row, keys in enumerate(keys_per_doc):
+                for key in keys:
+                    if key in positions:
+                        matrix[positions[key], row] = True
+            np.save(os.path.join(path, "skill_bits.npy"), np.packbits(matrix, axis=1))
+
+        use_hnsw = hnsw if hnsw is not None else len(ids) >= ANN_MIN_ROWS
+        if use_hnsw and hnswlib is not None:
+            index = hnswlib.Index(space="ip", dim=embeddings.shape[1])
+            index.init_index(max_elements=len(ids), ef_construction=200, M=16)
+            index.add_items(embeddings, np.arange(len(ids)))
+            index.save_index(os.path.join(path, "hnsw.bin"))
+
+        with open(os.path.join(path, "schema.json"), "w", encoding="utf-8") as f:
+            json.dump({"rows": len(ids), "dim": int(embeddings.shape[1]), "dtype": dtype,
+                       "rescore_dtype": rescore_dtype if rescore_dtype != dtype else None, "columns": columns,
+                       # Для хранилища чанков поле id — id резюме, а не строки
+                       "id_is_row_id": all(meta.get("id") == doc_id for doc_id, meta in zip(ids, metadatas)),
+                       "skills": skills}, f, ensure_ascii=False)
+        NumpyBackend._publish(link_path, path)
+
+    @staticmethod
+    def _publish(link_path: str, version_path: str):
+        """Переключает ссылку link_path на каталог версии и удаляет версии старше предыдущей."""
+        previous = os.path.realpath(link_path) if os.path.islink(link_path) else None
+        if os.path.isdir(link_path) and not os.path.islink(link_path):
+            # Хранилище прежнего формата (обычный каталог) становится предыдущей версией
+            previous = f"{link_path}.legacy"
+            if os.path.exists(previous):
+                shutil.rmtree(previous)
+            os.rename(link_path, previous)
+        tmp_link = f"{link_path}.tmp"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(os.path.basename(version_path), tmp_link)
+        os.replace(tmp_link, link_path)
+
+        # Предыдущая версия остаётся: процесс, открывший её, ещё может читать столбцы лениво
+        keep = {os.path.realpath(version_path), os.path.realpath(previous) if previous else None}
+        parent, prefix = os.path.dirname(link_path) or ".", os.path.basename(link_path) + "."
+        for name in os.listdir(parent):
+            candidate = os.path.join(parent, name)
+            if name.startswith(prefix) and name != os.path.basename(tmp_link) \
+                    and os.path.isdir(candidate) and not os.path.islink(candidate) \
+                    and os.path.realpath(candidate) not in keep:
+                shutil.rmtree(candidate)
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def vector_nbytes(self) -> int:
+        """Размер файлов с векторами: коды, масштабы int8, копия для пересчёта и индекс HNSW."""
+        names = ("embeddings.npy", "scales.npy", "embeddings_rescore.npy", "hnsw.bin")
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in names
+                   if os.path.exists(os.path.join(self.path, name)))
+
+    def skill_filter(self, skills: List[str]) -> Optional[dict]:
+        if self._skill_bits is None or not skills:
+            return None
+        positions = set()
+        for skill in skills:
+            found = {self._skill_positions[key] for key in skill_keys(skill) if key in self._skill_positions}
+            if not found:
+                # Навыка нет в матрице — фильтр потерял бы подходящие резюме
+                return None
+            positions |= found
+        return {SKILLS_FIELD: {"$in": sorted(positions)}}
+
+    # --- столбцы и where ---
+
+    def _skills_mask(self, condition: dict) -> np.ndarray:
+        """OR строк битовой матрицы выбранных навыков и одна распаковка в маску резюме."""
+        rows = self._skill_bits[np.asarray(condition["$in"], dtype=np.int64)]
+        packed = np.bitwise_or.reduce(rows, axis=0) if len(rows) else np.zeros(self._skill_bits.shape[1], dtype=np.uint8)
+        return np.unpackbits(packed, count=len(self.ids)).astype(bool)
+
+    def _column(self, name: str):
+        if name not in self._columns:
+            info = self.schema["columns"].get(name)
+            if info is None:
+                self._columns[name] = None
+            else:
+                data = np.load(os.path.join(self.path, f"col_{name}.npy"), mmap_mode="r")
+                present = np.load(os.path.join(self.path, f"col_{name}.present.npy"), mmap_mode="r") \
+                    if info["has_missing"] else None
+                codes = {value: i for i, value in enumerate(info["vocab"])} if info["kind"] == "string" else None
+                self._columns[name] = (info, data, present, codes)
+        return self._columns[name]
+
+    def _field_mask(self, name: str, condition) -> Optional[np.ndarray]:
+        """Маска строк для условия по одному полю; None, если поле не хранится столбцом."""
+        column = self._column(name)
+        if column is None:
+            return None
+        info, data, present, codes = column
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        mask = np.ones(len(self.ids), dtype=bool) if present is None else np.array(present)
+        for op, value in condition.items():
+            if info["kind"] == "string":
+                values = value if op in ("$in", "$nin") else [value]
+                selected = [codes[v] for v in values if isinstance(v, str) and v in codes]
+                if op in ("$eq", "$in"):
+                    mask &= np.isin(data, selected)
+                elif op in ("$ne", "$nin"):
+                    mask &= ~np.isin(data, selected)
+                else:
+                    return None
+            else:
+                if op == "$eq":
+                    mask &= data == value
+                elif op == "$ne":
+                    mask &= data != value
+                elif op == "$gt":
+                    mask &= data > value
+                elif op == "$gte":
+                    mask &= data >= value
+                elif op == "$lt":
+                    mask &= data < value
+                elif op == "$lte":
+                    mask &= data <= value
+                elif op == "$in":
+                    mask &= np.isin(data, value)
+                elif op == "$nin":
+                    mask &= ~np.isin(data, value)
+                else:
+                    return None
+        return mask
+
+    def _where_mask(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        """Маска строк по where ChromaDB или None, если фильтра нет."""
+        if not where:
+            return None
+        mask = self._eval(where)
+        if mask is None:
+            # Поле не хранится столбцом: проверяем условие по метаданным каждой строки
+            mask = np.array([_match(self._record(row)[1], where) for row in range(len(self.ids))], dtype=bool)
+        return mask
+
+    def _eval(self, where: dict) -> Optional[np.ndarray]:
+        masks = []
+        for key, value in where.items():
+            if key in ("$and", "$or"):
+                parts = [self._eval(part) for part in value]
+                if any(part is None for part in parts):
+                    return None
+                combine = np.logical_and if key == "$and" else np.logical_or
+                masks.append(combine.reduce(parts) if parts else np.ones(len(self.ids), dtype=bool))
+            elif key == SKILLS_FIELD:
+                masks.append(self._skills_mask(value))
+            elif key == "id" and "id" not in self.schema["columns"] and self.schema.get("id_is_row_id"):
+                masks.append(self._id_mask(value))
+            else:
+                mask = self._field_mask(key, value)
+                if mask is None:
+                    return None
+                masks.append(mask)
+        return np.logical_and.reduce(masks)
+
+    def _id_mask(self, condition) -> np.ndarray:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        mask = np.ones(len(self.ids), dtype=bool)
+        for op, value in condition.items():
+            rows = self._rows_for_ids(value if op in ("$in", "$nin") else [value])
+            selected = np.zeros(len(self.ids), dtype=bool)
+            selected[rows] = True
+            mask &= selected if op in ("$eq", "$in") else ~selected
+        return mask
+
+    def _rows_for_ids(self, ids) -> List[int]:
+        if self._row_of is None:
+            self._row_of = {doc_id: row for row, doc_id in enumerate(self.ids.tolist())}
+        return [self._row_of[doc_id] for doc_id in ids if doc_id in self._row_of]
+
+    # --- чтение строк ---
+
+    def _record(self, row: int):
+        start, end = self._record_offsets[row], self._record_offsets[row + 1]
+        return json.loads(self._records[start:end].tobytes().decode("utf-8"))
+
+    def _rows_result(self, rows, include: List[str], distances=None) -> Dict[str, Any]:
+        records = [self._record(row) for row in rows] if {"documents", "metadatas"} & set(include) else None
+        result = {"ids": [str(self.ids[row]) for row in rows]}
+        if "documents" in include:
+            result["documents"] = [doc for doc, _ in records]
+        if "metadatas" in include:
+            result["metadatas"] = [meta for _, meta in records]
+        if "embeddings" in include:
+            result["embeddings"] = list(self._vectors(np.asarray(rows, dtype=np.int64)))
+        if distances is not None and "distances" in include:
+            result["distances"] = distances
+        return result
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None,
+            include: Optional[List[str]] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None) -> Dict[str, Any]:
+        include = include or ["documents", "metadatas"]
+        if ids is not None:
+            rows = np.array(self._rows_for_ids(ids), dtype=np.int64)
+        else:
+            rows = np.arange(len(self.ids))
+        mask = self._where_mask(where)
+        if mask is not None:
+            rows = rows[mask[rows]]
+        rows = rows[offset or 0:]
+        if limit is not None:
+            rows = rows[:limit]
+        return self._rows_result(rows.tolist(), include)
+
+    # --- поиск ---
+
+    def _vectors(self, rows) -> np.ndarray:
+        """Строки эмбеддингов в float32 (с учётом масштаба int8)."""
+        return dequantize(self.embeddings[rows], None if self._scales is None else self._scales[rows])
+
+    def _exact_top_k(self, queries: np.ndarray, rows: Optional[np.ndarray], k: int):
+        """Точный top-k по скалярному произведению (эмбеддинги нормированы — это косинус).
+
+        Для квантованного хранилища с копией для пересчёта отбирается RESCORE_FACTOR * k
+        кандидатов, а итоговый порядок считается по точным векторам.
+        """
+        n_rows = len(self.ids) if rows is None else len(rows)
+        k = min(k, n_rows)
+        if k == 0:
+            return [np.empty(0, dtype=np.int64)] * len(queries), [np.empty(0, dtype=np.float32)] * len(queries)
+        fetch = min(n_rows, k * RESCORE_FACTOR) if self._rescore is not None else k
+        scores = np.empty((len(queries), n_rows), dtype=np.float32)
+        for start in range(0, n_rows, SCAN_BLOCK_ROWS):
+            block_rows = np.arange(start, min(start + SCAN_BLOCK_ROWS, n_rows)) if rows is None \
+                else rows[start:start + SCAN_BLOCK_ROWS]
+            block = np.asarray(self.embeddings[block_rows], dtype=np.float32)
+            block_scores = queries @ block.T
+            if self._scales is not None:
+                # Масштаб вектора выносится за скалярное произведение: одно умножение на столбец
+                block_scores *= self._scales[block_rows]
+            scores[:, start:start + SCAN_BLOCK_ROWS] = block_scores
+        top = np.argpartition(-scores, fetch - 1, axis=1)[:, :fetch] if fetch < n_rows else np.tile(np.arange(n_rows), (len(queries), 1))
+        all_rows, all_scores = [], []
+        for i in range(len(queries)):
+            candidates = top[i] if rows is None else rows[top[i]]
+            candidate_scores = scores[i, top[i]]
+            if self._rescore is not None:
+                candidate_scores = np.asarray(self._rescore[candidates], dtype=np.float32) @ queries[i]
+            order = np.argsort(-candidate_scores, kind="stable")[:k]
+            all_rows.append(candidates[order])
+            all_scores.append(candidate_scores[order])
+        return all_rows, all_scores
+
+    def _ann_top_k(self, queries: np.ndarray, mask: Optional[np.ndarray], k: int):
+        """Поиск по HNSW; строки, не прошедшие where, отбрасываются, при нехватке — точный поиск."""
+        allowed = len(self.ids) if mask is None else int(mask.sum())
+        if allowed == 0:
+            return [np.empty(0, dtype=np.int64)] * len(queries), [np.empty(0, dtype=np.float32)] * len(queries)
+        # Запас на строки, которые отсеет where: чем строже фильтр, тем глубже выдача
+        fetch = min(len(self.ids), k if mask is None else max(k * 4, int(k * len(self.ids) / allowed)))
+        self._hnsw.set_ef(max(64, fetch))
+        labels, distances = self._hnsw.knn_query(queries, k=fetch)
+        all_rows, all_scores = [], []
+        for i in range(len(queries)):
+            rows, sims = labels[i].astype(np.int64), 1 - distances[i]
+            if mask is not None:
+                keep = mask[rows]
+                rows, sims = rows[keep], sims[keep]
+            if len(rows) < min(k, allowed):
+                exact_rows, exact_scores = self._exact_top_k(queries[i:i + 1], None if mask is None else np.flatnonzero(mask), k)
+                rows, sims = exact_rows[0], exact_scores[0]
+            all_rows.append(rows[:k])
+            all_scores.append(sims[:k])
+        return all_rows, all_scores
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[dict] = None,
+              include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = include or ["documents", "metadatas", "distances"]
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        mask = self._where_mask(where)
+        if self._hnsw is not None:
+            rows_per_query, scores_per_query = self._ann_top_k(queries, mask, n_results)
+        else:
+            rows_per_query, scores_per_query = self._exact_top_k(
+                queries, None if mask is None else np.flatnonzero(mask), n_results)
+
+        result = {key: [] for key in ["ids"] + [k for k in include if k in ("documents", "metadatas", "embeddings", "distances")]}
+        for rows, scores in zip(rows_per_query, scores_per_query):
+            # Косинусное расстояние, как в коллекции ChromaDB с hnsw:space=cosine
+            part = self._rows_result(rows.tolist(), include, distances=(1 - scores).tolist())
+            for key in result:
+                result[key].append(part[key])
+        return result
+
+
+def _match(meta: dict, where: dict) -> bool:
+    """Проверка where ChromaDB по словарю метаданных одной строки."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_match(meta, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(_match(meta, part) for part in condition):
+                return False
+        else:
+            if key not in meta:
+                return False
+            value = meta[key]
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, expected in condition.items():
+                if op == "$eq" and not value == expected:
+                    return False
+                if op == "$ne" and not value != expected:
+                    return False
+                if op == "$gt" and not value > expected:
+                    return False
+                if op == "$gte" and not value >= expected:
+                    return False
+                if op == "$lt" and not value < expected:
+                    return False
+                if op == "$lte" and not value <= expected:
+                    return False
+                if op == "$in" and value not in expected:
+                    return False
+                if op == "$nin" and value in expected:
+                    return False
+    return True
@@ -0,0 +1,177 @@
+# rule_planner.py
+import re
+from typing import Optional
+
+from prepare_documents import TECH_SYNONYMS
+
+# Русские и падежные формы технологий, которые встречаются в запросах, но не в резюме
+QUERY_TECH_FORMS = {
+    'python': [r'питон\w*'],
+    'java': [r'джав[аеуы]'],
+    'javascript': [r'джаваскрипт\w*'],
+    'ml': [r'машинн\w* обучени\w*'],
+    'ai': [r'искусственн\w* интеллект\w*'],
+    'kubernetes': [r'кубернетес\w*'],
+    'docker': [r'докер\w*'],
+}
+
+# Нормализованное название города (как в метаданных) → формы в запросе
+CITY_FORMS = {
+    'москва': [r'москв\w*', r'мск'],
+    'санкт-петербург': [r'санкт-петербург\w*', r'петербург\w*', r'питер\w*', r'спб'],
+    'новосибирск': [r'новосибирск\w*'],
+    'екатеринбург': [r'екатеринбург\w*', r'екб'],
+    'казань': [r'казан[иь]'],
+    'нижний новгород': [r'нижн\w* новгород\w*'],
+    'краснодар': [r'краснодар\w*'],
+    'самара': [r'самар[аеуы]'],
+    'ростов-на-дону': [r'ростов\w*(?:-на-дону)?'],
+    'воронеж': [r'воронеж\w*'],
+    'пермь': [r'перм[иь]'],
+    'уфа': [r'уф[аеуы]'],
+    'челябинск': [r'челябинск\w*'],
+    'омск': [r'омск\w*'],
+    'томск': [r'томск\w*'],
+    'минск': [r'минск\w*'],
+}
+
+# Роли: не фильтруют выдачу, но формируют поисковые запросы
+ROLE_FORMS = {
+    'Frontend': [r'фронтенд\w*', r'фронт', r'frontend\w*', r'front-end\w*'],
+    'Backend': [r'бэкенд\w*', r'бекенд\w*', r'backend\w*', r'back-end\w*'],
+    'Fullstack': [r'фулл?стек\w*', r'full-?stack\w*'],
+    'Data Scientist': [r'data scientist\w*', r'дата сайентист\w*'],
+    'DevOps': [r'devops\w*', r'девопс\w*'],
+    'QA': [r'qa', r'тестировщик\w*'],
+    'Аналитик': [r'аналитик\w*'],
+    'Разработчик': [r'разработчик\w*', r'программист\w*', r'developer\w*', r'dev'],
+}
+
+EXPERIENCE_PATTERNS = [
+    r'(?:от|более|больше|свыше|минимум|не менее)\s+(\d{1,2})\s*\+?\s*(?:-?х\s+)?(?:лет|года|год)\w*(?:\s+опыт\w*)?',
+    r'опыт\w*\s+(?:работы\s+)?(?:от\s+)?(\d{1,2})\s*\+?\s*(?:лет|года|год)\w*',
+    r'(\d{1,2})\s*\+\s*(?:лет|года|год)\w*',
+]
+
+# Слова, которые не несут критериев поиска и не мешают уверенному разбору
+STOPWORDS = {
+    'найди', 'найти', 'найдите', 'ищу', 'ищем', 'поиск', 'покажи', 'подбери', 'нужен', 'нужна', 'нужны',
+    'нужно', 'кто', 'знает', 'знающих', 'знающие', 'владеет', 'владеющих', 'умеет', 'с', 'со', 'и', 'или',
+    'в', 'во', 'из', 'на', 'по', 'для', 'от', 'опыт', 'опытом', 'работы', 'лет', 'года', 'год',
+    'кандидат', 'кандидата', 'кандидатов', 'кандидаты', 'специалист', 'специалиста', 'специалистов',
+    'специалисты', 'резюме', 'город', 'городе', 'г', 'all', 'any', 'знанием', 'знаниями',
+}
+
+_BOUNDARY_LEFT = r'(?<![\w#+.])'
+_BOUNDARY_RIGHT = r'(?![\w#+])'
+
+
+def _compile(forms: dict) -> list:
+    compiled = []
+    for name, patterns in forms.items():
+        alternation = "|".join(patterns)
+        compiled.append((name, re.compile(f"{_BOUNDARY_LEFT}(?:{alternation}){_BOUNDARY_RIGHT}")))
+    return compiled
+
+
+def _tech_forms() -> dict:
+    forms = {}
+    for tech, synonyms in TECH_SYNONYMS.items():
+        # Длинные синонимы раньше коротких, чтобы 'react.js' не обрезался до 'react'
+        forms[tech] = [re.escape(s) for s in sorted(synonyms, key=len, reverse=True)]
+        forms[tech] += QUERY_TECH_FORMS.get(tech, [])
+    return forms
+
+
+_TECH_RE = _compile(_tech_forms())
+_CITY_RE = _compile(CITY_FORMS)
+_ROLE_RE = _compile(ROLE_FORMS)
+_EXPERIENCE_RE = [re.compile(p) for p in EXPERIENCE_PATTERNS]
+
+
+def _blank(match) -> str:
+    # Замена той же длины сохраняет позиции остальных совпадений
+    return ' ' * len(match.group(0))
+
+
+def _take(regexes: list, text: str):
+    """Находит совпадения, вырезает их из текста и возвращает имена в порядке появления и остаток."""
+    found = []
+    for name, regex in regexes:
+        match = regex.search(text)
+        if match:
+            found.append((match.start(), name))
+            text = regex.sub(_blank, text)
+    return [name for _, name in sorted(found)], text
+
+
+def normalize_city(text: str) -> Optional[str]:
+    """Название города в форме метаданных («в Москве» → «москва») или None."""
+    cities, _ = _take(_CITY_RE, text.lower())
+    return cities[0] if len(cities) == 1 else None
+
+
+def rule_based_plan(user_query: str) -> Optional[dict]:
+    """Локальный разбор запросов вида «<навык> в <городе> от N лет».
+
+    Возвращает план в формате _parse_agent_response или None, если запрос
+    содержит слова, которые правила не понимают, — тогда нужен GigaChat.
+    """
+    text = re.sub(r'\s+', ' ', user_query.lower()).strip()
+    if not text:
+        return None
+
+    min_years = None
+    for regex in _EXPERIENCE_RE:
+        match = regex.search(text)
+        if match:
+            min_years = int(match.group(1))
+            text = regex.sub(_blank, text, count=1)
+            break
+
+    cities, text = _take(_CITY_RE, text)
+    skills, text = _take(_TECH_RE, text)
+    roles, text = _take(_ROLE_RE, text)
+
+    if len(cities) > 1 or not (skills or roles):
+        return None
+
+    # Любое нераспознанное слово — повод отдать запрос LLM
+    for token in re.findall(r'[a-zа-яё0-9#+]+', text):
+        if token not in STOPWORDS and not token.isdigit():
+            return None
+
+    city = cities[0] if cities else None
+    skill_names = [s.title() for s in skills]
+    role_names = [r for r in roles if r != 'Разработчик'] or ['Разработчик']
+    role_phrase = " ".join(role_names)
+
+    search_queries = [user_query.strip()]
+    if skill_names:
+        search_queries.append(f"{' '.join(skill_names)} {role_phrase.lower()}")
+        search_queries.append(f"{' '.join(skill_names)} developer")
+    else:
+        search_queries.append(role_phrase)
+    search_queries = list(dict.fromkeys(search_queries))[:3]
+
+    criteria = []
+    if skill_names:
+        criteria.append(f"навыки: {', '.join(skill_names)}")
+    if roles:
+        criteria.append(f"роль: {role_phrase}")
+    if city:
+        criteria.append(f"город: {city}")
+    if min_years:
+        criteria.append(f"опыт от {min_years} лет")
+
+    return {
+        "thought_process": f"Локальный разбор запроса ({'; '.join(criteria)})",
+        "search_queries": search_queries,
+        "filters": {
+            "location": city,
+            "min_experience_years": min_years,
+            "required_skills": skill_names
+        },
+        "analysis_instructions": f"Проанализируй найденные резюме на соответствие критериям: {'; '.join(criteria)}.",
+        "requires_refinement": False
+    }
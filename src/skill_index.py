@@ -0,0 +1,75 @@
+# skill_index.py
+from typing import Iterable, List, Optional, Set
+
+import numpy as np
+
+from prepare_documents import TECH_MATCHER
+
+SKILL_INDEX_PATH = "./vectorstore/skill_index.npz"
+
+
+def normalize_skill(skill: str) -> str:
+    return " ".join(str(skill).lower().split())
+
+
+def skill_keys(skill: str) -> Set[str]:
+    """Ключи индекса для навыка: сам навык и канонические технологии из него ('react.js' → 'react')."""
+    normalized = normalize_skill(skill)
+    if not normalized:
+        return set()
+    return {normalized} | {tech.lower() for tech in TECH_MATCHER.find(normalized)}
+
+
+class SkillIndex:
+    """Инвертированный индекс навык → отсортированные номера резюме (CSR-массивы)."""
+
+    def __init__(self, ids: np.ndarray, skills: np.ndarray, offsets: np.ndarray, rows: np.ndarray):
+        self.ids = ids
+        self.skills = skills
+        self.rows = rows
+        self.offsets = offsets
+        self._positions = {skill: i for i, skill in enumerate(skills.tolist())}
+
+    @classmethod
+    def build(cls, ids: List[str], skills_per_doc: Iterable[Iterable[str]]) -> "SkillIndex":
+        postings = {}
+        for row, skills in enumerate(skills_per_doc):
+            keys = set()
+            for skill in skills:
+                keys |= skill_keys(skill)
+            for key in keys:
+                postings.setdefault(key, []).append(row)
+        skills = sorted(postings)
+        offsets = np.zeros(len(skills) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[s]) for s in skills])
+        rows = np.array([row for s in skills for row in postings[s]], dtype=np.int32)
+        return cls(np.array(ids, dtype=str), np.array(skills, dtype=str), offsets, rows)
+
+    @classmethod
+    def load(cls, path: str = SKILL_INDEX_PATH) -> "SkillIndex":
+        data = np.load(path)
+        return cls(data["ids"], data["skills"], data["offsets"], data["rows"])
+
+    def save(self, path: str = SKILL_INDEX_PATH):
+        np.savez_compressed(path, ids=self.ids, skills=self.skills, offsets=self.offsets, rows=self.rows)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _postings(self, key: str) -> np.ndarray:
+        pos = self._positions.get(key)
+        if pos is None:
+            return np.empty(0, dtype=np.int32)
+        return self.rows[self.offsets[pos]:self.offsets[pos + 1]]
+
+    def rows_for_skill(self, skill: str) -> np.ndarray:
+        """Номера резюме с навыком (точное совпадение или та же каноническая технология)."""
+        arrays = [self._postings(key) for key in skill_keys(skill)]
+        return np.unique(np.concatenate(arrays)) if arrays else np.empty(0, dtype=np.int32)
+
+    def candidates(self, skills: List[str]) -> Optional[Set[str]]:
+        """id резюме, у которых есть хотя бы один из навыков; None, если навыков нет."""
+        if not skills:
+            return None
+        rows = np.unique(np.concatenate([self.rows_for_skill(s) for s in skills]))
+        return set(self.ids[rows].tolist())
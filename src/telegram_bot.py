@@ -1,17 +1,30 @@
 # telegram_bot.py
 import os
+import re
+import time
 import asyncio
+import logging
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, types
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
-from gigachat import GigaChat
 
 # Импортируем AgenticRAGHandler из отдельного файла
 from agentic_rag import AgenticRAGHandler
+from executors import ExecutionLayer
+from encoders import load_encoder
+from embedding_cache import EmbeddingCache
+from plan_cache import PlanCache
+from result_cache import BuildVersion, ResultCache
+from request_scheduler import RequestScheduler, SchedulerBusy
+from reranker import Reranker, load_cross_encoder
+from context_builder import ContextBuilder
+from observability import METRICS, configure_logging, fields, start_metrics_server
+from skill_index import SkillIndex, SKILL_INDEX_PATH
+from metadata_schema import MetadataSchema, METADATA_SCHEMA_PATH
+from bm25_index import BM25Index, BM25_INDEX_PATH
+from retrieval_backend import ChromaBackend, NumpyBackend, NUMPY_STORE_PATH, NUMPY_CHUNK_STORE_PATH
 
 # Загружаем .env
 load_dotenv()
@@ -19,59 +32,257 @@ load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 GIGACHAT_CREDENTIALS = os.getenv("GIGACHAT_CREDENTIALS")
 CHROMA_PATH = "./vectorstore/chroma_db"
+QUERY_CACHE_PATH = "./vectorstore/embedding_cache/queries"
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "10000"))
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "1000"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", "86400"))
+# Порог косинусного сходства для поиска плана по эмбеддингу; пусто — только точное совпадение
+PLAN_CACHE_SIMILARITY = float(os.getenv("PLAN_CACHE_SIMILARITY")) if os.getenv("PLAN_CACHE_SIMILARITY") else None
+# Кэш результатов поиска и анализа по плану; сбрасывается при смене версии сборки индексов
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1000"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+# Планировщик запросов: разных запросов в обработке, запросов одного пользователя, вызовов GigaChat
+SCHEDULER_MAX_PENDING = int(os.getenv("SCHEDULER_MAX_PENDING", "32"))
+SCHEDULER_PER_USER = int(os.getenv("SCHEDULER_PER_USER", "2"))
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+# Переранжирование кандидатов перед анализом GigaChat (0 — отключить); RERANK_MODEL — кросс-энкодер,
+# без него оценка только по признакам из метаданных
+RERANK = os.getenv("RERANK", "1") != "0"
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "5"))
+RERANK_MIN_SCORE = float(os.getenv("RERANK_MIN_SCORE", "0.5"))
+RERANK_MODEL = os.getenv("RERANK_MODEL")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+# Бюджет токенов контекста резюме в промпте анализа (0 — прежние фиксированные срезы текста)
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1200"))
+# Локальный разбор простых запросов без вызова GigaChat (0 — отключить)
+RULE_PLANNER = os.getenv("RULE_PLANNER", "1") != "0"
+# Хранилище резюме: chroma (по умолчанию) или numpy (build_vector_store.py --numpy-store)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma").lower()
+# Поиск по чанкам резюме, если они проиндексированы (0 — отключить); агрегация оценок: max или sum
+CHUNK_SEARCH = os.getenv("CHUNK_SEARCH", "1") != "0"
+CHUNK_AGGREGATION = os.getenv("CHUNK_AGGREGATION", "max")
+# Гибридный поиск (векторный + BM25), если индекс BM25 построен (0 — только векторный)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") != "0"
+# Эндпоинт /metrics в формате Prometheus; без METRICS_PORT (или 0) не запускается
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+logger = logging.getLogger(__name__)
 
 # Глобальные объекты
 model = None
 chroma_client = None
-collection = None
+collection = None  # Хранилище резюме (RetrievalBackend)
 giga_chat = None
 agent_handler = None  # Для AgenticRAG
+execution_layer = None  # Пулы потоков для GigaChat, энкодера и ChromaDB
+query_cache = None  # Кэш эмбеддингов запросов
+plan_cache = None  # Кэш планов поиска GigaChat
+result_cache = None  # Кэш найденных резюме и анализа по плану
+reranker = None  # Переранжирование кандидатов перед анализом
+skill_index = None  # Индекс навык → резюме
+metadata_schema = None  # Схема фильтруемых метаданных
+bm25_index = None  # Лексический индекс для гибридного поиска
+chunk_backend = None  # Хранилище чанков резюме
+scheduler = RequestScheduler(SCHEDULER_MAX_PENDING, SCHEDULER_PER_USER, LLM_MAX_IN_FLIGHT)
+build_version = BuildVersion()  # Версия сборки индексов из build_info.json
+loaded_build = None  # Версия, с которой открыты хранилища
+reload_lock = asyncio.Lock()
 
-async def init_models():
-    """Инициализация всех моделей и компонентов"""
-    global model, chroma_client, collection, giga_chat, agent_handler
-    
-    print("🧠 Загрузка модели эмбеддингов...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+def collect_component_metrics():
+    """Состояние пулов, кэшей, планировщика и переранжирования для /metrics — из их stats()."""
+    samples = []
+    if execution_layer:
+        for pool, s in execution_layer.stats().items():
+            for key in ("active", "queued", "max_queue_depth"):
+                samples.append((f"pool_{key}", {"pool": pool}, s[key]))
+            samples.append(("pool_completed_total", {"pool": pool}, s["completed"]))
+    if query_cache:
+        s = query_cache.stats()
+        samples += [("query_cache_entries", {}, s["entries"]),
+                    ("cache_hits_total", {"cache": "query"}, s["hits"]),
+                    ("cache_misses_total", {"cache": "query"}, s["misses"])]
+    if plan_cache:
+        s = plan_cache.stats()
+        samples += [("plan_cache_entries", {}, s["entries"]),
+                    ("cache_hits_total", {"cache": "plan"}, s["exact_hits"]),
+                    ("cache_hits_total", {"cache": "plan_semantic"}, s["semantic_hits"]),
+                    ("cache_misses_total", {"cache": "plan"}, s["misses"])]
+    if result_cache:
+        s = result_cache.stats()
+        for cache in ("results", "answers"):
+            samples += [("cache_hits_total", {"cache": cache}, s[cache]["hits"]),
+                        ("cache_misses_total", {"cache": cache}, s[cache]["misses"])]
+    s = scheduler.stats()
+    samples += [("scheduler_pending", {}, s["pending"]),
+                ("scheduler_llm_in_use", {}, s["llm_in_use"]),
+                ("scheduler_started_total", {}, s["started"]),
+                ("scheduler_coalesced_total", {}, s["coalesced"]),
+                ("scheduler_rejected_total", {"reason": "busy"}, s["rejected_busy"]),
+                ("scheduler_rejected_total", {"reason": "user"}, s["rejected_user"])]
+    if reranker:
+        s = reranker.stats()
+        samples += [("rerank_candidates_in_total", {}, s["candidates_in"]),
+                    ("rerank_candidates_out_total", {}, s["candidates_out"]),
+                    ("rerank_over_budget_total", {}, s["over_budget"])]
+    return samples
 
-    print("📂 Подключение к ChromaDB...")
-    chroma_client = chromadb.PersistentClient(
-        path=CHROMA_PATH, 
-        settings=Settings(allow_reset=False)
-    )
-    
-    # Проверяем существование коллекции
-    try:
-        collection = chroma_client.get_collection("resumes")
-        print(f"✅ Коллекция найдена, {collection.count()} резюме")
-    except Exception as e:
-        print(f"❌ Коллекция не найдена: {e}")
-        raise Exception("Коллекция резюме не найдена. Сначала запустите build_vector_store.py")
+_collectors_registered = False
+
+def register_collectors():
+    global _collectors_registered
+    if not _collectors_registered:
+        METRICS.add_collector(collect_component_metrics)
+        _collectors_registered = True
+
+def timed_phase(phase: str, fn, *args):
+    """Выполняет этап запуска и пишет его длительность в лог."""
+    started = time.perf_counter()
+    result = fn(*args)
+    logger.info("Этап запуска завершён", extra=fields(phase=phase, ms=round((time.perf_counter() - started) * 1000)))
+    return result
 
-    print("💬 Инициализация GigaChat...")
-    giga_chat = GigaChat(
+def load_model():
+    """Энкодер с пробным кодированием: первый запрос обслуживается прогретой моделью."""
+    encoder = load_encoder('all-MiniLM-L6-v2')  # Бэкенд, батч и потоки — ENCODER_BACKEND/BATCH_SIZE/THREADS
+    encoder.warmup()
+    logger.info("Энкодер загружен", extra=fields(backend=encoder.backend))
+    return encoder
+
+def open_store():
+    """Хранилище резюме и чанков: (клиент ChromaDB, хранилище, хранилище чанков)."""
+    client, store, chunks = None, None, None
+    if RETRIEVAL_BACKEND == "numpy":
+        logger.info("Открытие хранилища NumPy")
+        try:
+            store = NumpyBackend(NUMPY_STORE_PATH)
+            logger.info("Хранилище открыто", extra=fields(resumes=store.count()))
+            if CHUNK_SEARCH and os.path.exists(NUMPY_CHUNK_STORE_PATH):
+                chunks = NumpyBackend(NUMPY_CHUNK_STORE_PATH)
+        except FileNotFoundError as e:
+            logger.error("Хранилище NumPy не найдено", extra=fields(error=str(e)))
+            raise Exception("Хранилище NumPy не найдено. Запустите build_vector_store.py --numpy-store")
+    else:
+        logger.info("Подключение к ChromaDB")
+        import chromadb
+        from chromadb.config import Settings
+        client = chromadb.PersistentClient(
+            path=CHROMA_PATH, 
+            settings=Settings(allow_reset=False)
+        )
+        
+        # Проверяем существование коллекции
+        try:
+            store = ChromaBackend(client.get_collection("resumes"))
+            logger.info("Коллекция найдена", extra=fields(resumes=store.count()))
+        except Exception as e:
+            logger.error("Коллекция не найдена", extra=fields(error=str(e)))
+            raise Exception("Коллекция резюме не найдена. Сначала запустите build_vector_store.py")
+        if CHUNK_SEARCH:
+            try:
+                chunks = ChromaBackend(client.get_collection("resume_chunks"))
+            except Exception:
+                pass  # Чанки не проиндексированы (build_vector_store.py --chunks)
+    if chunks is not None:
+        logger.info("Поиск по чанкам включён", extra=fields(chunks=chunks.count(), aggregation=CHUNK_AGGREGATION))
+    return client, store, chunks
+
+def load_indexes():
+    """Индекс навыков, схема метаданных и индекс BM25 (те, что построены)."""
+    skills, schema, bm25 = None, None, None
+    if os.path.exists(SKILL_INDEX_PATH):
+        skills = SkillIndex.load(SKILL_INDEX_PATH)
+        logger.info("Индекс навыков загружен", extra=fields(skills=len(skills.skills)))
+    else:
+        logger.warning("Индекс навыков не найден, навыки будут проверяться по выдаче (перезапустите build_vector_store.py)")
+    if os.path.exists(METADATA_SCHEMA_PATH):
+        schema = MetadataSchema.load(METADATA_SCHEMA_PATH)
+        logger.info("Схема метаданных загружена", extra=fields(skill_fields=len(schema.skill_fields)))
+    if HYBRID_SEARCH and os.path.exists(BM25_INDEX_PATH):
+        bm25 = BM25Index.load(BM25_INDEX_PATH)
+        logger.info("Индекс BM25 загружен, поиск гибридный", extra=fields(terms=len(bm25.terms)))
+    return skills, schema, bm25
+
+def connect_gigachat():
+    """Клиент GigaChat; подключение проверяется получением токена, без платного запроса к модели."""
+    from gigachat import GigaChat
+    client = GigaChat(
         credentials=GIGACHAT_CREDENTIALS,
         verify_ssl_certs=False,
         model="GigaChat:latest",
         scope="GIGACHAT_API_PERS"
     )
-    
-    # Тестируем подключение к GigaChat
     try:
-        test_response = giga_chat.chat("Тест подключения")
-        print(f"✅ GigaChat подключен")
+        client.get_token()
+        logger.info("GigaChat подключен")
     except Exception as e:
-        print(f"❌ Ошибка подключения GigaChat: {e}")
+        logger.error("Ошибка подключения GigaChat", extra=fields(error=str(e)))
         raise
+    return client
+
+def load_reranker():
+    cross_encoder = None
+    if RERANK_MODEL:
+        logger.info("Загрузка кросс-энкодера", extra=fields(model=RERANK_MODEL))
+        cross_encoder = load_cross_encoder(RERANK_MODEL)
+    return Reranker(top_k=RERANK_TOP_K, min_score=RERANK_MIN_SCORE, cross_encoder=cross_encoder,
+                    batch_size=RERANK_BATCH_SIZE, budget_ms=RERANK_BUDGET_MS)
 
-    print("🤖 Инициализация AgenticRAG...")
-    agent_handler = AgenticRAGHandler(model, collection, giga_chat)
+async def init_models():
+    """Инициализация всех моделей и компонентов.
+
+    Независимые этапы — загрузка энкодера, открытие хранилища и индексов,
+    авторизация в GigaChat, кросс-энкодер — идут параллельно в пулах ExecutionLayer,
+    поэтому запуск длится примерно столько, сколько самый долгий из них.
+    """
+    global model, chroma_client, collection, giga_chat, agent_handler, execution_layer, query_cache, plan_cache, result_cache, reranker, skill_index, metadata_schema, bm25_index, chunk_backend, loaded_build
     
-    print("✅ Все компоненты загружены!")
+    started = time.perf_counter()
+    # Версия читается до открытия хранилищ: сборка, завершившаяся во время запуска, подхватится позже
+    loaded_build = build_version.current()
+    execution_layer = ExecutionLayer.from_env()
+    (model, (chroma_client, collection, chunk_backend), (skill_index, metadata_schema, bm25_index),
+     giga_chat, reranker) = await asyncio.gather(
+        execution_layer.run("encoder", timed_phase, "encoder", load_model),
+        execution_layer.run("chroma", timed_phase, "store", open_store),
+        execution_layer.run("lexical", timed_phase, "indexes", load_indexes),
+        execution_layer.run("llm", timed_phase, "gigachat", connect_gigachat),
+        execution_layer.run("encoder", timed_phase, "reranker", load_reranker) if RERANK else asyncio.sleep(0),
+    )
+
+    query_cache = EmbeddingCache(
+        QUERY_CACHE_PATH, model.cache_name, model.get_sentence_embedding_dimension(),
+        max_entries=QUERY_CACHE_SIZE, flush_every=20
+    )
+    plan_cache = PlanCache(
+        max_entries=PLAN_CACHE_SIZE, ttl_seconds=PLAN_CACHE_TTL, similarity_threshold=PLAN_CACHE_SIMILARITY
+    )
+    result_cache = ResultCache(max_entries=RESULT_CACHE_SIZE, ttl_seconds=RESULT_CACHE_TTL,
+                               build_version=build_version)
+    # Токены считаются локальным токенизатором энкодера: размер промпта предсказуем без обращения к GigaChat
+    context_builder = ContextBuilder(CONTEXT_MAX_TOKENS, count_tokens=model.count_tokens) if CONTEXT_MAX_TOKENS else None
+    agent_handler = AgenticRAGHandler(model, collection, giga_chat,
+                                      executor=execution_layer, query_cache=query_cache,
+                                      plan_cache=plan_cache, use_rule_planner=RULE_PLANNER,
+                                      skill_index=skill_index, metadata_schema=metadata_schema,
+                                      bm25_index=bm25_index, chunk_backend=chunk_backend,
+                                      chunk_aggregation=CHUNK_AGGREGATION, result_cache=result_cache,
+                                      llm_semaphore=scheduler.llm_semaphore, reranker=reranker,
+                                      context_builder=context_builder)
+    register_collectors()
+    
+    logger.info("Все компоненты загружены", extra=fields(ms=round((time.perf_counter() - started) * 1000)))
     return True
 
+# Ответ, если запрос пришёл до окончания инициализации
+NOT_READY_MESSAGE = "⏳ Бот ещё запускается, повторите запрос через несколько секунд."
 # Минимальная длина значимого запроса
 MIN_QUERY_LENGTH = 3
+# Предел длины одного сообщения (у Telegram — 4096 символов, оставляем запас)
+MESSAGE_LIMIT = 4000
+# Минимальный интервал между правками статусного сообщения во время генерации ответа, секунды
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
 
 def is_valid_query(query: str) -> bool:
     """Проверяет, является ли запрос осмысленным для поиска"""
@@ -91,19 +302,157 @@ def is_valid_query(query: str) -> bool:
     
     return True
 
-async def handle_query(user_query: str) -> str:
-    """Основная обработка запроса через AgenticRAG"""
+# Сущности legacy Markdown Telegram: блок и строка кода, ссылка, жирный, курсив
+MARKDOWN_ENTITY_RE = re.compile(r'```.*?```|`[^`\n]*`|\[[^\]\n]*\]\([^)\n]*\)|\*[^*]*\*|_[^_]*_', re.S)
+
+def markdown_closed(text: str) -> bool:
+    """Все сущности Markdown в text закрыты: сообщение можно отправить с parse_mode."""
+    rest = MARKDOWN_ENTITY_RE.sub("", text)
+    return not any(char in rest for char in "*_`[")
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> list:
+    """Делит длинный ответ на сообщения не длиннее limit, по возможности по абзацам и строкам.
+
+    Разрез выбирается так, чтобы не разорвать сущность Markdown (жирный текст, ссылку,
+    блок кода); если такого разреза нет, часть уйдёт без разметки (см. send_answer).
+    """
+    parts = []
+    while len(text) > limit:
+        cuts = [cut for separator in ("\n\n", "\n") for cut in reversed(find_all(text, separator, limit))]
+        cut = next((cut for cut in cuts if markdown_closed(text[:cut])), cuts[0] if cuts else limit)
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip("\n")
+    if text:
+        parts.append(text)
+    return parts
+
+def find_all(text: str, separator: str, end: int) -> list:
+    """Позиции separator в text[:end], кроме нулевой."""
+    positions, start = [], 1
+    while (pos := text.find(separator, start, end)) > 0:
+        positions.append(pos)
+        start = pos + 1
+    return positions
+
+async def send_answer(message: types.Message, answer: str):
+    """Отправляет ответ частями; часть с незакрытой или непринятой Telegram разметкой — простым текстом."""
+    for part in split_message(answer):
+        if markdown_closed(part):
+            try:
+                await message.answer(part, parse_mode="Markdown")
+                continue
+            except TelegramBadRequest as e:
+                logger.warning("Разметка отклонена, часть отправлена без неё", extra=fields(error=str(e)))
+        await message.answer(part)
+
+class ProgressMessage:
+    """Статусное сообщение, которое обновляется по событиям конвейера AgenticRAG.
+
+    План и список кандидатов показываются сразу, фрагменты анализа GigaChat —
+    не чаще interval секунд, чтобы не упираться в лимиты Telegram на правки.
+    """
+
+    def __init__(self, message: types.Message, interval: float = STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.interval = interval
+        self.header = ""
+        self.analysis = ""
+        self._last_text = ""
+        self._last_edit = 0.0
+
+    async def update(self, event: dict):
+        if event["type"] == "plan":
+            queries = ", ".join(event["plan"].get("search_queries", [])[:3])
+            self.header = f"🧭 План поиска: {queries}\n🔍 Ищу кандидатов..."
+            await self._edit(force=True)
+        elif event["type"] == "candidates":
+            resumes = event["resumes"]
+            lines = [f"🔍 Найдено кандидатов: {len(resumes)}"]
+            for i, r in enumerate(resumes[:10], 1):
+                lines.append(f"{i}. {r['position'] or 'Должность не указана'} "
+                             f"({r['location'] or 'город не указан'}, опыт {r['experience_months'] // 12} лет)")
+            self.header = "\n".join(lines) + "\n\n✍️ Анализирую кандидатов..."
+            await self._edit(force=True)
+        elif event["type"] == "analysis_delta":
+            self.analysis += event["text"]
+            await self._edit()
+
+    async def _edit(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_edit < self.interval:
+            return
+        text = self.header
+        if self.analysis:
+            # Во время генерации показываем хвост анализа, помещающийся в одно сообщение
+            room = MESSAGE_LIMIT - len(text) - 3
+            text += "\n\n" + (self.analysis if len(self.analysis) <= room else "…" + self.analysis[-room + 1:])
+        if text == self._last_text:
+            return
+        try:
+            # Без parse_mode: незакрытая разметка в середине генерации сломала бы правку
+            with METRICS.span("send"):
+                await self.message.edit_text(text)
+            self._last_text = text
+            self._last_edit = now
+        except Exception as e:
+            logger.warning("Не удалось обновить статус", extra=fields(error=str(e)))
+
+async def reload_if_rebuilt():
+    """Переоткрывает хранилища и индексы, если build_vector_store.py записал новую версию сборки.
+
+    Схема метаданных, индекс навыков и BM25 перечитываются вместе с хранилищами:
+    коды и номера строк в них относятся к конкретной сборке. Проверка стоит одного
+    os.stat; при ошибке бот продолжает работать с прежними хранилищами и повторит
+    попытку на следующем запросе.
+    """
+    global loaded_build, chroma_client, collection, chunk_backend, skill_index, metadata_schema, bm25_index
+    version = build_version.current()
+    if version == loaded_build:
+        return
+    async with reload_lock:
+        if version == loaded_build:
+            return
+        logger.info("Версия сборки изменилась, хранилища переоткрываются",
+                    extra=fields(previous=loaded_build, build_version=version))
+        try:
+            (client, store, chunks), (skills, schema, bm25) = await asyncio.gather(
+                execution_layer.run("chroma", timed_phase, "reload_store", open_store),
+                execution_layer.run("lexical", timed_phase, "reload_indexes", load_indexes),
+            )
+        except Exception:
+            logger.exception("Не удалось переоткрыть хранилища", extra=fields(build_version=version))
+            return
+        chroma_client, collection, chunk_backend = client, store, chunks
+        skill_index, metadata_schema, bm25_index = skills, schema, bm25
+        agent_handler.replace_stores(collection, chunk_backend)
+        agent_handler.replace_indexes(skill_index, metadata_schema, bm25_index)
+        loaded_build = version
+
+async def handle_query(user_query: str, on_event=None) -> str:
+    """Основная обработка запроса через AgenticRAG; on_event получает промежуточные события конвейера"""
+    # Компоненты загружаются в main() до начала поллинга; ленивой инициализации на пути запроса нет
     if not agent_handler:
-        await init_models()
+        return NOT_READY_MESSAGE
     
     try:
-        print(f"🔍 AgenticRAG обрабатывает запрос: {user_query}")
-        result = await agent_handler.process_query(user_query)
+        await reload_if_rebuilt()
+        logger.info("AgenticRAG обрабатывает запрос", extra=fields(query=user_query))
+        result = ""
+        events = agent_handler.process_query_events(user_query)
+        try:
+            async for event in events:
+                if event["type"] == "final":
+                    result = event["text"]
+                elif on_event is not None:
+                    await on_event(event)
+        finally:
+            # Ошибка в on_event не оставляет незакрытым поток анализа GigaChat
+            await events.aclose()
         return result
         
-    except Exception as e:
-        print(f"❌ Ошибка в AgenticRAG: {e}")
-        return f"Произошла ошибка при обработке запроса. Попробуйте сформулировать иначе."
+    except Exception:
+        logger.exception("Ошибка в AgenticRAG", extra=fields(query=user_query))
+        return "Произошла ошибка при обработке запроса. Попробуйте сформулировать иначе."
 
 # --- Telegram Bot ---
 bot = Bot(token=TELEGRAM_TOKEN)
@@ -161,16 +510,57 @@ async def cmd_help(message: types.Message):
 async def cmd_stats(message: types.Message):
     """Показывает статистику базы данных"""
     try:
-        if not collection:
-            await init_models()
+        if not agent_handler:
+            await message.answer(NOT_READY_MESSAGE)
+            return
         
         count = collection.count()
+        pools_info = "\n".join(
+            f"• {name}: {s['active']}/{s['workers']} активно, в очереди {s['queued']} "
+            f"(макс. {s['max_queue_depth']}), выполнено {s['completed']}"
+            for name, s in execution_layer.stats().items()
+        )
+        cache_stats = query_cache.stats()
+        plan_stats = plan_cache.stats()
+        plan_sources = agent_handler.plan_sources
+        result_stats = result_cache.stats()
+        sched = scheduler.stats()
+        rerank_info = "выключено"
+        if reranker:
+            rerank_stats = reranker.stats()
+            rerank_info = (f"{'кросс-энкодер + признаки' if rerank_stats['cross_encoder'] else 'признаки'}, "
+                           f"{rerank_stats['candidates_in']} → {rerank_stats['candidates_out']} кандидатов, "
+                           f"вне бюджета {rerank_stats['over_budget']}")
+        stages = METRICS.stage_summary()
+        stages_info = "\n".join(
+            f"• {stage}: p50 {s['p50']:.0f} мс, p95 {s['p95']:.0f} мс ({s['count']})"
+            for stage, s in sorted(stages.items())
+        ) or "• замеров пока нет"
         await message.answer(
             f"📊 **Статистика базы резюме:**\n\n"
             f"• Всего резюме: {count}\n"
             f"• Модель эмбеддингов: all-MiniLM-L6-v2\n"
             f"• LLM: GigaChat\n"
             f"• Архитектура: AgenticRAG\n\n"
+            f"⚙️ **Пулы выполнения:**\n{pools_info}\n\n"
+            f"💾 **Кэш эмбеддингов запросов:** {cache_stats['entries']}/{cache_stats['max_entries']} записей, "
+            f"попаданий {cache_stats['hits']}, промахов {cache_stats['misses']}\n"
+            f"🗂 **Кэш планов:** {plan_stats['entries']} записей, точных попаданий {plan_stats['exact_hits']}, "
+            f"по сходству {plan_stats['semantic_hits']}, промахов {plan_stats['misses']}\n"
+            f"🧭 **Источники планов:** правила {plan_sources['rules']}, кэш {plan_sources['cache']}, "
+            f"GigaChat {plan_sources['llm']}\n"
+            f"📦 **Кэш результатов** (сборка {result_stats['build_version'] or 'не указана'}): "
+            f"поиск {result_stats['results']['hits']}/{result_stats['results']['hits'] + result_stats['results']['misses']}, "
+            f"анализ {result_stats['answers']['hits']}/{result_stats['answers']['hits'] + result_stats['answers']['misses']} попаданий\n"
+            f"🚦 **Планировщик:** в работе {sched['pending']}/{sched['max_pending']} (макс. {sched['max_pending_seen']}), "
+            f"GigaChat {sched['llm_in_use']}/{sched['max_llm_calls']}, запущено {sched['started']}, "
+            f"объединено {sched['coalesced']}, отклонено {sched['rejected_busy']} (очередь) "
+            f"и {sched['rejected_user']} (лимит пользователя)\n"
+            f"🎯 **Переранжирование:** {rerank_info}\n\n"
+            f"⏱ **Этапы (последние {METRICS.reservoir} замеров):**\n{stages_info}\n"
+            f"🔁 **GigaChat:** повторов {METRICS.total('llm_retries_total'):.0f}, "
+            f"отказов {METRICS.total('llm_failures_total'):.0f}; "
+            f"вторых раундов поиска {METRICS.total('search_fallback_total'):.0f}\n\n"
             f"База обновлена и готова к поиску!"
         )
     except Exception as e:
@@ -185,19 +575,25 @@ async def handle_search_query(message: types.Message):
         # Отправляем статус обработки
         status_msg = await message.answer("🤖 Анализирую запрос...")
         
-        # Обрабатываем запрос через AgenticRAG
-        answer = await handle_query(user_query)
-        
-        # Обрезаем если слишком длинный
-        if len(answer) > 4000:
-            answer = answer[:4000] + "\n\n... (сообщение обрезано)"
+        # Обрабатываем запрос через AgenticRAG; одинаковые запросы в работе объединяются,
+        # а сверх лимитов планировщика пользователь сразу получает ответ «занято».
+        # Статус обновляется по ходу: план, найденные кандидаты, анализ GigaChat
+        progress = ProgressMessage(status_msg)
+        try:
+            with METRICS.span("request"):
+                answer = await scheduler.run(message.from_user.id, user_query,
+                                             lambda query: handle_query(query, on_event=progress.update))
+        except SchedulerBusy as e:
+            await status_msg.edit_text(str(e))
+            return
         
-        # Удаляем статус и отправляем результат
-        await status_msg.delete()
-        await message.answer(answer, parse_mode="Markdown")
+        # Удаляем статус и отправляем результат; длинный ответ делится на несколько сообщений
+        with METRICS.span("send"):
+            await status_msg.delete()
+            await send_answer(message, answer)
         
     except Exception as e:
-        print(f"❌ Ошибка обработки запроса: {e}")
+        logger.exception("Ошибка обработки запроса", extra=fields(query=user_query))
         await message.answer(
             f"❌ Произошла ошибка при поиске. Попробуйте еще раз или сформулируйте запрос иначе.\n\n"
             f"Ошибка: {str(e)[:200]}"
@@ -229,20 +625,31 @@ async def handle_other_messages(message: types.Message):
 
 async def main():
     """Основная функция запуска бота"""
+    configure_logging()
     # Инициализируем модели перед запуском
     try:
         await init_models()
     except Exception as e:
-        print(f"❌ Ошибка инициализации: {e}")
-        print("⚠️ Проверьте:\n1. Файл .env с токенами\n2. Существование vectorstore\n3. Доступность GigaChat")
+        logger.error("Ошибка инициализации", extra=fields(error=str(e)))
+        logger.error("Проверьте:\n1. Файл .env с токенами\n2. Существование vectorstore\n3. Доступность GigaChat")
         return
     
-    print("🚀 Telegram-бот запущен!")
-    print("🤖 Используется AgenticRAG архитектура")
-    print("📊 База содержит резюме:", collection.count() if collection else "не загружена")
+    metrics_runner = None
+    if METRICS_PORT:
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    
+    logger.info("Telegram-бот запущен (архитектура AgenticRAG)",
+                extra=fields(resumes=collection.count() if collection else None))
     
     # Запускаем поллинг
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        # Сохраняем кэш эмбеддингов запросов между перезапусками
+        if query_cache:
+            query_cache.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
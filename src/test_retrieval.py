@@ -1,15 +1,42 @@
 import os
 import json
-from sentence_transformers import SentenceTransformer
+import time
+import random
+import asyncio
+import argparse
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from encoders import load_encoder
 import chromadb
 from chromadb.config import Settings
 
+from agentic_rag import AgenticRAGHandler
+from executors import ExecutionLayer
+from skill_index import SkillIndex, SKILL_INDEX_PATH, skill_keys
+from metadata_schema import MetadataSchema, METADATA_SCHEMA_PATH, split_skills
+from bm25_index import BM25Index, BM25_INDEX_PATH
+from retrieval_backend import ChromaBackend, NumpyBackend, NUMPY_STORE_PATH, NUMPY_CHUNK_STORE_PATH
+from reranker import Reranker, load_cross_encoder
+from context_builder import ContextBuilder
+from replay_llm import ReplayGigaChat, LLM_REPLAY_PATH
+from rule_planner import CITY_FORMS
+from prepare_documents import TECH_SYNONYMS
+
 # Пути
 CHROMA_PATH = "./vectorstore/chroma_db"
+EVAL_QUERIES_PATH = "./data/eval/queries.jsonl"
+
+# Этапы, по которым считаются перцентили латентности. plan, search и analysis — интервалы между
+# событиями конвейера; encode, filter, ann, lexical, rerank и context — суммарное время вызовов
+# внутри запроса (поиск с уточнением может обращаться к хранилищу несколько раз)
+STAGES = ("plan", "encode", "filter", "ann", "lexical", "rerank", "search", "context", "analysis", "total")
+RECALL_KS = (5, 10, 15)
 
 def test_query():
     print("🔍 Загрузка модели эмбеддингов...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    model = load_encoder('all-MiniLM-L6-v2')
 
     print("📂 Подключение к ChromaDB...")
     client = chromadb.PersistentClient(path=CHROMA_PATH, settings=Settings(allow_reset=False))
@@ -63,5 +90,292 @@ def test_query():
         print(f"📄 Фрагмент: {snippet}")
         print()
 
+
+
+# === Офлайн-оценка качества и латентности конвейера AgenticRAG ===
+
+def make_labeled_queries(n: int = 50, seed: int = 0) -> List[dict]:
+    """Размеченные запросы «<технология> разработчик, город <город>, опыт от N лет» из метаданных.
+
+    Релевантные — все резюме, у которых есть технология, совпадает город и хватает опыта
+    (та же логика, что у фильтров бота). Запрос строится от случайного резюме, поэтому
+    у каждого есть хотя бы один релевантный документ; seed делает набор воспроизводимым.
+    """
+    from build_vector_store import load_documents_and_metadata
+    _, _, metadatas = load_documents_and_metadata()
+    rows = []
+    for meta in metadatas:
+        keys = set()
+        for skill in split_skills(meta["all_skills"]):
+            keys |= skill_keys(skill)
+        rows.append((meta["id"], keys & set(TECH_SYNONYMS), meta["location"], meta["total_experience_months"] or 0))
+
+    rng = random.Random(seed)
+    queries, seen = [], set()
+    candidates = [row for row in rows if row[1] and row[2] in CITY_FORMS]
+    for _ in range(n * 20):
+        if len(queries) >= n or not candidates:
+            break
+        _, techs, city, months = rng.choice(candidates)
+        tech = rng.choice(sorted(techs))
+        years = rng.choice([y for y in (0, 1, 3, 5) if y * 12 <= months])
+        if (tech, city, years) in seen:
+            continue
+        seen.add((tech, city, years))
+        relevant = [doc_id for doc_id, keys, loc, exp in rows if tech in keys and loc == city and exp >= years * 12]
+        query = f"{tech} разработчик, город {city.title()}" + (f", опыт от {years} лет" if years else "")
+        queries.append({"query": query, "relevant_ids": relevant})
+    return queries
+
+
+def load_queries(path: str = EVAL_QUERIES_PATH) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_queries(queries: List[dict], path: str = EVAL_QUERIES_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for query in queries:
+            f.write(json.dumps(query, ensure_ascii=False) + "\n")
+
+
+def recall_at_k(relevant: set, ranked: List[str], k: int) -> float:
+    """Доля релевантных в top-k; знаменатель min(|relevant|, k), чтобы широкие запросы не занижали оценку."""
+    if not relevant:
+        return 0.0
+    return len(relevant & set(ranked[:k])) / min(len(relevant), k)
+
+
+def reciprocal_rank(relevant: set, ranked: List[str]) -> float:
+    for rank, doc_id in enumerate(ranked, 1):
+        if doc_id in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+class StageTimer:
+    """Оборачивает методы объектов конвейера и суммирует их время по этапам текущего запроса."""
+
+    def __init__(self):
+        self.current: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.current[stage] = self.current.get(stage, 0.0) + seconds
+
+    def wrap(self, obj, name: str, stage: str):
+        fn = getattr(obj, name)
+        if asyncio.iscoroutinefunction(fn):
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    self.add(stage, time.perf_counter() - start)
+        else:
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.add(stage, time.perf_counter() - start)
+        setattr(obj, name, timed)
+
+    def reset(self) -> Dict[str, float]:
+        with self._lock:
+            timings, self.current = self.current, {}
+        return timings
+
+
+def build_handler(args, giga_chat) -> AgenticRAGHandler:
+    """Конвейер как в telegram_bot.init_models, но без кэшей: каждый прогон выполняет всю работу."""
+    model = load_encoder('all-MiniLM-L6-v2')
+    chunk_backend = None
+    if args.backend == "numpy":
+        backend = NumpyBackend(NUMPY_STORE_PATH)
+        if args.chunks and os.path.exists(NUMPY_CHUNK_STORE_PATH):
+            chunk_backend = NumpyBackend(NUMPY_CHUNK_STORE_PATH)
+    else:
+        client = chromadb.PersistentClient(path=CHROMA_PATH, settings=Settings(allow_reset=False))
+        backend = ChromaBackend(client.get_collection("resumes"))
+        if args.chunks:
+            chunk_backend = ChromaBackend(client.get_collection("resume_chunks"))
+
+    reranker = None
+    if args.rerank:
+        cross_encoder = load_cross_encoder(args.rerank_model) if args.rerank_model else None
+        reranker = Reranker(top_k=args.rerank_top_k, cross_encoder=cross_encoder)
+    return AgenticRAGHandler(
+        model, backend, giga_chat,
+        executor=ExecutionLayer.from_env(),
+        skill_index=SkillIndex.load(SKILL_INDEX_PATH) if os.path.exists(SKILL_INDEX_PATH) else None,
+        metadata_schema=MetadataSchema.load(METADATA_SCHEMA_PATH) if os.path.exists(METADATA_SCHEMA_PATH) else None,
+        bm25_index=BM25Index.load(BM25_INDEX_PATH) if args.hybrid and os.path.exists(BM25_INDEX_PATH) else None,
+        chunk_backend=chunk_backend,
+        reranker=reranker,
+        context_builder=ContextBuilder(args.context_tokens, count_tokens=model.count_tokens) if args.context_tokens else None,
+    )
+
+
+def instrument(handler: AgenticRAGHandler, timer: StageTimer, rankings: dict):
+    timer.wrap(handler, "_encode", "encode")
+    timer.wrap(handler, "_build_filters", "filter")
+    timer.wrap(handler, "_build_skill_filter", "filter")
+    timer.wrap(handler, "_query_backend", "ann")
+    if handler.skill_index is not None:
+        timer.wrap(handler.skill_index, "candidates", "filter")
+    if handler.bm25_index is not None:
+        timer.wrap(handler.bm25_index, "search", "lexical")
+    if handler.reranker is not None:
+        timer.wrap(handler.reranker, "rerank", "rerank")
+    if handler.context_builder is not None:
+        timer.wrap(handler.context_builder, "build", "context")
+
+    # Выдача поиска до переранжирования — для recall@k самого поиска
+    search = handler._search_cached
+
+    async def recorded_search(*args, **kwargs):
+        resumes = await search(*args, **kwargs)
+        rankings["retrieval"] = [r["id"] for r in resumes]
+        return resumes
+    handler._search_cached = recorded_search
+
+
+async def run_query(handler: AgenticRAGHandler, timer: StageTimer, rankings: dict, query: str):
+    """Один прогон запроса: (времена этапов в секундах, итоговые кандидаты)."""
+    rankings.clear()
+    timer.reset()
+    marks = {"start": time.perf_counter()}
+    async for event in handler.process_query_events(query):
+        if event["type"] != "analysis_delta":
+            marks[event["type"]] = time.perf_counter()
+        if event["type"] == "candidates":
+            rankings["final"] = [r["id"] for r in event["resumes"]]
+    timings = timer.reset()
+    timings["plan"] = marks["plan"] - marks["start"]
+    if "candidates" in marks:
+        # Событие candidates приходит после сборки контекста; она относится к анализу, как и раньше
+        context = timings.get("context", 0.0)
+        timings["search"] = marks["candidates"] - marks["plan"] - context
+        timings["analysis"] = marks["final"] - marks["candidates"] + context
+    timings["total"] = marks["final"] - marks["start"]
+    return timings
+
+
+def summarize(quality: Dict[str, List[float]], latencies: Dict[str, List[float]]) -> dict:
+    report = {"quality": {name: float(np.mean(values)) for name, values in quality.items()}, "latency_ms": {}}
+    for stage in STAGES:
+        values = latencies.get(stage)
+        if values:
+            report["latency_ms"][stage] = {
+                f"p{p}": float(np.percentile(values, p) * 1000) for p in (50, 95, 99)
+            }
+    return report
+
+
+def print_report(report: dict, baseline: Optional[dict] = None):
+    def delta(section: str, key: str, value: float, sub: Optional[str] = None) -> str:
+        if not baseline or key not in baseline.get(section, {}):
+            return ""
+        base = baseline[section][key][sub] if sub else baseline[section][key]
+        return f" ({value - base:+.3f})" if section == "quality" else f" ({value - base:+.1f})"
+
+    print(f"\n📊 Качество ({report['queries']} запросов):")
+    for name, value in report["quality"].items():
+        print(f"  {name:<22} {value:.3f}{delta('quality', name, value)}")
+    print("\n⏱ Латентность по этапам, мс:")
+    print(f"  {'этап':<10} {'p50':>14} {'p95':>14} {'p99':>14}")
+    for stage, values in report["latency_ms"].items():
+        cells = [f"{values[p]:7.1f}{delta('latency_ms', stage, values[p], p):>7}" for p in ("p50", "p95", "p99")]
+        print(f"  {stage:<10} " + " ".join(f"{cell:>14}" for cell in cells))
+
+
+async def evaluate(args):
+    queries = load_queries(args.queries)
+    client = None
+    if args.record:
+        from gigachat import GigaChat
+        client = GigaChat(credentials=os.getenv("GIGACHAT_CREDENTIALS"), verify_ssl_certs=False,
+                          model="GigaChat:latest", scope="GIGACHAT_API_PERS")
+    giga_chat = ReplayGigaChat(args.replay, client=client, latency_ms=args.llm_latency_ms)
+    handler = build_handler(args, giga_chat)
+    timer, rankings = StageTimer(), {}
+    instrument(handler, timer, rankings)
+
+    # Прогрев: первые вызовы энкодера и хранилища не входят в замеры
+    await run_query(handler, timer, rankings, queries[0]["query"])
+
+    quality = {f"{stage} recall@{k}": [] for stage in ("retrieval", "final") for k in RECALL_KS}
+    quality.update({"retrieval MRR": [], "final MRR": []})
+    latencies = {}
+    for repeat in range(args.repeat):
+        for item in queries:
+            timings = await run_query(handler, timer, rankings, item["query"])
+            for stage, seconds in timings.items():
+                latencies.setdefault(stage, []).append(seconds)
+            if repeat:
+                continue  # Результаты детерминированы: качество считаем по первому проходу
+            relevant = set(item["relevant_ids"])
+            for stage in ("retrieval", "final"):
+                ranked = rankings.get(stage, [])
+                for k in RECALL_KS:
+                    quality[f"{stage} recall@{k}"].append(recall_at_k(relevant, ranked, k))
+                quality[f"{stage} MRR"].append(reciprocal_rank(relevant, ranked))
+
+    report = summarize(quality, latencies)
+    report["queries"] = len(queries)
+    report["config"] = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    report["llm"] = giga_chat.stats()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"\n💬 Ответы LLM: {report['llm']['hits']} из записи, {report['llm']['misses']} без записи")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Отчёт сохранён: {args.output}")
+    handler.executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка поиска: пример запроса или офлайн-бенчмарк конвейера")
+    parser.add_argument("--eval", action="store_true", help="Оценить качество и латентность на размеченных запросах")
+    parser.add_argument("--make-queries", type=int, default=0, metavar="N",
+                        help="Сгенерировать N размеченных запросов из метаданных в --queries")
+    parser.add_argument("--queries", default=EVAL_QUERIES_PATH, help="JSONL: {\"query\": ..., \"relevant_ids\": [...]}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--hybrid", action="store_true", help="Гибридный поиск с BM25")
+    parser.add_argument("--chunks", action="store_true", help="Поиск по чанкам резюме")
+    parser.add_argument("--rerank", action="store_true", help="Переранжирование перед анализом")
+    parser.add_argument("--rerank-model", default=None, help="Кросс-энкодер для переранжирования")
+    parser.add_argument("--rerank-top-k", type=int, default=5)
+    parser.add_argument("--context-tokens", type=int, default=0, help="Бюджет токенов контекста (0 — срезы)")
+    parser.add_argument("--replay", default=LLM_REPLAY_PATH, help="Записанные ответы GigaChat")
+    parser.add_argument("--record", action="store_true",
+                        help="Запрашивать отсутствующие ответы у GigaChat и дописывать их в --replay")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Имитация задержки GigaChat")
+    parser.add_argument("--repeat", type=int, default=3, help="Проходов по набору для перцентилей латентности")
+    parser.add_argument("--output", default=None, help="Сохранить отчёт в JSON")
+    parser.add_argument("--baseline", default=None, help="Отчёт JSON для сравнения")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    if args.make_queries:
+        queries = make_labeled_queries(args.make_queries, args.seed)
+        save_queries(queries, args.queries)
+        print(f"🏷 Сохранено {len(queries)} размеченных запросов: {args.queries}")
+    if args.eval:
+        asyncio.run(evaluate(args))
+    elif not args.make_queries:
+        test_query()
+
+
 if __name__ == "__main__":
-    test_query()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули проекта импортируются по имени, как при запуске скриптов из src/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
@@ -0,0 +1,180 @@
+import time
+import asyncio
+
+import numpy as np
+import pytest
+
+from agentic_rag import AgenticRAGHandler
+from executors import ExecutionLayer
+from retrieval_backend import NumpyBackend
+
+DIM = 4
+
+
+class FakeEncoder:
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            return np.ones(DIM, dtype=np.float32)
+        return np.ones((len(texts), DIM), dtype=np.float32)
+
+
+def resume_meta(resume_id, skills):
+    return {"id": resume_id, "all_skills": ", ".join(skills), "desired_position": "Разработчик",
+            "location": "Москва", "total_experience_months": 36, "url": f"https://hh.ru/{resume_id}"}
+
+
+def build_store(path, rows):
+    """rows: (id, навыки); эмбеддинги одинаковые, порядок выдачи решают только фильтры."""
+    ids = [row_id for row_id, _ in rows]
+    metas = [resume_meta(parent_id, skills) for parent_id, skills in rows]
+    NumpyBackend.build(str(path), ids, np.ones((len(rows), DIM), dtype=np.float32),
+                       [f"документ {row_id}" for row_id in ids], metas, hnsw=False,
+                       skills_per_doc=[skills for _, skills in rows])
+    return NumpyBackend(str(path))
+
+
+def chunk_rows(parents):
+    """Чанки с метаданными родителя: id метаданных — id резюме."""
+    return [(parent_id, skills) for parent_id, skills, _ in parents]
+
+
+def build_chunk_store(path, parents, with_skills=True):
+    ids, metas, skills_per_doc = [], [], []
+    for parent_id, skills, n_chunks in parents:
+        for i in range(n_chunks):
+            ids.append(f"{parent_id}_{i}")
+            metas.append(dict(resume_meta(parent_id, skills), chunk_id=f"{parent_id}_{i}"))
+            skills_per_doc.append(skills)
+    NumpyBackend.build(str(path), ids, np.ones((len(ids), DIM), dtype=np.float32),
+                       [f"чанк {chunk_id}" for chunk_id in ids], metas, hnsw=False,
+                       skills_per_doc=skills_per_doc if with_skills else None)
+    return NumpyBackend(str(path))
+
+
+def make_handler(backend, **kwargs):
+    return AgenticRAGHandler(FakeEncoder(), backend, giga_chat=None, executor=ExecutionLayer(),
+                             use_rule_planner=False, **kwargs)
+
+
+# В основном хранилище react встречается чаще python, в хранилище чанков — наоборот,
+# поэтому позиции навыков в битовых матрицах двух хранилищ различаются
+PARENTS = [("r1", ["python"], 3), ("r2", ["react"], 1), ("r3", ["react"], 1)]
+
+
+def test_chunk_search_builds_skill_filter_for_chunk_store(tmp_path):
+    backend = build_store(tmp_path / "main", chunk_rows(PARENTS))
+    chunks = build_chunk_store(tmp_path / "chunks", PARENTS)
+    assert backend.skill_filter(["python"]) != chunks.skill_filter(["python"])
+
+    handler = make_handler(backend, chunk_backend=chunks)
+    resumes = asyncio.run(handler._search_with_refinement(["python"], {}, max_results=2,
+                                                          required_skills=["python"]))
+    assert [r["id"] for r in resumes] == ["r1"]
+
+
+def test_chunk_search_checks_skills_on_parents_without_chunk_skill_bits(tmp_path):
+    backend = build_store(tmp_path / "main", chunk_rows(PARENTS))
+    chunks = build_chunk_store(tmp_path / "chunks", PARENTS, with_skills=False)
+
+    handler = make_handler(backend, chunk_backend=chunks)
+    resumes = asyncio.run(handler._search_with_refinement(["react"], {}, max_results=2,
+                                                          required_skills=["react"]))
+    assert sorted(r["id"] for r in resumes) == ["r2", "r3"]
+
+
+def build_scored_chunk_store(path, similarities):
+    """similarities: (id резюме, [сходство каждого чанка с запросом [1, 0, 0, 0]])."""
+    ids, metas, vectors = [], [], []
+    for parent_id, sims in similarities:
+        for i, sim in enumerate(sims):
+            ids.append(f"{parent_id}_{i}")
+            metas.append(dict(resume_meta(parent_id, []), chunk_id=f"{parent_id}_{i}"))
+            vectors.append([sim, np.sqrt(1 - sim ** 2), 0, 0])
+    NumpyBackend.build(str(path), ids, np.array(vectors, dtype=np.float32), ids, metas, hnsw=False)
+    return NumpyBackend(str(path))
+
+
+def test_chunk_scores_aggregate_per_resume_by_max_or_sum(tmp_path):
+    backend = build_store(tmp_path / "main", [("r1", []), ("r2", [])])
+    chunks = build_scored_chunk_store(tmp_path / "chunks", [("r1", [0.6, 0.6, 0.6]), ("r2", [0.9])])
+    query = np.array([[1, 0, 0, 0]], dtype=np.float32)
+    results = {}
+    for aggregation in ("max", "sum"):
+        handler = make_handler(backend, chunk_backend=chunks, chunk_aggregation=aggregation)
+        results[aggregation] = asyncio.run(handler._query_chunks(query, n_results=2))
+
+    assert results["max"]["ids"] == [["r2", "r1"]]
+    np.testing.assert_allclose(results["max"]["distances"][0], [0.1, 0.4], atol=1e-5)
+    assert results["sum"]["ids"] == [["r1", "r2"]]
+    np.testing.assert_allclose(results["sum"]["distances"][0], [1 - 1.8, 0.1], atol=1e-5)
+    # Один документ резюме на родителя, а не тексты чанков
+    assert results["sum"]["documents"] == [["документ r1", "документ r2"]]
+
+
+def test_unknown_chunk_aggregation_is_rejected(tmp_path):
+    backend = build_store(tmp_path / "main", [("r1", [])])
+    with pytest.raises(ValueError):
+        make_handler(backend, chunk_aggregation="mean")
+
+def test_hybrid_search_checks_skills_without_skill_filter(tmp_path):
+    from bm25_index import BM25Index
+
+    rows = [("r1", ["python"]), ("r2", ["react"]), ("r3", ["java"])]
+    ids = [row_id for row_id, _ in rows]
+    documents = ["Python разработчик", "React разработчик, изучаю python", "Java разработчик"]
+    # Хранилище без битовой матрицы навыков, без индекса навыков и схемы: where навыки не ограничивает
+    NumpyBackend.build(str(tmp_path / "store"), ids, np.ones((len(rows), DIM), dtype=np.float32), documents,
+                       [resume_meta(row_id, skills) for row_id, skills in rows], hnsw=False)
+    handler = make_handler(NumpyBackend(str(tmp_path / "store")), bm25_index=BM25Index.build(ids, documents))
+
+    resumes = asyncio.run(handler._search_with_refinement(["python разработчик"], {}, max_results=5,
+                                                          required_skills=["python"]))
+    assert [r["id"] for r in resumes] == ["r1"]
+
+
+class StreamingChat:
+    """Клиент GigaChat с потоковым ответом из нескольких фрагментов."""
+
+    def __init__(self, parts, delay=0.0):
+        self.parts = parts
+        self.delay = delay
+        self.read = 0
+
+    def stream(self, prompt):
+        for part in self.parts:
+            self.read += 1
+            time.sleep(self.delay)
+            delta = type("Delta", (), {"content": part})()
+            yield type("Chunk", (), {"choices": [type("Choice", (), {"delta": delta})()]})()
+
+
+def test_stream_does_not_hold_llm_slot_while_consumer_is_busy():
+    async def run():
+        semaphore = asyncio.Semaphore(1)
+        handler = AgenticRAGHandler(FakeEncoder(), None, giga_chat=StreamingChat(["a", "b", "c"]),
+                                    executor=ExecutionLayer(), llm_semaphore=semaphore)
+        stream = handler._stream_llm_with_retry("запрос")
+        assert await stream.__anext__() == "a"
+        # Получатель занят первым фрагментом, а генерация уже завершилась и вернула слот
+        await asyncio.wait_for(semaphore.acquire(), timeout=1)
+        semaphore.release()
+        assert [delta async for delta in stream] == ["b", "c"]
+
+    asyncio.run(run())
+
+
+def test_closed_stream_stops_reading_and_releases_slot():
+    async def run():
+        semaphore = asyncio.Semaphore(1)
+        chat = StreamingChat(["a"] * 1000, delay=0.005)
+        handler = AgenticRAGHandler(FakeEncoder(), None, giga_chat=chat,
+                                    executor=ExecutionLayer(), llm_semaphore=semaphore)
+        stream = handler._stream_llm_with_retry("запрос")
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.wait_for(semaphore.acquire(), timeout=1)
+        read = chat.read
+        await asyncio.sleep(0.05)
+        assert chat.read == read < 1000
+
+    asyncio.run(run())
@@ -0,0 +1,36 @@
+from bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+IDS = ["r1", "r2", "r3"]
+DOCS = [
+    "Frontend разработчик: Vue, Nuxt.js, TypeScript",
+    "Backend разработчиков команда: Python, Django, PostgreSQL. Python",
+    "Аналитик данных, SQL, Power BI",
+]
+
+
+def test_tokenize_stems_russian_and_splits_dotted_names():
+    assert tokenize("Разработчиков nuxt.js C++ Ёлками") == ["разработчик", "nuxt.js", "nuxt", "c++", "елк"]
+
+
+def test_search_ranks_by_bm25_and_skips_unmatched():
+    index = BM25Index.build(IDS, DOCS)
+    results = index.search("python разработчик")
+    assert [doc_id for doc_id, _ in results] == ["r2", "r1"]
+    assert results[0][1] > results[1][1] > 0
+    assert index.search("kotlin") == []
+    assert [doc_id for doc_id, _ in index.search("nuxt")] == ["r1"]
+
+
+def test_search_top_k_and_persistence(tmp_path):
+    index = BM25Index.build(IDS, DOCS)
+    path = str(tmp_path / "bm25.npz")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.search("разработчик python", top_k=1) == index.search("разработчик python", top_k=1)
+    assert len(loaded.search("разработчик", top_k=1)) == 1
+
+
+def test_reciprocal_rank_fusion_sums_reciprocal_ranks():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    assert fused == ["a", "c", "b"]
+    assert reciprocal_rank_fusion([["a", "b"], ["b"]], limit=1) == ["b"]
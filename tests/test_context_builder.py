@@ -0,0 +1,26 @@
+from context_builder import ContextBuilder, strip_redundant
+
+
+def resume(i, text="Разработка сервисов"):
+    return {"id": f"r{i}", "position": f"Разработчик {i}", "location": "Москва", "experience_months": 36,
+            "skills": "Python, Docker", "text": text}
+
+
+def test_strip_redundant_keeps_experience_descriptions():
+    text = ("Опыт работы: 5 годов 3 месяца\nОпыт работы: 7 месяцев\n"
+            "Опыт работы: 5 лет в банке\nЛокация: Москва\nОбразование: МГУ")
+    assert strip_redundant(text) == "Опыт работы: 5 лет в банке\nОбразование: МГУ"
+
+
+def test_headers_over_budget_drop_lowest_ranked_candidates():
+    header_tokens = ContextBuilder().count_tokens("Резюме #1:\nДолжность: Разработчик 1\nГород: Москва\nОпыт: 3 лет")
+    builder = ContextBuilder(max_tokens=2 * header_tokens + 3, dedupe_threshold=1.1)
+    context, kept = builder.build([resume(i, f"текст {i}") for i in range(1, 6)])
+    assert [r["id"] for r in kept] == ["r1", "r2"]
+    assert "Резюме #3" not in context
+
+
+def test_single_candidate_is_kept_even_if_header_exceeds_budget():
+    context, kept = ContextBuilder(max_tokens=5).build([resume(1), resume(2, "другое")])
+    assert [r["id"] for r in kept] == ["r1"]
+    assert context.startswith("Резюме #1:")
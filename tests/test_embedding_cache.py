@@ -0,0 +1,86 @@
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+DIM = 3
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return np.array([[float(len(text)), 1.0, 0.0] for text in texts], dtype=np.float32)
+
+
+def test_reused_row_missing_from_saved_index_is_a_miss(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", DIM, max_entries=2, flush_every=100)
+    cache.put_many(["a", "bb"], np.array([[1, 0, 0], [2, 0, 0]], dtype=np.float32))
+    cache.flush()
+    # «ccc» вытесняет «a» и занимает её строку, но индекс на диск уже не попадает (сбой)
+    cache.put_many(["ccc"], np.array([[3, 0, 0]], dtype=np.float32))
+    cache._vectors.flush()
+    cache._keys.flush()
+    cache._lock_file.close()
+
+    reopened = EmbeddingCache(str(tmp_path), "model", DIM, max_entries=2, flush_every=100)
+    assert reopened.get("a") is None
+    np.testing.assert_array_equal(reopened.get("bb"), [2, 0, 0])
+
+    # Освободившаяся строка переиспользуется, запись «bb» не затирается
+    encoder = CountingEncoder()
+    reopened.encode(encoder, ["dddd"])
+    np.testing.assert_array_equal(reopened.get("bb"), [2, 0, 0])
+    np.testing.assert_array_equal(reopened.get("dddd"), [4, 1, 0])
+
+
+def test_second_process_opens_cache_read_only(tmp_path):
+    writer = EmbeddingCache(str(tmp_path), "model", DIM)
+    writer.put_many(["a"], np.array([[1, 0, 0]], dtype=np.float32))
+
+    reader = EmbeddingCache(str(tmp_path), "model", DIM)
+    assert reader.read_only
+    np.testing.assert_array_equal(reader.get("a"), [1, 0, 0])
+    vector = reader.encode(CountingEncoder(), "bb")
+    np.testing.assert_array_equal(vector, [2, 1, 0])
+    assert writer.get("bb") is None and reader.get("bb") is None
+
+    writer.close()
+    assert not EmbeddingCache(str(tmp_path), "model", DIM).read_only
+
+
+def test_encode_reuses_cached_vectors_and_normalizes_text(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", DIM)
+    encoder = CountingEncoder()
+    first = cache.encode(encoder, ["a", "bb", "a"])
+    assert encoder.encoded == ["a", "bb"]
+
+    second = cache.encode(encoder, ["bb ", "  a", "ccc"])
+    assert encoder.encoded == ["a", "bb", "ccc"]
+    np.testing.assert_array_equal(second[:2], first[[1, 0]])
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 4
+
+
+def test_cache_survives_reopen_and_ignores_other_model(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", DIM, flush_every=100)
+    cache.encode(CountingEncoder(), [f"t{i}" * (i + 1) for i in range(1500)])
+    cache.close()
+
+    reopened = EmbeddingCache(str(tmp_path), "model", DIM)
+    assert len(reopened) == 1500
+    np.testing.assert_array_equal(reopened.get("t1499" * 1500), [5 * 1500, 1, 0])
+    reopened.close()
+
+    assert len(EmbeddingCache(str(tmp_path), "other-model", DIM)) == 0
+
+
+def test_max_entries_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", DIM, max_entries=2)
+    encoder = CountingEncoder()
+    cache.encode(encoder, ["a", "bb"])
+    cache.get("a")
+    cache.encode(encoder, ["ccc"])
+    assert cache.get("bb") is None
+    np.testing.assert_array_equal(cache.get("a"), [1, 1, 0])
+    assert len(cache) == 2
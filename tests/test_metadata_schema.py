@@ -0,0 +1,30 @@
+from metadata_schema import MetadataSchema
+
+
+def metas(skills_by_city):
+    return [{"location": city, "all_skills": skills} for city, skills in skills_by_city]
+
+
+def test_rebuild_keeps_codes_when_frequency_order_changes(tmp_path):
+    first = MetadataSchema.build(metas([
+        ("москва", "Python, Docker"), ("москва", "Python"), ("казань", "Docker"),
+    ]), top_n=10)
+    path = str(tmp_path / "schema.json")
+    first.save(path)
+
+    # Казань и Docker стали популярнее, появились новый город и навык
+    second = MetadataSchema.build(metas([
+        ("казань", "Docker, Go"), ("казань", "Docker"), ("казань", "Python"), ("москва", "Docker"),
+        ("пермь", "Go"),
+    ]), top_n=10, previous=MetadataSchema.load(path))
+
+    assert {city: second.city_codes[city] for city in first.city_codes} == first.city_codes
+    assert {skill: second.skill_fields[skill] for skill in first.skill_fields} == first.skill_fields
+    assert second.city_codes["пермь"] == max(first.city_codes.values()) + 1
+    assert "go" in second.skill_fields
+    assert second.skill_fields["go"] not in first.skill_fields.values()
+
+
+def test_build_without_previous_orders_by_frequency():
+    schema = MetadataSchema.build(metas([("казань", ""), ("москва", ""), ("москва", "")]))
+    assert schema.city_codes == {"москва": 1, "казань": 2}
@@ -0,0 +1,50 @@
+import numpy as np
+
+import ttl_cache
+from plan_cache import PlanCache
+
+PLAN = {"search_queries": ["python разработчик"], "filters": {"city": "москва"}}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_exact_hit_normalizes_query_and_returns_copy():
+    cache = PlanCache()
+    cache.put("Python  разработчик в Москве!", PLAN)
+    plan = cache.get("python разработчик в москве")
+    assert plan == PLAN
+    plan["filters"]["city"] = "казань"
+    assert cache.get("Python разработчик в Москве")["filters"]["city"] == "москва"
+    assert cache.stats()["exact_hits"] == 2
+
+
+def test_plans_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ttl_cache.time, "monotonic", clock)
+    cache = PlanCache(ttl_seconds=60, similarity_threshold=0.9)
+    cache.put("python", PLAN, np.array([1.0, 0.0]))
+    clock.now += 59
+    assert cache.get("python") == PLAN
+    clock.now += 2
+    assert cache.get("python", np.array([1.0, 0.0])) is None
+    assert cache.stats() == {"entries": 0, "exact_hits": 1, "semantic_hits": 0, "misses": 1}
+
+
+def test_similar_query_hits_above_threshold_only():
+    cache = PlanCache(similarity_threshold=0.9)
+    cache.put("python разработчик", PLAN, np.array([3.0, 0.0, 0.0]))
+    assert cache.get("разработчик на python", np.array([1.0, 0.2, 0.0])) == PLAN
+    assert cache.get("java разработчик", np.array([1.0, 1.0, 0.0])) is None
+    assert cache.stats()["semantic_hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_without_threshold_embeddings_are_ignored():
+    cache = PlanCache()
+    cache.put("python разработчик", PLAN, np.array([1.0, 0.0]))
+    assert cache.get("разработчик на python", np.array([1.0, 0.0])) is None
@@ -0,0 +1,28 @@
+import pytest
+
+from bench_tech_keywords import extract_tech_keywords_legacy
+from prepare_documents import extract_tech_keywords
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("HTML5, CSS3", {"Html", "Css"}),
+    ("Python3, Django", {"Python", "Django"}),
+    ("Vue3 + Nuxt", {"Vue"}),
+    ("Angular2+, TypeScript", {"Angular", "Typescript"}),
+    ("Разработка на c++ и C#", {"C++", "C#"}),
+    ("C++17, Docker", {"C++", "Docker"}),
+])
+def test_versioned_and_symbol_names_found_like_legacy(text, expected):
+    # Прежний поиск подстрок находит всё то же, но добавляет ложные 'ml' в 'html', 'go' в 'django'
+    assert expected <= set(extract_tech_keywords_legacy(text))
+    assert set(extract_tech_keywords(text)) == expected
+
+
+@pytest.mark.parametrize("text, legacy_only", [
+    ("Интеграция с Google Analytics", {"Go"}),
+    ("Опыт с JavaScript", {"Java"}),
+])
+def test_whole_word_matching_drops_legacy_false_positives(text, legacy_only):
+    legacy, compiled = set(extract_tech_keywords_legacy(text)), set(extract_tech_keywords(text))
+    assert legacy - compiled == legacy_only
+    assert compiled <= legacy
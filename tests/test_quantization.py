@@ -0,0 +1,20 @@
+import numpy as np
+
+from quantization import recall_report
+from retrieval_backend import NumpyBackend
+
+
+def test_recall_report_uses_query_embeddings_and_counts_rescore_copy(tmp_path):
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(300, 16)).astype(np.float32)
+    ids = [f"r{i}" for i in range(len(embeddings))]
+    path = str(tmp_path / "store")
+    NumpyBackend.build(path, ids, embeddings, ids, [{"id": i} for i in ids], dtype="int8",
+                       rescore_dtype="float16", hnsw=False)
+    backend = NumpyBackend(path)
+    assert backend.vector_nbytes() > backend.embeddings.nbytes + embeddings.shape[0] * 16 * 2
+
+    queries = rng.normal(size=(20, 16)).astype(np.float32)
+    report = recall_report(embeddings, ids, backend, queries, ks=(1, 10))
+    assert set(report) == {1, 10}
+    assert report[10] > 0.9
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from request_scheduler import BUSY_MESSAGE, USER_BUSY_MESSAGE, RequestScheduler, SchedulerBusy
+
+
+class SlowHandler:
+    def __init__(self):
+        self.calls = []
+        self.release = None
+
+    async def __call__(self, query):
+        self.calls.append(query)
+        await self.release.wait()
+        return f"ответ: {query}"
+
+
+def run(coro_fn):
+    async def wrapper():
+        handler = SlowHandler()
+        handler.release = asyncio.Event()
+        return await coro_fn(handler)
+    return asyncio.run(wrapper())
+
+
+def test_same_query_is_computed_once_for_all_users():
+    async def scenario(handler):
+        scheduler = RequestScheduler()
+        tasks = [asyncio.ensure_future(scheduler.run(user, query, handler))
+                 for user, query in [(1, "Python в Москве"), (2, "python в москве!"), (3, "Java")]]
+        await asyncio.sleep(0)
+        handler.release.set()
+        answers = await asyncio.gather(*tasks)
+        return handler.calls, answers, scheduler.stats()
+
+    calls, answers, stats = run(scenario)
+    assert calls == ["Python в Москве", "Java"]
+    assert answers[0] == answers[1] == "ответ: Python в Москве"
+    assert stats["started"] == 2 and stats["coalesced"] == 1 and stats["pending"] == 0 and stats["users"] == 0
+
+
+def test_per_user_and_pending_limits_reject_immediately():
+    async def scenario(handler):
+        scheduler = RequestScheduler(max_pending=2, max_per_user=1)
+        first = asyncio.ensure_future(scheduler.run(1, "python", handler))
+        second = asyncio.ensure_future(scheduler.run(2, "java", handler))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerBusy, match=USER_BUSY_MESSAGE):
+            await scheduler.run(1, "go", handler)
+        with pytest.raises(SchedulerBusy, match=BUSY_MESSAGE):
+            await scheduler.run(3, "go", handler)
+        # Присоединение к идущему вычислению не занимает новый слот очереди
+        third = asyncio.ensure_future(scheduler.run(3, "java", handler))
+        handler.release.set()
+        await asyncio.gather(first, second, third)
+        return handler.calls, scheduler.stats()
+
+    calls, stats = run(scenario)
+    assert calls == ["python", "java"]
+    assert stats["rejected_user"] == 1 and stats["rejected_busy"] == 1 and stats["coalesced"] == 1
+
+
+def test_cancelled_waiter_does_not_cancel_shared_computation():
+    async def scenario(handler):
+        scheduler = RequestScheduler()
+        first = asyncio.ensure_future(scheduler.run(1, "python", handler))
+        second = asyncio.ensure_future(scheduler.run(2, "python", handler))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        handler.release.set()
+        return await second, first.cancelled(), scheduler.stats()
+
+    answer, cancelled, stats = run(scenario)
+    assert answer == "ответ: python" and cancelled
+    assert stats["users"] == 0
@@ -0,0 +1,66 @@
+import time
+
+from reranker import Reranker
+
+
+class SlowCrossEncoder:
+    """Кросс-энкодер, который дольше бюджета и уверенно предпочитает последнего кандидата."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+
+    def predict(self, pairs, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        return [10.0 if i == len(pairs) - 1 else -10.0 for i in range(len(pairs))]
+
+
+def resume(resume_id, skills):
+    return {"id": resume_id, "position": "Python разработчик", "location": "Москва",
+            "experience_months": 48, "skills": skills, "text": "опыт разработки"}
+
+
+PLAN = {"search_queries": ["python разработчик"], "filters": {"location": "Москва"}}
+RESUMES = [resume("r1", "python, django"), resume("r2", "python"), resume("r3", "java")]
+
+
+def test_slow_cross_encoder_falls_back_to_feature_scores():
+    cross_encoder = SlowCrossEncoder(delay=0.05)
+    reranker = Reranker(top_k=3, min_results=3, cross_encoder=cross_encoder, budget_ms=10)
+    features_only = Reranker(top_k=3, min_results=3)
+
+    ranked = reranker.rerank("python разработчик", PLAN, RESUMES, required_skills=["python"])
+    expected = features_only.rerank("python разработчик", PLAN, RESUMES, required_skills=["python"])
+
+    assert cross_encoder.calls == 1
+    assert reranker.stats()["over_budget"] == 1
+    assert [(r["id"], r["score"]) for r in ranked] == [(r["id"], r["score"]) for r in expected]
+
+
+def test_cross_encoder_within_budget_is_used():
+    reranker = Reranker(top_k=3, min_results=3, cross_encoder=SlowCrossEncoder(delay=0), budget_ms=1000)
+    ranked = reranker.rerank("python разработчик", PLAN, RESUMES, required_skills=["python"])
+    assert reranker.stats()["over_budget"] == 0
+    assert ranked[0]["id"] == "r3"
+
+
+def test_feature_scores_prefer_required_skills_city_and_experience():
+    resumes = [
+        dict(resume("r1", "java"), location="Казань", experience_months=6),
+        dict(resume("r2", "python, react.js"), location="Москва", experience_months=48),
+        dict(resume("r3", "python"), location="Москва", experience_months=12),
+    ]
+    plan = {"search_queries": ["python react"], "filters": {"location": "Москва", "min_experience_years": 3}}
+    ranked = Reranker(top_k=3, min_score=0, min_results=1).rerank("python react", plan, resumes,
+                                                                     required_skills=["python", "react"])
+    assert [r["id"] for r in ranked] == ["r2", "r3", "r1"]
+    assert ranked[0]["score"] > ranked[1]["score"] > ranked[2]["score"]
+
+
+def test_min_score_cuts_weak_candidates_but_keeps_min_results():
+    reranker = Reranker(top_k=3, min_score=0.99, min_results=2)
+    ranked = reranker.rerank("python разработчик", PLAN, RESUMES, required_skills=["python"])
+    assert len(ranked) == 2
+    assert reranker.stats()["candidates_in"] == 3 and reranker.stats()["candidates_out"] == 2
+    assert Reranker().rerank("python", PLAN, []) == []
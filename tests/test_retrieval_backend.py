@@ -0,0 +1,108 @@
+import os
+
+import numpy as np
+
+from retrieval_backend import NumpyBackend
+
+DIM = 4
+
+
+def build(path, ids):
+    metas = [{"id": doc_id, "location": "москва"} for doc_id in ids]
+    NumpyBackend.build(str(path), ids, np.eye(len(ids), DIM, dtype=np.float32),
+                       [f"документ {doc_id}" for doc_id in ids], metas, hnsw=False)
+
+
+def test_rebuild_switches_link_without_touching_open_version(tmp_path):
+    path = tmp_path / "store"
+    build(path, ["a", "b"])
+    live = NumpyBackend(str(path))
+
+    build(path, ["c", "d", "e"])
+    assert os.path.islink(path)
+    # Открытая версия читается целиком из своего каталога, новая — по ссылке
+    assert live.get(ids=["a", "b"])["ids"] == ["a", "b"]
+    assert live._column("location") is not None
+    assert NumpyBackend(str(path)).count() == 3
+
+    build(path, ["f"])
+    versions = [name for name in os.listdir(tmp_path) if name.startswith("store.v")]
+    # Текущая и предыдущая версии; версия, открытая до двух пересборок, удалена
+    assert len(versions) == 2
+    assert not os.path.exists(live.path)
+
+
+def test_legacy_directory_store_is_replaced_by_link(tmp_path):
+    path = tmp_path / "store"
+    path.mkdir()
+    (path / "schema.json").write_text("{}")
+
+    build(path, ["a"])
+    assert os.path.islink(path)
+    assert NumpyBackend(str(path)).count() == 1
+    assert os.path.isdir(tmp_path / "store.legacy")
+
+
+FILTER_METAS = [
+    {"id": "r0", "location": "москва", "total_experience_months": 12, "remote": True},
+    {"id": "r1", "location": "казань", "total_experience_months": 48, "remote": False},
+    {"id": "r2", "location": "москва", "total_experience_months": 60},
+    {"id": "r3", "total_experience_months": 0, "remote": True},
+]
+FILTER_SKILLS = [["Python"], ["React.js", "Python"], ["Vue"], []]
+
+
+def build_filter_store(path, **kwargs):
+    ids = [meta["id"] for meta in FILTER_METAS]
+    embeddings = np.random.default_rng(1).normal(size=(len(ids), DIM)).astype(np.float32)
+    NumpyBackend.build(str(path), ids, embeddings, [f"документ {i}" for i in ids], FILTER_METAS,
+                       hnsw=False, skills_per_doc=FILTER_SKILLS, **kwargs)
+    return NumpyBackend(str(path)), embeddings
+
+
+def test_column_filters_match_per_row_where_semantics(tmp_path):
+    from retrieval_backend import _match
+    store, _ = build_filter_store(tmp_path / "store")
+    for where in [
+        {"location": "москва"},
+        {"location": {"$in": ["казань", "пермь"]}},
+        {"location": {"$ne": "москва"}},
+        {"total_experience_months": {"$gte": 48}},
+        {"$and": [{"location": "москва"}, {"total_experience_months": {"$lt": 50}}]},
+        {"$or": [{"remote": True}, {"total_experience_months": {"$gt": 50}}]},
+    ]:
+        expected = [meta["id"] for meta in FILTER_METAS if _match(meta, where)]
+        assert store.get(where=where)["ids"] == expected, where
+
+
+def test_skill_filter_uses_bit_matrix_and_gives_up_on_unknown_skill(tmp_path):
+    store, _ = build_filter_store(tmp_path / "store")
+    assert store.get(where=store.skill_filter(["react"]))["ids"] == ["r1"]
+    assert store.get(where=store.skill_filter(["python", "vue"]))["ids"] == ["r0", "r1", "r2"]
+    assert store.skill_filter(["kotlin"]) is None
+
+
+def test_query_applies_where_and_returns_cosine_distances(tmp_path):
+    store, embeddings = build_filter_store(tmp_path / "store")
+    result = store.query(embeddings[1], n_results=3, where={"location": "москва"})
+    assert sorted(result["ids"][0]) == ["r0", "r2"]
+    assert result["metadatas"][0][0]["location"] == "москва"
+    exact = store.query(embeddings[1], n_results=1)
+    assert exact["ids"][0] == ["r1"] and abs(exact["distances"][0][0]) < 1e-6
+
+
+def test_quantized_store_with_rescore_keeps_float32_order(tmp_path):
+    rng = np.random.default_rng(2)
+    embeddings = rng.normal(size=(200, 8)).astype(np.float32)
+    ids = [f"r{i}" for i in range(200)]
+    metas = [{"id": i} for i in ids]
+    queries = rng.normal(size=(5, 8)).astype(np.float32)
+    stores = {}
+    for name, kwargs in [("float32", {}), ("int8", {"dtype": "int8", "rescore_dtype": "float32"})]:
+        NumpyBackend.build(str(tmp_path / name), ids, embeddings, ids, metas, hnsw=False, **kwargs)
+        stores[name] = NumpyBackend(str(tmp_path / name))
+    assert stores["int8"].embeddings.dtype == np.int8
+    exact = stores["float32"].query(queries, n_results=10, include=["distances"])
+    quantized = stores["int8"].query(queries, n_results=10, include=["distances"])
+    assert quantized["ids"] == exact["ids"]
+    np.testing.assert_allclose(quantized["distances"], exact["distances"], atol=1e-5)
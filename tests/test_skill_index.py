@@ -0,0 +1,26 @@
+from skill_index import SkillIndex, skill_keys
+
+IDS = ["r1", "r2", "r3"]
+SKILLS = [["React.js", "Redux"], ["Python", "Django"], ["ReactJS", "  Python "]]
+
+
+def test_skill_keys_include_canonical_technology():
+    assert skill_keys("React.js") == {"react.js", "react"}
+    assert skill_keys("  ") == set()
+
+
+def test_candidates_match_synonyms_and_any_of_skills():
+    index = SkillIndex.build(IDS, SKILLS)
+    assert index.candidates(["react"]) == {"r1", "r3"}
+    assert index.candidates(["python", "redux"]) == {"r1", "r2", "r3"}
+    assert index.candidates(["kotlin"]) == set()
+    assert index.candidates([]) is None
+
+
+def test_save_and_load_keep_postings(tmp_path):
+    path = str(tmp_path / "skills.npz")
+    SkillIndex.build(IDS, SKILLS).save(path)
+    index = SkillIndex.load(path)
+    assert len(index) == 3
+    assert index.candidates(["django"]) == {"r2"}
+    assert index.rows_for_skill("python").tolist() == [1, 2]